@@ -0,0 +1,141 @@
+"""
+Compact, array backed storage of all the moves of an evening.
+
+Instead of one Python object per move, every move is a row in a set of typed `array` columns: an interned player id,
+an action type id, the amount, the street, the round number and the time stamp in epoch milliseconds. `Round` and
+`Action` in log_processor.py are thin views over the rows of an `ActionTable`. `ActionTable.columns` returns
+copies of the columns as NumPy arrays, for vectorised aggregations.
+"""
+import datetime
+from array import array
+from typing import Dict, List
+
+from stats_engine import STREETS
+
+ACTION_NAMES = (
+    "small_blind",
+    "big_blind",
+    "missing_small_blind",
+    "missing_big_blind",
+    "straddle",
+    "fold",
+    "check",
+    "call",
+    "call (all in)",
+    "raise",
+    "raise (all in)",
+    "uncalled_bet",
+    "show",
+)
+ACTION_IDS: Dict[str, int] = {name: action_id for action_id, name in enumerate(ACTION_NAMES)}
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_MILLIS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+# Epoch milliseconds of the minutes seen so far, keyed by "2022-07-21T21:46". Consecutive lines of a log are
+# mostly in the same minute, so only the seconds and milliseconds are parsed for most of them.
+_minutes: Dict[str, int] = {}
+_MAX_MINUTES = 100_000
+
+
+def epoch_millis(time_stamp: str) -> int:
+    """
+    Converts a log time stamp like "2022-07-21T21:46:33.157Z" to milliseconds since the epoch (UTC).
+    """
+    if len(time_stamp) == 24 and time_stamp[10] == "T" and time_stamp[23] == "Z":
+        minute = _minutes.get(time_stamp[:16])
+        if minute is None:
+            if len(_minutes) >= _MAX_MINUTES:
+                _minutes.clear()
+            days = datetime.date(int(time_stamp[0:4]), int(time_stamp[5:7]), int(time_stamp[8:10])).toordinal()
+            minute = _minutes[time_stamp[:16]] = ((days - _EPOCH_ORDINAL) * _MILLIS_PER_DAY
+                                                   + int(time_stamp[11:13]) * 3600000
+                                                   + int(time_stamp[14:16]) * 60000)
+        return minute + int(time_stamp[17:19]) * 1000 + int(time_stamp[20:23])
+    # Any other ISO 8601 format
+    parsed = datetime.datetime.fromisoformat(time_stamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+class ActionTable:
+    _COLUMNS = ("player_ids", "action_ids", "amounts", "streets", "round_numbers", "time_stamps")
+
+    def __init__(self):
+        # Interned player names, indexed by player id
+        self.player_names: List[str] = []
+        self._player_ids: Dict[str, int] = {}
+
+        self.player_ids = array('i')
+        self.action_ids = array('b')
+        self.amounts = array('q')
+        # Index into stats_engine.STREETS
+        self.streets = array('b')
+        self.round_numbers = array('i')
+        self.time_stamps = array('q')
+
+    def __len__(self):
+        return len(self.action_ids)
+
+    def player_id(self, name: str) -> int:
+        player_id = self._player_ids.get(name)
+        if player_id is None:
+            player_id = len(self.player_names)
+            self._player_ids[name] = player_id
+            self.player_names.append(name)
+        return player_id
+
+    def append(self, round_number: int, street: int, player: str, action_name: str, amount: int,
+               time_stamp: str) -> int:
+        """
+        Adds a move and returns its row.
+        """
+        self.player_ids.append(self.player_id(player))
+        self.action_ids.append(ACTION_IDS[action_name])
+        self.amounts.append(amount)
+        self.streets.append(street)
+        self.round_numbers.append(round_number)
+        self.time_stamps.append(epoch_millis(time_stamp))
+        return len(self.action_ids) - 1
+
+    def player(self, row: int) -> str:
+        return self.player_names[self.player_ids[row]]
+
+    def action_name(self, row: int) -> str:
+        return ACTION_NAMES[self.action_ids[row]]
+
+    def street(self, row: int) -> str:
+        return STREETS[self.streets[row]]
+
+    def columns(self) -> Dict[str, "numpy.ndarray"]:
+        """
+        Copies of the columns of the table as NumPy arrays. A view of the buffers would stop the table from growing
+        while any of the arrays is alive, appending would raise a `BufferError`.
+        """
+        import numpy as np
+
+        return {
+            "player_ids": np.frombuffer(self.player_ids, dtype=np.int32).copy(),
+            "action_ids": np.frombuffer(self.action_ids, dtype=np.int8).copy(),
+            "amounts": np.frombuffer(self.amounts, dtype=np.int64).copy(),
+            "streets": np.frombuffer(self.streets, dtype=np.int8).copy(),
+            "round_numbers": np.frombuffer(self.round_numbers, dtype=np.int32).copy(),
+            "time_stamps": np.frombuffer(self.time_stamps, dtype=np.int64).copy(),
+        }
+
+    def to_bytes(self) -> Dict[str, bytes]:
+        """
+        The raw, native byte order contents of each column, see `from_bytes`.
+        """
+        return {name: getattr(self, name).tobytes() for name in self._COLUMNS}
+
+    @classmethod
+    def from_bytes(cls, player_names: List[str], columns: Dict[str, bytes]) -> "ActionTable":
+        table = cls()
+        for name in player_names:
+            table.player_id(name)
+        for name in cls._COLUMNS:
+            getattr(table, name).frombytes(columns[name])
+        return table
@@ -0,0 +1,343 @@
+"""
+Player stats over an archive of any number of sessions.
+
+Computes the stats of WinStats, PlayStats and PreFlopStats (VPIP, PFR, 3-bet, limps, wins at and before showdown and
+their medians) for every player over many logs. Each evening is reduced on its own to a `SessionTotals` of per-player
+counts and win amounts, with grouped NumPy reductions over the columns of its action table instead of a pass over
+Round objects. Totals of sessions are then added up per player, with players identified across sessions through a
+`series_stats.NameMapping`. Only the counts and the win amounts are kept, so memory grows with the number of players
+and wins, not with the moves of the hands.
+
+    python3 archive_stats.py logs/*.csv --jobs 4
+"""
+import argparse
+import functools
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from action_table import ACTION_IDS
+from player_stats import FORCED_BETS
+from stats_engine import STREETS
+from series_stats import NameMapping
+from session_cache import file_hash, map_logs, parse_with_cache
+from utilities import safe_div
+
+# Per-player counts, and sums of amounts, of a session or of the archive
+COUNTS = (
+    # Rounds in which the player made a preflop move
+    "hands",
+    # Rounds in which they put money in preflop other than blinds
+    "voluntary",
+    "raised",
+    # Sum of the last preflop raise of each round they raised in
+    "raise_amount",
+    "three_bets",
+    "three_bet_amount",
+    "limps",
+    # Rounds in which they made a river move other than folding
+    "showdowns",
+    "showdown_wins",
+    "preshowdown_wins",
+)
+
+_FOLD = ACTION_IDS["fold"]
+_RAISE = ACTION_IDS["raise"]
+_BIG_BLIND = ACTION_IDS["big_blind"]
+_UNCALLED_BET = ACTION_IDS["uncalled_bet"]
+_MISSING_SMALL_BLIND = ACTION_IDS["missing_small_blind"]
+_MISSING_BIG_BLIND = ACTION_IDS["missing_big_blind"]
+_FORCED_BET_IDS = [ACTION_IDS[name] for name in FORCED_BETS]
+
+
+class SessionTotals(NamedTuple):
+    # Names of the players, indexed by the session's player ids. With a NameMapping, aliases may map several ids to
+    # one name.
+    players: List[str]
+    # Each of COUNTS by player id
+    counts: Dict[str, np.ndarray]
+    # One entry per win: the player id, the amount and whether it was won at showdown
+    win_players: np.ndarray
+    win_amounts: np.ndarray
+    win_showdown: np.ndarray
+
+
+def session_totals(evening, name_mapping: NameMapping = None) -> SessionTotals:
+    """
+    The per-player totals of the rounds of `evening` in which money was played, like `Evening.get_rounds`.
+    Players keep their names from the log if there is no `name_mapping`.
+    """
+    table = evening.actions
+    columns = table.columns()
+    n_rounds = len(evening.rounds) + 1
+    names = list(table.player_names)
+    # Winners are added as players of their own if they never moved
+    winners = {player for round in evening.rounds for player, _, _, _ in round.winners}
+    names += sorted(winners - set(names))
+    ids = {name: player_id for player_id, name in enumerate(names)}
+    n_players = max(len(names), 1)
+
+    # Moves are grouped by dense keys of (round, player) and of (round, player, street), so reductions per group
+    # are bincounts and flag arrays rather than sorts.
+    round_numbers = columns["round_numbers"].astype(np.int64)
+    keys = round_numbers * n_players + columns["player_ids"]
+    actions = columns["action_ids"]
+    amounts = columns["amounts"]
+    streets = columns["streets"]
+
+    # Rounds in which money was played, computed from the columns since `Round.money_spent` isn't kept in the
+    # session cache
+    _, spent = _money_in(keys * len(STREETS) + streets, actions, amounts, n_rounds * n_players * len(STREETS))
+    included = spent.reshape(n_rounds, -1).sum(axis=1) != 0
+    rows = included[round_numbers]
+    round_numbers, keys, actions, amounts, streets = (column[rows] for column in
+                                                      (round_numbers, keys, actions, amounts, streets))
+    n_keys = n_rounds * n_players
+
+    def rounds_with(mask):
+        return _flags(keys[mask], n_keys).reshape(n_rounds, n_players).sum(axis=0)
+
+    preflop = streets == 0
+    counts = {
+        "hands": rounds_with(preflop),
+        "voluntary": rounds_with(preflop & ~np.isin(actions, _FORCED_BET_IDS) & (amounts > 0)),
+        "raised": rounds_with(preflop & (actions == _RAISE)),
+        "showdowns": rounds_with((streets == 3) & (actions != _FOLD)),
+    }
+
+    # Raises: the last one of each player in a round, and the second one of each round is the 3-bet
+    raises = np.flatnonzero(preflop & (actions == _RAISE))
+    last = _last(keys[raises], n_keys)
+    raised = np.flatnonzero(last >= 0)
+    counts["raise_amount"] = _per_player(raised, n_players, amounts[raises[last[raised]]])
+    raise_rounds = round_numbers[raises]
+    _, first = np.unique(raise_rounds, return_index=True)
+    second = first + 1
+    second = second[second < len(raises)]
+    three_bets = raises[second[raise_rounds[second] == raise_rounds[second - 1]]]
+    counts["three_bets"] = _per_player(keys[three_bets], n_players)
+    counts["three_bet_amount"] = _per_player(keys[three_bets], n_players, amounts[three_bets])
+
+    limped = _limps(keys[preflop], round_numbers[preflop], actions[preflop], amounts[preflop], n_players, n_keys)
+    counts["limps"] = limped.reshape(n_rounds, n_players).sum(axis=0)
+
+    win_players, win_amounts, win_showdown = [], [], []
+    for round in evening.rounds:
+        if included[round.number]:
+            for player, hand, amount, _ in round.winners:
+                win_players.append(ids[player])
+                win_amounts.append(amount)
+                win_showdown.append(hand is not None)
+    win_players = np.array(win_players, dtype=np.int64)
+    win_amounts = np.array(win_amounts, dtype=np.int64)
+    win_showdown = np.array(win_showdown, dtype=bool)
+    counts["showdown_wins"] = np.bincount(win_players[win_showdown], minlength=n_players)
+    counts["preshowdown_wins"] = np.bincount(win_players[~win_showdown], minlength=n_players)
+
+    if name_mapping is not None:
+        names = [name_mapping.normalise_name(name) for name in names]
+    players = names + [""] * (n_players - len(names))
+    return SessionTotals(players, counts, win_players, win_amounts, win_showdown)
+
+
+def _per_player(keys, n_players, weights=None):
+    return np.bincount(keys % n_players, weights, minlength=n_players).astype(np.int64)
+
+
+def _flags(keys, n_keys):
+    """
+    Whether each of `n_keys` keys is among `keys`.
+    """
+    flags = np.zeros(n_keys, dtype=bool)
+    flags[keys] = True
+    return flags
+
+
+def _last(keys, n_keys):
+    """
+    For each of `n_keys` keys the index of its last occurrence in `keys`, -1 if there is none.
+    """
+    last = np.full(n_keys, -1, dtype=np.int64)
+    np.maximum.at(last, keys, np.arange(len(keys)))
+    return last
+
+
+def _money_in(keys, actions, amounts, n_keys):
+    """
+    Whether there were moves with an amount under each of `n_keys` keys, and the money put in the pot under each
+    key as `Round.money_in_round` counts it, for keys that group the moves of a player on one street.
+    """
+    def sum_of(mask):
+        return np.bincount(keys[mask], amounts[mask], minlength=n_keys).astype(np.int64)
+
+    # Each move with an amount replaces the player's money in the pot, except returned uncalled bets
+    setting = np.flatnonzero((amounts != 0) & (actions != _UNCALLED_BET))
+    last = _last(keys[setting], n_keys)
+    spent = np.where(last >= 0, amounts[setting[last]], 0) - sum_of(actions == _UNCALLED_BET)
+    # Missing blinds are added on top, a missing big blind only if the small one isn't missing too
+    missing_small = actions == _MISSING_SMALL_BLIND
+    spent += sum_of(missing_small) + np.where(_flags(keys[missing_small], n_keys), 0,
+                                              sum_of(actions == _MISSING_BIG_BLIND))
+    return _flags(keys[amounts != 0], n_keys), spent
+
+
+def _limps(keys, round_numbers, actions, amounts, n_players, n_keys):
+    """
+    Whether the player of each of `n_keys` (round, player) keys limped in that round, given the preflop moves:
+    their money in the pot equals the first big blind of the round and they didn't fold.
+    """
+    moved, spent = _money_in(keys, actions, amounts, n_keys)
+    # The first big blind of each round, rounds without one have no limps
+    big_blind = np.full(n_keys // n_players, -1, dtype=np.int64)
+    big_blinds = np.flatnonzero(actions == _BIG_BLIND)
+    blind_rounds, first = np.unique(round_numbers[big_blinds], return_index=True)
+    big_blind[blind_rounds] = amounts[big_blinds[first]]
+    folded = _flags(keys[actions == _FOLD], n_keys)
+    return moved & (spent == np.repeat(big_blind, n_players)) & ~folded
+
+
+class PlayerRow(NamedTuple):
+    player: str
+    counts: Dict[str, int]
+    # Medians of all wins, of those at showdown and of those before
+    median_win: float
+    median_showdown_win: float
+    median_preshowdown_win: float
+
+    @property
+    def wins(self) -> int:
+        return self.counts["showdown_wins"] + self.counts["preshowdown_wins"]
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        return safe_div(self.counts[numerator], self.counts[denominator])
+
+
+class ArchiveStats:
+    def __init__(self):
+        self.players: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.counts = {name: np.zeros(0, dtype=np.int64) for name in COUNTS}
+        # (player indexes, amounts, at showdown) of the wins of every session added
+        self._wins: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.sessions = 0
+
+    def _player_index(self, name: str) -> int:
+        index = self._index.get(name)
+        if index is None:
+            index = self._index[name] = len(self.players)
+            self.players.append(name)
+        return index
+
+    def add(self, totals: SessionTotals):
+        indexes = np.array([self._player_index(name) for name in totals.players], dtype=np.int64)
+        for name in COUNTS:
+            counts = np.zeros(len(self.players), dtype=np.int64)
+            counts[:len(self.counts[name])] = self.counts[name]
+            np.add.at(counts, indexes, totals.counts[name])
+            self.counts[name] = counts
+        self._wins.append((indexes[totals.win_players], totals.win_amounts, totals.win_showdown))
+        self.sessions += 1
+
+    def medians(self, showdown: bool = None) -> np.ndarray:
+        """
+        The median win of every player, counting only wins at showdown or before it if `showdown` is given.
+        Like `utilities.median`, the median of no wins is 0.
+        """
+        medians = np.zeros(len(self.players))
+        if not self._wins:
+            return medians
+        players, amounts, at_showdown = (np.concatenate(column) for column in zip(*self._wins))
+        if showdown is not None:
+            players = players[at_showdown == showdown]
+            amounts = amounts[at_showdown == showdown]
+        # Sorted by player, then by amount
+        order = np.lexsort((amounts, players))
+        players = players[order]
+        amounts = amounts[order]
+        lengths = np.bincount(players, minlength=len(self.players))
+        won = np.flatnonzero(lengths)
+        starts = np.searchsorted(players, won)
+        # The two middle wins of each player, the same one for an odd number of wins
+        low = amounts[starts + (lengths[won] - 1) // 2]
+        high = amounts[starts + lengths[won] // 2]
+        medians[won] = (low + high) / 2
+        return medians
+
+    def rows(self) -> List[PlayerRow]:
+        """
+        The stats of every player, most hands first.
+        """
+        medians = self.medians()
+        showdown_medians = self.medians(showdown=True)
+        preshowdown_medians = self.medians(showdown=False)
+        rows = [PlayerRow(player, {name: int(self.counts[name][index]) for name in COUNTS}, float(medians[index]),
+                          float(showdown_medians[index]), float(preshowdown_medians[index]))
+                for index, player in enumerate(self.players) if player]
+        return sorted(rows, key=lambda row: row.counts["hands"], reverse=True)
+
+    def print(self):
+        print_rows(f"Archive Stats ({self.sessions} logs)", self.rows())
+
+
+def print_rows(title: str, rows: List[PlayerRow]):
+    from termcolor import colored
+
+    print(colored(title, "white", attrs=["underline"]))
+    print(f"  {'player':<24} {'hands':>7} {'VPIP':>7} {'PFR':>7} {'3BET':>7} {'limp':>7} {'won':>7} "
+          f"{'SD won':>7} {'wins':>6} {'median':>7} {'at SD':>7} {'median':>7} {'pre SD':>7} {'median':>7}")
+    for row in rows:
+        print(f"  {row.player:<24} {row.counts['hands']:>7} "
+              f"{row.ratio('voluntary', 'hands') * 100:6.2f}% "
+              f"{row.ratio('raised', 'hands') * 100:6.2f}% "
+              f"{row.ratio('three_bets', 'hands') * 100:6.2f}% "
+              f"{row.ratio('limps', 'voluntary') * 100:6.2f}% "
+              f"{safe_div(row.wins, row.counts['voluntary']) * 100:6.2f}% "
+              f"{row.ratio('showdown_wins', 'showdowns') * 100:6.2f}% "
+              f"{row.wins:>6} {row.median_win:>7.0f} "
+              f"{safe_div(row.counts['showdown_wins'], row.wins) * 100:6.2f}% {row.median_showdown_win:>7.0f} "
+              f"{safe_div(row.counts['preshowdown_wins'], row.wins) * 100:6.2f}% "
+              f"{row.median_preshowdown_win:>7.0f}")
+    print()
+
+
+def totals_of_log(file_name, name_mapping: NameMapping, use_cache=True) -> Tuple[str, SessionTotals]:
+    """
+    The id (hash) of the log `file_name` and its per-player totals.
+    """
+    from log_processor import Parser
+
+    evening = parse_with_cache(Parser(ignore_warnings=False), "", file_name, use_cache)
+    return file_hash(file_name), session_totals(evening, name_mapping)
+
+
+def archive_stats(file_names, name_mapping: NameMapping = None, jobs=1, use_cache=True) -> ArchiveStats:
+    """
+    The stats of all logs `file_names`. With `jobs` > 1 the logs are parsed and reduced by a pool of that many
+    processes. The same log given twice is only counted once.
+    """
+    worker = functools.partial(totals_of_log, name_mapping=name_mapping or NameMapping({}), use_cache=use_cache)
+    stats = ArchiveStats()
+    logs = set()
+    for log_id, totals in map_logs(worker, file_names, jobs):
+        if log_id in logs:
+            continue
+        logs.add(log_id)
+        stats.add(totals)
+    return stats
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prints the stats of every player over many logs.")
+    arg_parser.add_argument("log_files", nargs="+", help="Paths to log files from pokernow.club")
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the logs, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing logs in parallel.")
+    args = arg_parser.parse_args()
+
+    import colorama
+    colorama.init()
+
+    archive_stats(args.log_files, jobs=args.jobs, use_cache=not args.no_cache).print()
+
+
+if __name__ == "__main__":
+    main()
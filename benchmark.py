@@ -0,0 +1,277 @@
+"""
+Benchmarks of parsing and statistics on synthetic logs.
+
+For every size, a log of at least that many rows is written by `log_generator.LogGenerator` and each stage below is
+run on it:
+
+ - parse: `Parser.parse` of the whole log
+ - get_rounds: `Evening.get_rounds`
+ - WinStats, PlayStats, PreFlopStats: a `StatsEngine` pass over the rounds with that statistic alone
+ - all stats: a single pass with all of them, as log_processor.py does it
+ - archive stats: the same stats reduced with NumPy by `archive_stats.session_totals`
+ - series parse: `summarise_logs` of a series of synthetic tournaments (no rebuys, nobody joins) of the same total
+   size, without the session cache
+ - series: `SeriesStats` aggregation of that series
+
+Rows/s and hands/s are relative to the size of the log, or the total size of the series. Peak memory is measured with
+tracemalloc in a second run of each stage, since tracing slows a run down too much to time it.
+
+With --startup, only the start up of log_processor.py is checked instead: importing it has to fit in
+IMPORT_BUDGET_SECONDS, and a run printing the stats of the bundled log must not load the modules needed for plots or
+equities. The script exits with an error if it doesn't.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List, NamedTuple
+
+# Imported up front, so the first stage using NumPy isn't charged for importing it
+import numpy
+from archive_stats import session_totals
+from log_generator import LogGenerator
+from log_processor import Parser
+from player_stats import WinStats, PlayStats, PreFlopStats
+from series_stats import NameMapping, SeriesStats, TournamentSpec, summarise_logs
+from stats_engine import StatsEngine
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+BUNDLED_LOG = os.path.join("logs", "07_21_2022_log1.csv")
+
+# Seconds importing log_processor may take in a fresh interpreter, cron jobs pay them on every run.
+IMPORT_BUDGET_SECONDS = 0.1
+# Modules that must only be loaded once needed: for printing the stats, and for plots and equities.
+PRINT_MODULES = ("colorama", "termcolor")
+PLOT_MODULES = ("matplotlib", "numpy")
+_STARTUP_SCRIPT = """
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+import log_processor
+import_seconds = time.perf_counter() - start
+after_import = sorted({m.split(".")[0] for m in sys.modules} & set(%(print_modules)r + %(plot_modules)r))
+sys.argv = ["log_processor.py", "--no-cache", "--quiet", %(log)r]
+with contextlib.redirect_stdout(io.StringIO()):
+    log_processor.main()
+after_run = sorted({m.split(".")[0] for m in sys.modules} & set(%(plot_modules)r))
+print(json.dumps({"import_seconds": import_seconds, "after_import": after_import, "after_run": after_run}))
+"""
+# The default of LogGenerator
+STARTING_STACK = 1000
+
+
+class Result(NamedTuple):
+    lines: int
+    hands: int
+    stage: str
+    seconds: float
+    # None if memory wasn't measured
+    peak_bytes: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds else float("inf")
+
+    @property
+    def hands_per_second(self) -> float:
+        return self.hands / self.seconds if self.seconds else float("inf")
+
+
+def _parse(file_name):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return Parser(ignore_warnings=False).parse("", file_name)
+
+
+def _stats_stage(*stat_names) -> Callable:
+    def run(evening, rounds):
+        win_stats = WinStats(evening)
+        play_stats = PlayStats(evening, win_stats)
+        preflop_stats = PreFlopStats(evening, play_stats)
+        stats = {"WinStats": win_stats, "PlayStats": play_stats, "PreFlopStats": preflop_stats}
+        StatsEngine([stats[name] for name in stat_names]).run(rounds)
+    return run
+
+
+def _summarise(file_names):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return summarise_logs(file_names, use_cache=False)
+
+
+def _aggregate(summaries, start_amount):
+    series_stats = SeriesStats(summaries, NameMapping({}), TournamentSpec({1: 0.7, 2: 0.3}, start_amount))
+    series_stats.calc_stats()
+    series_stats.reshape_stats()
+
+
+def _measure(function, *args, memory=True):
+    """
+    The result of `function(*args)`, the seconds it took and its peak memory use in bytes.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        del result
+        tracemalloc.start()
+        try:
+            result = function(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def count_rows(file_name) -> int:
+    with open(file_name, encoding="utf-8", newline="") as f:
+        # Not counting the header
+        return sum(1 for _ in csv.reader(f)) - 1
+
+
+def benchmark_log(file_name, memory: bool = True) -> List[Result]:
+    lines = count_rows(file_name)
+    evening, seconds, peak = _measure(_parse, file_name, memory=memory)
+    hands = len(evening.rounds)
+    results = [Result(lines, hands, "parse", seconds, peak)]
+
+    rounds, seconds, peak = _measure(evening.get_rounds, memory=memory)
+    results.append(Result(lines, hands, "get_rounds", seconds, peak))
+
+    stages = [
+        ("WinStats", _stats_stage("WinStats")),
+        ("PlayStats", _stats_stage("PlayStats")),
+        ("PreFlopStats", _stats_stage("PreFlopStats")),
+        ("all stats", _stats_stage("WinStats", "PlayStats", "PreFlopStats")),
+    ]
+    for stage, function in stages:
+        _, seconds, peak = _measure(function, evening, rounds, memory=memory)
+        results.append(Result(lines, hands, stage, seconds, peak))
+
+    _, seconds, peak = _measure(session_totals, evening, NameMapping({}), memory=memory)
+    results.append(Result(lines, hands, "archive stats", seconds, peak))
+    return results
+
+
+def benchmark_series(file_names, start_amount: int, memory: bool = True) -> List[Result]:
+    lines = sum(count_rows(file_name) for file_name in file_names)
+    summaries, seconds, peak = _measure(_summarise, file_names, memory=memory)
+    hands = sum(max(r for round_amts in s.historical_amounts.values() for r, _ in round_amts) for s in summaries)
+    results = [Result(lines, hands, "series parse", seconds, peak)]
+    _, seconds, peak = _measure(_aggregate, summaries, start_amount, memory=memory)
+    results.append(Result(lines, hands, "series", seconds, peak))
+    return results
+
+
+def synthetic_log(directory, lines: int, players: int, seed: int) -> str:
+    """
+    The path of a synthetic log of at least `lines` rows in `directory`, which is only written if it isn't
+    there yet.
+    """
+    file_name = os.path.join(directory, f"synthetic_{lines}_p{players}_s{seed}.csv")
+    if not os.path.exists(file_name):
+        start = time.perf_counter()
+        generated = LogGenerator(players=players, seed=seed).write(file_name, lines=lines)
+        print(f"Generated {generated.lines} rows, {generated.hands} hands in {time.perf_counter() - start:.1f}s: "
+              f"{file_name}")
+    return file_name
+
+
+def synthetic_series(directory, lines: int, players: int, seed: int) -> List[str]:
+    """
+    The paths of synthetic tournament logs of at least `lines` rows in total, in a subdirectory of `directory`
+    which is only written if it isn't there yet.
+    """
+    series_directory = os.path.join(directory, f"series_{lines}_p{players}_s{seed}")
+    if not os.path.isdir(series_directory):
+        start = time.perf_counter()
+        partial_directory = tempfile.mkdtemp(dir=directory)
+        total = 0
+        game = 0
+        while total < lines:
+            generator = LogGenerator(players=players, seed=seed + game, rebuy_rate=0, seat_change_rate=0)
+            total += generator.write(os.path.join(partial_directory, f"game_{game:05d}.csv"), lines=lines - total).lines
+            game += 1
+        os.rename(partial_directory, series_directory)
+        print(f"Generated {total} rows in {game} tournaments in {time.perf_counter() - start:.1f}s: "
+              f"{series_directory}")
+    return [os.path.join(series_directory, name) for name in sorted(os.listdir(series_directory))]
+
+
+def check_startup(repeat: int = 5) -> List[str]:
+    """
+    Runs log_processor.py on the bundled log `repeat` times in fresh interpreters, and returns the problems
+    with its start up.
+    """
+    script = _STARTUP_SCRIPT % {"print_modules": PRINT_MODULES, "plot_modules": PLOT_MODULES, "log": BUNDLED_LOG}
+    # Measured like users run it, with cached bytecode
+    env = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+    runs = [json.loads(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                      env=env, cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+            for _ in range(repeat)]
+    # The first run may have had to write the bytecode
+    import_seconds = min(run["import_seconds"] for run in runs[1:] or runs)
+    print(f"import log_processor: {import_seconds * 1000:.1f} ms (budget {IMPORT_BUDGET_SECONDS * 1000:.0f} ms)")
+
+    problems = []
+    if import_seconds > IMPORT_BUDGET_SECONDS:
+        problems.append(f"importing log_processor took {import_seconds * 1000:.1f} ms")
+    if runs[0]["after_import"]:
+        problems.append(f"importing log_processor loaded {', '.join(runs[0]['after_import'])}")
+    if runs[0]["after_run"]:
+        problems.append(f"printing the stats loaded {', '.join(runs[0]['after_run'])}")
+    return problems
+
+
+def print_results(results: List[Result]):
+    print(f"{'rows':>9} {'hands':>7}  {'stage':<13} {'seconds':>8} {'rows/s':>10} {'hands/s':>9} {'peak MiB':>9}")
+    for r in results:
+        peak = f"{r.peak_bytes / 2 ** 20:9.1f}" if r.peak_bytes is not None else f"{'-':>9}"
+        print(f"{r.lines:>9} {r.hands:>7}  {r.stage:<13} {r.seconds:8.3f} {r.rows_per_second:10.0f} "
+              f"{r.hands_per_second:9.0f} {peak}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks parsing and statistics on synthetic logs.")
+    arg_parser.add_argument("--lines", type=int, nargs="+", default=DEFAULT_SIZES, help="Sizes of the logs in rows")
+    arg_parser.add_argument("--players", type=int, default=8, help="Players seated at the start of each log")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic logs")
+    arg_parser.add_argument("--log_dir", help="Directory to keep the synthetic logs in and reuse them from, by default they are deleted")
+    arg_parser.add_argument("--no_memory", action="store_true", help="Only measure time, which halves the run time")
+    arg_parser.add_argument("--json", help="File to also write the results to as JSON")
+    arg_parser.add_argument("--startup", action="store_true", help="Only checks the import time and the modules loaded by log_processor.py")
+    args = arg_parser.parse_args()
+
+    if args.startup:
+        problems = check_startup()
+        for problem in problems:
+            print(f"**FAILED** {problem}")
+        sys.exit(1 if problems else 0)
+
+    with contextlib.ExitStack() as stack:
+        directory = args.log_dir
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        results = []
+        for lines in args.lines:
+            file_name = synthetic_log(directory, lines, args.players, args.seed)
+            results += benchmark_log(file_name, memory=not args.no_memory)
+            file_names = synthetic_series(directory, lines, args.players, args.seed)
+            results += benchmark_series(file_names, STARTING_STACK, memory=not args.no_memory)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([dict(r._asdict(), rows_per_second=r.rows_per_second, hands_per_second=r.hands_per_second)
+                       for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Textures of the boards dealt over any number of sessions, compared with how often a fair shuffle deals them.
+
+Every flop, turn and river is encoded as a row of three, four or five card integers (as in hand_evaluator.py), so the
+boards of a whole archive are one array per street and each texture is a vectorised reduction over it. Boards run twice add their
+second run from the first street on which it differs. A texture depends either only on the suits or only on the ranks
+of the cards, so its exact odds are sums over the possible suit counts or rank counts of a board, each weighted by the
+number of boards having them.
+
+Textures of the flop: rainbow, two-tone or monotone, paired, three cards to a straight and the highest card; of the
+turn and the river: three or four cards of a suit, paired and three cards to a straight. Boards are only seen when a
+hand goes to the flop, after players decided with their hole cards, which are then not in the deck; the effect on the
+frequencies is well below what a few thousand boards can detect.
+
+    python3 board_texture.py logs/*.csv [--jobs 4]
+"""
+import argparse
+import functools
+import itertools
+import math
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from hand_evaluator import parse_card
+from preflop_classes import ChiSquare
+from session_cache import file_hash, map_logs, parse_with_cache
+
+STREET_CARDS = {"flop": 3, "turn": 4, "river": 5}
+
+
+def _by_max(offset: int, n_categories: int) -> Callable[[np.ndarray], np.ndarray]:
+    def category(counts):
+        return np.clip(counts.max(axis=1) - offset, 0, n_categories - 1)
+    return category
+
+
+def _straight_possible(rank_counts: np.ndarray) -> np.ndarray:
+    """
+    1 for boards with three different ranks within five consecutive ones, the ace counting high and low.
+    """
+    present = (rank_counts > 0).astype(np.int64)
+    present = np.concatenate([present[:, 12:], present], axis=1)
+    sums = np.cumsum(np.pad(present, ((0, 0), (1, 0))), axis=1)
+    return ((sums[:, 5:] - sums[:, :-5]).max(axis=1) >= 3).astype(np.int64)
+
+
+def _highest_rank(rank_counts: np.ndarray) -> np.ndarray:
+    # How many ranks below the ace the highest card is
+    return np.minimum(np.argmax(rank_counts[:, ::-1] > 0, axis=1), 5)
+
+
+class Texture(NamedTuple):
+    name: str
+    categories: Tuple[str, ...]
+    # Whether the category is a function of the suit counts (number of boards, 4) or of the rank counts (number of
+    # boards, 13) of the boards
+    of_suits: bool
+    category: Callable[[np.ndarray], np.ndarray]
+
+
+def textures(street: str) -> List[Texture]:
+    pairing = Texture("pairing", ("unpaired", "paired", "trips or more"), False, _by_max(1, 3))
+    straight = Texture("straight", ("no straight possible", "straight possible"), False, _straight_possible)
+    if street == "flop":
+        return [
+            Texture("suits", ("rainbow", "two-tone", "monotone"), True, _by_max(1, 3)),
+            pairing,
+            straight,
+            Texture("high card", ("A high", "K high", "Q high", "J high", "T high", "9 high or lower"), False,
+                    _highest_rank),
+        ]
+    return [Texture("suits", ("no flush possible", "three of a suit", "four or more of a suit"), True,
+                    _by_max(2, 3)), pairing, straight]
+
+
+def _counts(cards: np.ndarray, values: int, of_suits: bool) -> np.ndarray:
+    """
+    How many cards of each suit or rank every board of `cards` has.
+    """
+    keys = cards & 3 if of_suits else cards >> 2
+    counts = np.zeros((len(cards), values), dtype=np.int64)
+    np.add.at(counts, (np.repeat(np.arange(len(cards)), cards.shape[1]), keys.ravel()), 1)
+    return counts
+
+
+@functools.lru_cache(maxsize=None)
+def _multisets(n_cards: int, of_suits: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    All possible suit (or rank) counts of `n_cards` cards, and the number of boards with each.
+    """
+    values, per_value = (4, 13) if of_suits else (13, 4)
+    counts, weights = [], []
+    for multiset in itertools.combinations_with_replacement(range(values), n_cards):
+        count = [multiset.count(value) for value in range(values)]
+        if max(count) <= per_value:
+            counts.append(count)
+            weights.append(math.prod(math.comb(per_value, c) for c in count))
+    return np.array(counts, dtype=np.int64), np.array(weights, dtype=np.int64)
+
+
+def expected_shares(street: str, texture: Texture) -> np.ndarray:
+    """
+    The exact share of the boards dealt by a fair shuffle in each category of `texture`.
+    """
+    n_cards = STREET_CARDS[street]
+    counts, weights = _multisets(n_cards, texture.of_suits)
+    boards = np.bincount(texture.category(counts), weights=weights, minlength=len(texture.categories))
+    return boards / math.comb(52, n_cards)
+
+
+def board_rows(evening) -> Dict[str, np.ndarray]:
+    """
+    The encoded cards of every flop, turn (flop and turn) and river (the whole board) of `evening`. A second run
+    counts on the streets from the first one it was dealt on.
+    """
+    rows = {street: [] for street in STREET_CARDS}
+    for round in evening.rounds:
+        if round.flop is None:
+            continue
+        runs = [[*round.flop, round.turn, round.river]]
+        if round.second_flop is not None or round.second_turn is not None or round.second_river is not None:
+            # Only the streets dealt twice differ, the first board is shared
+            runs.append([*(round.second_flop or round.flop), round.second_turn or round.turn, round.second_river])
+        for street, n_cards in STREET_CARDS.items():
+            dealt = []
+            for run in runs:
+                cards = run[:n_cards]
+                if None not in cards and cards not in dealt:
+                    dealt.append(cards)
+            rows[street] += [[parse_card(card) for card in cards] for cards in dealt]
+    return {street: np.array(rows[street], dtype=np.int64).reshape(-1, STREET_CARDS[street]) for street in rows}
+
+
+class TextureRow(NamedTuple):
+    category: str
+    count: int
+    share: float
+    expected: float
+
+
+class BoardReport:
+    def __init__(self, boards: Dict[str, np.ndarray]):
+        # Per street, the encoded cards as returned by `board_rows`
+        self.boards = boards
+
+    def rows(self, street: str, texture: Texture) -> List[TextureRow]:
+        cards = self.boards[street]
+        counts = _counts(cards, 4 if texture.of_suits else 13, texture.of_suits)
+        observed = np.bincount(texture.category(counts), minlength=len(texture.categories))
+        shares = observed / max(len(cards), 1)
+        return [TextureRow(category, int(count), float(share), float(expected))
+                for category, count, share, expected
+                in zip(texture.categories, observed, shares, expected_shares(street, texture))]
+
+    def chi_square(self, street: str, texture: Texture) -> ChiSquare:
+        """
+        How far the boards are from a fair shuffle in `texture`, over its categories expected at all.
+        """
+        rows = [row for row in self.rows(street, texture) if row.expected > 0]
+        n = len(self.boards[street])
+        if n == 0:
+            return ChiSquare(0.0, 0)
+        statistic = sum((row.count - row.expected * n) ** 2 / (row.expected * n) for row in rows)
+        return ChiSquare(statistic, len(rows) - 1)
+
+    def print(self):
+        from termcolor import colored
+
+        print(colored("Board Textures (Is the shuffle fair?)", "white", attrs=["underline"]))
+        for street in STREET_CARDS:
+            print(colored(f"  {street.capitalize()}: {len(self.boards[street])} boards", "white", attrs=["bold"]))
+            for texture in textures(street):
+                chi_square = self.chi_square(street, texture)
+                print(f"    {texture.name:<10} chi2 {chi_square.statistic:6.1f}, p {chi_square.p_value:.3f}")
+                for row in self.rows(street, texture):
+                    print(f"      {row.category:<24} {row.count:>7} {row.share * 100:7.2f}% "
+                          f"(expected {row.expected * 100:6.2f}%)")
+        print()
+
+
+def boards_of_log(file_name, use_cache=True) -> Tuple[str, Dict[str, np.ndarray]]:
+    """
+    The id (hash) of the log `file_name` and its boards as returned by `board_rows`.
+    """
+    from log_processor import Parser
+
+    evening = parse_with_cache(Parser(ignore_warnings=False), "", file_name, use_cache)
+    return file_hash(file_name), board_rows(evening)
+
+
+def archive_boards(file_names, jobs=1, use_cache=True) -> BoardReport:
+    """
+    The boards of all logs `file_names`, parsed by a pool of `jobs` processes if `jobs` > 1. The same log given
+    twice is only counted once.
+    """
+    worker = functools.partial(boards_of_log, use_cache=use_cache)
+    boards = {street: [np.zeros((0, n_cards), dtype=np.int64)] for street, n_cards in STREET_CARDS.items()}
+    logs = set()
+    for log_id, rows in map_logs(worker, file_names, jobs):
+        if log_id in logs:
+            continue
+        logs.add(log_id)
+        for street in STREET_CARDS:
+            boards[street].append(rows[street])
+    return BoardReport({street: np.concatenate(boards[street]) for street in STREET_CARDS})
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prints how often boards of each texture were dealt over many "
+                                                     "logs, and how often a fair shuffle deals them.")
+    arg_parser.add_argument("log_files", nargs="+", help="Paths to log files from pokernow.club")
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the logs, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing logs in parallel.")
+    args = arg_parser.parse_args()
+
+    import colorama
+    colorama.init()
+
+    archive_boards(args.log_files, jobs=args.jobs, use_cache=not args.no_cache).print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+All-in equity calculation.
+
+`equity` computes each hand's share of the pot over the possible run-outs of the board, exactly by enumerating them
+when there are few enough (any all-in on the flop or later), otherwise by Monte Carlo sampling. Run-outs are evaluated
+in batches of at most BATCH_ROWS hands with `hand_evaluator.evaluate_batch`, so memory stays bounded however many
+problems are solved together.
+
+`all_in_spot` finds the moment a round was decided by an all-in and the equity of every player with known hole cards
+still in the hand at that moment.
+"""
+import itertools
+import math
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from hand_evaluator import evaluate_batch, parse_cards
+from stats_engine import STREETS
+
+ALL_IN_ACTIONS = ("call (all in)", "raise (all in)")
+
+# Largest number of run-outs enumerated exactly, more are sampled
+EXACT_LIMIT = 200000
+DEFAULT_SAMPLES = 20000
+# Hands, each with one run-out, evaluated at once
+BATCH_ROWS = 1 << 16
+
+
+def _runouts(deck: Sequence[int], missing: int, exact_limit: int, samples: int, rng) -> np.ndarray:
+    n_runouts = math.comb(len(deck), missing)
+    if n_runouts <= exact_limit:
+        runouts = np.fromiter(itertools.chain.from_iterable(itertools.combinations(deck, missing)),
+                              dtype=np.int64, count=n_runouts * missing)
+        return runouts.reshape(n_runouts, missing)
+    # Sample `missing` distinct cards for each run-out
+    deck = np.array(deck, dtype=np.int64)
+    return deck[rng.random((samples, len(deck))).argsort(axis=1)[:, :missing]]
+
+
+def _boards(board: Sequence[int], dead: Iterable[int], hands: Sequence[Sequence[int]], exact_limit: int,
+            samples: int, rng) -> np.ndarray:
+    used = set(board) | set(dead) | {card for hand in hands for card in hand}
+    deck = [card for card in range(52) if card not in used]
+    runouts = _runouts(deck, 5 - len(board), exact_limit, samples, rng)
+    return np.hstack([np.broadcast_to(np.array(board, dtype=np.int64), (len(runouts), len(board))), runouts])
+
+
+def batch_equity(problems: Sequence[Tuple[Sequence[Sequence[int]], Sequence[int], Iterable[int]]],
+                 exact_limit: int = EXACT_LIMIT, samples: int = DEFAULT_SAMPLES, rng=None) -> List[List[float]]:
+    """
+    Solves many `equity` problems, each a tuple of (hands, board, dead). The run-outs of all problems are
+    evaluated together in batches of about `BATCH_ROWS` hands, and the shares of the pot added up as they go.
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+    # By problem, the sum of the shares of each hand over its run-outs, and the number of run-outs
+    totals = []
+    n_runouts = []
+    pending = []
+    pending_rows = 0
+    for index, (hands, board, dead) in enumerate(problems):
+        boards = _boards(board, dead, hands, exact_limit, samples, rng)
+        totals.append(np.zeros(len(hands)))
+        n_runouts.append(len(boards))
+        step = max(BATCH_ROWS // max(len(hands), 1), 1)
+        for start in range(0, len(boards), step):
+            part = boards[start:start + step]
+            rows = np.vstack([np.hstack([np.broadcast_to(np.array(hand, dtype=np.int64), (len(part), 2)), part])
+                              for hand in hands])
+            pending.append((index, len(hands), rows))
+            pending_rows += len(rows)
+            if pending_rows >= BATCH_ROWS:
+                _add_shares(pending, totals)
+                pending, pending_rows = [], 0
+    if pending:
+        _add_shares(pending, totals)
+    return [(total / max(count, 1)).tolist() for total, count in zip(totals, n_runouts)]
+
+
+def _add_shares(pending: List[Tuple[int, int, np.ndarray]], totals: List[np.ndarray]):
+    """
+    Evaluates the `pending` (problem index, number of hands, hands with run-outs) rows in one batch and adds the
+    share of the pot of each hand to the totals of its problem.
+    """
+    all_values = evaluate_batch(np.concatenate([rows for _, _, rows in pending]))
+    offset = 0
+    for index, n_hands, rows in pending:
+        values = all_values[offset:offset + len(rows)].reshape(n_hands, -1)
+        offset += len(rows)
+        winners = values == values.max(axis=0)
+        totals[index] += (winners / winners.sum(axis=0)).sum(axis=1)
+
+
+def equity(hands: Sequence[Sequence[int]], board: Sequence[int] = (), dead: Iterable[int] = (),
+           exact_limit: int = EXACT_LIMIT, samples: int = DEFAULT_SAMPLES, rng=None) -> List[float]:
+    """
+    The expected share of the pot of each of `hands` (encoded hole cards), given the cards of the `board` dealt so
+    far and `dead` cards known to be out of the deck. Ties split the pot. `rng` is a numpy Generator used when the
+    run-outs are sampled.
+    """
+    return batch_equity([(hands, board, dead)], exact_limit, samples, rng)[0]
+
+
+class AllInSpot(NamedTuple):
+    round_number: int
+    # The street of the last all-in move
+    street: str
+    board: List[str]
+    players: List[str]
+    equities: List[float]
+
+
+def _board_at(round, street: str) -> Optional[List[str]]:
+    if street == "preflop":
+        return []
+    if round.flop is None:
+        return None
+    cards = {"flop": [], "turn": [round.turn], "river": [round.turn, round.river]}[street]
+    if None in cards:
+        return None
+    return list(round.flop) + cards
+
+
+def _spot_problem(round) -> Optional[Tuple[str, List[str], List[str], tuple]]:
+    """
+    The street, board and players of the last all-in of `round`, along with the equity problem to solve.
+    """
+    street = None
+    present = set()
+    folded = set()
+    for street_name, moves in zip(STREETS, (round.preflop_moves, round.flop_moves, round.turn_moves,
+                                            round.river_moves)):
+        for move in moves:
+            present.add(move.player)
+            if move.action_name in ALL_IN_ACTIONS:
+                street = street_name
+            elif move.action_name == "fold":
+                folded.add(move.player)
+    if street is None:
+        return None
+
+    # Our own hand is known under the username given to the parser, which may not be our name in the log,
+    # so only players that made moves count.
+    players = [player for player, cards in round.hole_cards.items()
+               if player in present and player not in folded and len(cards) == 2]
+    board = _board_at(round, street)
+    if len(players) < 2 or board is None:
+        return None
+    hands = [parse_cards(round.hole_cards[player]) for player in players]
+    # Any other known cards are out of the deck
+    in_play = {card for hand in hands for card in hand}
+    dead = {card for cards in round.hole_cards.values() for card in parse_cards(cards)} - in_play
+    return street, board, players, (hands, parse_cards(board), dead)
+
+
+def all_in_spot(round, rng=None, **equity_args) -> Optional[AllInSpot]:
+    """
+    The equities at the last all-in of `round` of every player with known hole cards who hadn't folded.
+    None if there was no all-in or fewer than two such players.
+    """
+    spot = _spot_problem(round)
+    if spot is None:
+        return None
+    street, board, players, problem = spot
+    return AllInSpot(round.number, street, board, players, equity(*problem, rng=rng, **equity_args))
+
+
+def all_in_spots(evening, seed: int = 0, **equity_args) -> List[AllInSpot]:
+    """
+    The all-in spots of every round of `evening`, with the equities of all of them evaluated in one batch.
+    Sampled equities are reproducible for a given `seed`.
+    """
+    spots = [(round, _spot_problem(round)) for round in evening.rounds]
+    spots = [(round, spot) for round, spot in spots if spot is not None]
+    equities = batch_equity([problem for _, (_, _, _, problem) in spots], rng=np.random.default_rng(seed),
+                            **equity_args)
+    return [AllInSpot(round.number, street, board, players, spot_equities)
+            for (round, (street, board, players, _)), spot_equities in zip(spots, equities)]
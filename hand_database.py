@@ -0,0 +1,352 @@
+"""
+Persistent database of the hands of many sessions.
+
+Parsed evenings are imported into an SQLite file, normalised into players, hands, the players of each hand, boards
+and actions, so stats over any number of sessions are indexed queries instead of parsing every log again. A hand is
+identified by its number in the log together with the `order` of its "-- starting hand" row, so importing is
+incremental and idempotent: importing a log again, or a later download of a log that grew, only adds the hands that
+are new. Hands that weren't finished yet are left out until they are.
+
+The per-player flags of each hand follow PlayStats and PreFlopStats: a player is present if they made a preflop
+move, voluntary if they put money in preflop other than blinds, and the 3-bet is the second preflop raise.
+
+    python3 hand_database.py hands.db import logs/*.csv
+    python3 hand_database.py hands.db preflop --since 2022-07-01
+    python3 hand_database.py hands.db hands "Alice" --three_bet
+"""
+import argparse
+import os
+import sqlite3
+import time
+from typing import List, NamedTuple, Optional
+
+from action_table import epoch_millis
+from player_stats import FORCED_BETS
+from stats_engine import STREETS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL UNIQUE,
+    -- SHA-256 of the log when it was last imported, a log that didn't change isn't parsed again
+    file_hash TEXT NOT NULL,
+    imported_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    -- As in the log, e.g. "Alice @ X1fH-ZM9TB"
+    name TEXT NOT NULL UNIQUE,
+    -- Without the id, which pokernow.club may change from one game to the next
+    nickname TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hands (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    hand_number INTEGER NOT NULL,
+    log_order INTEGER NOT NULL,
+    -- Epoch milliseconds
+    started_at INTEGER NOT NULL,
+    dealer_id INTEGER REFERENCES players (id),
+    pot INTEGER NOT NULL,
+    UNIQUE (hand_number, log_order)
+);
+CREATE TABLE IF NOT EXISTS hand_players (
+    hand_id INTEGER NOT NULL REFERENCES hands (id),
+    player_id INTEGER NOT NULL REFERENCES players (id),
+    position TEXT,
+    stack INTEGER,
+    hole_cards TEXT,
+    voluntary INTEGER NOT NULL,
+    raised INTEGER NOT NULL,
+    three_bet INTEGER NOT NULL,
+    went_to_showdown INTEGER NOT NULL,
+    spent INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    PRIMARY KEY (hand_id, player_id)
+);
+CREATE TABLE IF NOT EXISTS boards (
+    hand_id INTEGER NOT NULL REFERENCES hands (id),
+    -- 1, or 2 for the second board of a hand that was run twice
+    run INTEGER NOT NULL,
+    flop TEXT,
+    turn TEXT,
+    river TEXT,
+    PRIMARY KEY (hand_id, run)
+);
+CREATE TABLE IF NOT EXISTS actions (
+    hand_id INTEGER NOT NULL REFERENCES hands (id),
+    seq INTEGER NOT NULL,
+    player_id INTEGER NOT NULL REFERENCES players (id),
+    street TEXT NOT NULL,
+    action TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    -- Epoch milliseconds
+    time_stamp INTEGER NOT NULL,
+    -- Which preflop raise this is: 1 for the open raise, 2 for the 3-bet and so on
+    preflop_raise INTEGER,
+    PRIMARY KEY (hand_id, seq)
+);
+CREATE INDEX IF NOT EXISTS players_nickname ON players (nickname);
+CREATE INDEX IF NOT EXISTS hands_started_at ON hands (started_at);
+CREATE INDEX IF NOT EXISTS hand_players_player ON hand_players (player_id, hand_id);
+CREATE INDEX IF NOT EXISTS hand_players_position ON hand_players (position, player_id);
+CREATE INDEX IF NOT EXISTS actions_player_action ON actions (player_id, action);
+CREATE INDEX IF NOT EXISTS actions_action ON actions (action, street);
+"""
+
+
+class PreflopRow(NamedTuple):
+    player: str
+    hands: int
+    voluntary: int
+    raised: int
+    three_bets: int
+
+    @property
+    def vpip(self) -> float:
+        return self.voluntary / self.hands if self.hands else 0.0
+
+    @property
+    def pfr(self) -> float:
+        return self.raised / self.hands if self.hands else 0.0
+
+    @property
+    def three_bet(self) -> float:
+        return self.three_bets / self.hands if self.hands else 0.0
+
+
+class HandRow(NamedTuple):
+    hand_id: int
+    file_name: str
+    hand_number: int
+    log_order: int
+    started_at: int
+
+
+def _time_range(since: Optional[str], until: Optional[str]):
+    """
+    SQL conditions on hands.started_at for ISO dates or time stamps, `until` excluded.
+    """
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("h.started_at >= ?")
+        params.append(epoch_millis(since))
+    if until is not None:
+        conditions.append("h.started_at < ?")
+        params.append(epoch_millis(until))
+    return conditions, params
+
+
+class HandDatabase:
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self._player_ids = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _player_id(self, name: str) -> int:
+        player_id = self._player_ids.get(name)
+        if player_id is None:
+            self.connection.execute("INSERT OR IGNORE INTO players (name, nickname) VALUES (?, ?)",
+                                    (name, name.split("@")[0].strip()))
+            player_id, = self.connection.execute("SELECT id FROM players WHERE name = ?", (name,)).fetchone()
+            self._player_ids[name] = player_id
+        return player_id
+
+    def _session_id(self, file_name: str, file_hash: str) -> int:
+        self.connection.execute(
+            "INSERT INTO sessions (file_name, file_hash, imported_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (file_name) DO UPDATE SET file_hash = excluded.file_hash, imported_at = excluded.imported_at",
+            (file_name, file_hash, int(time.time() * 1000)))
+        session_id, = self.connection.execute("SELECT id FROM sessions WHERE file_name = ?", (file_name,)).fetchone()
+        return session_id
+
+    def is_imported(self, file_name: str, file_hash: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM sessions WHERE file_name = ? AND file_hash = ?",
+                                       (os.path.abspath(file_name), file_hash)).fetchone() is not None
+
+    def import_evening(self, evening, file_name: str, file_hash: str = "") -> int:
+        """
+        Adds the finished hands of `evening`, parsed from `file_name`, that aren't in the database yet and returns
+        how many there were.
+        """
+        added = 0
+        with self.connection:
+            session_id = self._session_id(os.path.abspath(file_name), file_hash)
+            for round in evening.rounds:
+                if round.finished and round.hand_number is not None and self._import_round(session_id, round):
+                    added += 1
+        return added
+
+    def _import_round(self, session_id: int, round) -> bool:
+        dealer_id = self._player_id(round.dealer) if round.dealer in round.initial_amounts else None
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO hands (session_id, hand_number, log_order, started_at, dealer_id, pot) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, round.hand_number, round.order, round.started_at, dealer_id, round.total_money_in_round()))
+        if cursor.rowcount == 0:
+            return False
+        hand_id = cursor.lastrowid
+
+        actions = []
+        present, voluntary, raised, in_showdown = set(), set(), set(), set()
+        three_better = None
+        raises = 0
+        seq = 0
+        for street, moves in zip(STREETS, (round.preflop_moves, round.flop_moves, round.turn_moves,
+                                           round.river_moves)):
+            for move in moves:
+                preflop_raise = None
+                if street == STREETS[0]:
+                    present.add(move.player)
+                    if move.action_name not in FORCED_BETS and move.amount > 0:
+                        voluntary.add(move.player)
+                    if move.action_name == "raise":
+                        raises += 1
+                        preflop_raise = raises
+                        raised.add(move.player)
+                        if raises == 2:
+                            three_better = move.player
+                elif street == STREETS[-1] and move.action_name != "fold":
+                    in_showdown.add(move.player)
+                actions.append((hand_id, seq, self._player_id(move.player), street, move.action_name, move.amount,
+                                move.time_stamp, preflop_raise))
+                seq += 1
+        self.connection.executemany("INSERT INTO actions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", actions)
+
+        positions = round.positions
+        spent = round.money_spent()
+        won = round.winnings()
+        self.connection.executemany(
+            "INSERT INTO hand_players VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(hand_id, self._player_id(player), positions.get(player), round.initial_amounts.get(player),
+              " ".join(round.hole_cards[player]) if player in round.hole_cards else None,
+              player in voluntary, player in raised, player == three_better, player in in_showdown,
+              spent.get(player, 0), won.get(player, 0))
+             for player in present])
+
+        boards = [(1, round.flop, round.turn, round.river)]
+        if round.second_flop is not None or round.second_turn is not None or round.second_river is not None:
+            # Only the streets dealt twice differ, the first board is shared
+            boards.append((2, round.second_flop or round.flop, round.second_turn or round.turn, round.second_river))
+        self.connection.executemany(
+            "INSERT INTO boards VALUES (?, ?, ?, ?, ?)",
+            [(hand_id, run, " ".join(flop) if flop is not None else None, turn, river)
+             for run, flop, turn, river in boards if flop is not None])
+        return True
+
+    def import_log(self, file_name: str, parser=None, use_cache: bool = True) -> int:
+        """
+        Parses the log `file_name` unless it was imported before without changing since, and adds its new hands.
+        Returns how many hands were added.
+        """
+        from log_processor import Parser
+        from session_cache import file_hash, parse_with_cache
+
+        log_hash = file_hash(file_name)
+        if self.is_imported(file_name, log_hash):
+            return 0
+        if parser is None:
+            parser = Parser(ignore_warnings=False)
+        evening = parse_with_cache(parser, "", file_name, use_cache)
+        return self.import_evening(evening, file_name, log_hash)
+
+    def _player_condition(self, column: str, player: str):
+        """
+        A condition on the player id `column` matching `player`, looked up first so the query can use the
+        player indexes.
+        """
+        player_ids = [player_id for player_id, in self.connection.execute(
+            "SELECT id FROM players WHERE name = ? OR nickname = ?", (player, player))]
+        return f"{column} IN ({', '.join('?' * len(player_ids))})", player_ids
+
+    def preflop_stats(self, since: str = None, until: str = None, player: str = None) -> List[PreflopRow]:
+        """
+        VPIP, PFR and 3-bet counts of every player, or only of `player` (a name from the log or a nickname),
+        over the hands started in [`since`, `until`).
+        """
+        conditions, params = _time_range(since, until)
+        if player is not None:
+            condition, player_params = self._player_condition("hp.player_id", player)
+            conditions.append(condition)
+            params += player_params
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(
+            f"SELECT p.name, COUNT(*), SUM(hp.voluntary), SUM(hp.raised), SUM(hp.three_bet) "
+            f"FROM hand_players hp JOIN hands h ON h.id = hp.hand_id JOIN players p ON p.id = hp.player_id "
+            f"{where} GROUP BY p.id ORDER BY p.name", params)
+        return [PreflopRow(*row) for row in rows]
+
+    def hands(self, player: str, action: str = None, street: str = None, three_bet: bool = False,
+              since: str = None, until: str = None) -> List[HandRow]:
+        """
+        The hands in which `player` made the move `action` (e.g. "raise"), optionally on `street`, or 3-bet,
+        oldest first.
+        """
+        conditions, params = _time_range(since, until)
+        condition, player_params = self._player_condition("a.player_id", player)
+        conditions.append(condition)
+        params += player_params
+        if three_bet:
+            conditions += ["a.street = ?", "a.preflop_raise = 2"]
+            params.append(STREETS[0])
+        if action is not None:
+            conditions.append("a.action = ?")
+            params.append(action)
+        if street is not None:
+            conditions.append("a.street = ?")
+            params.append(street)
+        rows = self.connection.execute(
+            f"SELECT DISTINCT h.id, s.file_name, h.hand_number, h.log_order, h.started_at "
+            f"FROM actions a JOIN hands h ON h.id = a.hand_id "
+            f"JOIN sessions s ON s.id = h.session_id "
+            f"WHERE {' AND '.join(conditions)} ORDER BY h.started_at, h.log_order", params)
+        return [HandRow(*row) for row in rows]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Keeps the hands of many logs in an SQLite database.")
+    arg_parser.add_argument("database", help="Path of the SQLite file, created if it doesn't exist")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Adds the new hands of logs")
+    import_parser.add_argument("log_files", nargs="+", help="Paths to log files from pokernow.club")
+    import_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the logs, without reading or writing the cache of parsed logs.")
+
+    preflop_parser = commands.add_parser("preflop", help="Prints VPIP, PFR and 3-bet of every player")
+    hands_parser = commands.add_parser("hands", help="Lists the hands in which a player made a move")
+    hands_parser.add_argument("player", help="Name from the log, or nickname without the id")
+    hands_parser.add_argument("--action", help='e.g. "raise" or "call (all in)"')
+    hands_parser.add_argument("--street", choices=STREETS)
+    hands_parser.add_argument("--three_bet", action="store_true", help="Only hands in which the player 3-bet")
+    for command_parser in (preflop_parser, hands_parser):
+        command_parser.add_argument("--since", help="ISO date or time, e.g. 2022-07-01")
+        command_parser.add_argument("--until", help="ISO date or time, excluded")
+    args = arg_parser.parse_args()
+
+    with HandDatabase(args.database) as database:
+        if args.command == "import":
+            for file_name in args.log_files:
+                print(f"{file_name}: {database.import_log(file_name, use_cache=not args.no_cache)} new hands")
+        elif args.command == "preflop":
+            print(f"{'player':<32} {'hands':>6} {'VPIP':>7} {'PFR':>7} {'3BET':>7}")
+            for row in database.preflop_stats(args.since, args.until):
+                print(f"{row.player:<32} {row.hands:>6} {row.vpip * 100:6.2f}% {row.pfr * 100:6.2f}% "
+                      f"{row.three_bet * 100:6.2f}%")
+        else:
+            for row in database.hands(args.player, args.action, args.street, args.three_bet, args.since, args.until):
+                print(f"{row.file_name} #{row.hand_number} (order {row.log_order})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Lookup table based evaluation of 5 to 7 card poker hands.
+
+Cards are encoded as integers `rank * 4 + suit` with ranks ordered as in `utilities.CARD_ORDER`. A hand's value is an
+integer that orders hands by strength, higher is better. Evaluation follows the Cactus Kev approach:
+
+ - If five or more cards share a suit, the value is looked up by the 13 bit rank mask of that suit in a table of
+   all 8192 masks (with 7 cards, a flush always beats anything that could be made without it).
+ - Otherwise the value only depends on the multiset of ranks, which is identified by the product of one prime per
+   card rank and looked up among the sorted products of all possible multisets.
+
+`evaluate` handles a single hand, `evaluate_batch` evaluates an array of hands at once with NumPy. The tables are
+built on first use.
+"""
+import itertools
+from typing import Dict, List, Optional, Sequence
+
+from utilities import CARD_ORDER
+
+SUITS = "♠♥♦♣"
+# Alternative spellings of suits
+_SUIT_ALIASES = {"s": 0, "h": 1, "d": 2, "c": 3}
+
+HAND_CATEGORIES = ("High Card", "Pair", "Two Pair", "Three of a Kind", "Straight", "Flush", "Full House",
+                   "Four of a Kind", "Straight Flush")
+HIGH_CARD, PAIR, TWO_PAIR, THREE_OF_A_KIND, STRAIGHT, FLUSH, FULL_HOUSE, FOUR_OF_A_KIND, STRAIGHT_FLUSH = range(9)
+
+# Values of different categories never overlap, since kickers are encoded in base 13 below the category.
+_CATEGORY_SCALE = 13 ** 5
+_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+
+def parse_card(card: str) -> int:
+    """
+    Encodes a card as written in the logs, e.g. "10♦" or "K♠".
+    """
+    rank, suit = card[:-1], card[-1]
+    if rank == "10":
+        rank = "T"
+    suit_index = SUITS.find(suit)
+    if suit_index == -1:
+        suit_index = _SUIT_ALIASES[suit.lower()]
+    return CARD_ORDER.index(rank.upper()) * 4 + suit_index
+
+
+def parse_cards(cards: Sequence[str]) -> List[int]:
+    return [parse_card(card) for card in cards]
+
+
+def card_str(card: int) -> str:
+    rank = CARD_ORDER[card >> 2]
+    return ("10" if rank == "T" else rank) + SUITS[card & 3]
+
+
+def category(value: int) -> int:
+    """One of the HAND_CATEGORIES indices."""
+    return value // _CATEGORY_SCALE
+
+
+def _value(hand_category: int, kickers: Sequence[int]) -> int:
+    value = 0
+    for i in range(5):
+        value = value * 13 + (kickers[i] if i < len(kickers) else 0)
+    return hand_category * _CATEGORY_SCALE + value
+
+
+def _straight_high(rank_mask: int) -> Optional[int]:
+    for high in range(12, 3, -1):
+        straight = 0b11111 << (high - 4)
+        if rank_mask & straight == straight:
+            return high
+    # The wheel, A-2-3-4-5
+    wheel = (1 << 12) | 0b1111
+    if rank_mask & wheel == wheel:
+        return 3
+    return None
+
+
+def _flush_value(rank_mask: int) -> int:
+    high = _straight_high(rank_mask)
+    if high is not None:
+        return _value(STRAIGHT_FLUSH, [high])
+    return _value(FLUSH, [rank for rank in range(12, -1, -1) if rank_mask >> rank & 1][:5])
+
+
+def _rank_multiset_value(counts: Sequence[int]) -> int:
+    present = [rank for rank in range(12, -1, -1) if counts[rank]]
+    # Ranks ordered by how often they occur, then from high to low
+    grouped = sorted(present, key=lambda rank: counts[rank], reverse=True)
+    top, second = grouped[0], grouped[1]
+
+    def kickers(excluded, n):
+        return [rank for rank in present if rank not in excluded][:n]
+
+    if counts[top] == 4:
+        return _value(FOUR_OF_A_KIND, [top] + kickers((top,), 1))
+    if counts[top] == 3 and counts[second] >= 2:
+        return _value(FULL_HOUSE, [top, second])
+    high = _straight_high(sum(1 << rank for rank in present))
+    if high is not None:
+        return _value(STRAIGHT, [high])
+    if counts[top] == 3:
+        return _value(THREE_OF_A_KIND, [top] + kickers((top,), 2))
+    if counts[top] == 2 and counts[second] == 2:
+        return _value(TWO_PAIR, [top, second] + kickers((top, second), 1))
+    if counts[top] == 2:
+        return _value(PAIR, [top] + kickers((top,), 3))
+    return _value(HIGH_CARD, present[:5])
+
+
+class _Tables:
+    def __init__(self):
+        import numpy as np
+
+        self.flush = np.zeros(1 << 13, dtype=np.int64)
+        for rank_mask in range(1 << 13):
+            if bin(rank_mask).count("1") >= 5:
+                self.flush[rank_mask] = _flush_value(rank_mask)
+
+        self.by_prime_product: Dict[int, int] = {}
+        for n_cards in (5, 6, 7):
+            for ranks in itertools.combinations_with_replacement(range(13), n_cards):
+                counts = [0] * 13
+                for rank in ranks:
+                    counts[rank] += 1
+                if max(counts) > 4:
+                    continue
+                product = 1
+                for rank in ranks:
+                    product *= _PRIMES[rank]
+                self.by_prime_product[product] = _rank_multiset_value(counts)
+
+        products = sorted(self.by_prime_product)
+        self.products = np.array(products, dtype=np.int64)
+        self.product_values = np.array([self.by_prime_product[p] for p in products], dtype=np.int64)
+        self.primes = np.array(_PRIMES, dtype=np.int64)
+
+
+_tables: Optional[_Tables] = None
+
+
+def _get_tables() -> _Tables:
+    global _tables
+    if _tables is None:
+        _tables = _Tables()
+    return _tables
+
+
+def evaluate(cards: Sequence[int]) -> int:
+    """
+    The value of the best five card hand among 5 to 7 encoded `cards`.
+    """
+    tables = _get_tables()
+    suit_masks = [0, 0, 0, 0]
+    suit_counts = [0, 0, 0, 0]
+    product = 1
+    for card in cards:
+        rank, suit = card >> 2, card & 3
+        suit_masks[suit] |= 1 << rank
+        suit_counts[suit] += 1
+        product *= _PRIMES[rank]
+    for suit in range(4):
+        if suit_counts[suit] >= 5:
+            return int(tables.flush[suit_masks[suit]])
+    return tables.by_prime_product[product]
+
+
+def evaluate_batch(cards: "numpy.ndarray") -> "numpy.ndarray":
+    """
+    Values of many hands at once. `cards` is an integer array of shape (number of hands, 5 to 7).
+    """
+    import numpy as np
+
+    tables = _get_tables()
+    cards = np.asarray(cards, dtype=np.int64)
+    ranks = cards >> 2
+    suits = cards & 3
+
+    products = tables.primes[ranks].prod(axis=1)
+    values = tables.product_values[np.searchsorted(tables.products, products)]
+
+    suit_counts = np.stack([(suits == suit).sum(axis=1) for suit in range(4)], axis=1)
+    flush_suit = suit_counts.argmax(axis=1)
+    has_flush = suit_counts[np.arange(len(cards)), flush_suit] >= 5
+    if has_flush.any():
+        # Cards of one suit have distinct ranks, so summing their bits is the same as or-ing them.
+        flush_masks = np.where(suits == flush_suit[:, None], 1 << ranks, 0).sum(axis=1)
+        values = np.where(has_flush, tables.flush[flush_masks], values)
+    return values
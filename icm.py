@@ -0,0 +1,250 @@
+"""
+The Independent Chip Model: what the stacks at the table are worth in prize money.
+
+Under the ICM (Malmuth-Harville) a player finishes first with the probability of their share of the chips, and each
+next place is decided the same way among the players left. The equity of a player is their prize for each place
+weighted by the probability of finishing there.
+
+`icm_batch` computes the equities of many hands at once. The exact computation is a recursion over the sets of
+players that took the first places, memoised by set: each set is visited once, for all hands with the same players
+left at once as NumPy vectors, so the Python overhead doesn't grow with the number of hands. Fields with too many sets
+to visit, e.g. 20 players and 10 paid places, are estimated by sampling finishing orders instead.
+
+`evening_icm` gives the equity of every player of a tournament at every hand, from `Evening.historical_amounts`.
+Players who busted hold the places they finished in, the later they busted the better.
+
+    python3 icm.py game.csv --prizes 0.5 0.3 0.2 --start 2000 [--plot]
+"""
+import argparse
+import functools
+import math
+import os
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from series_stats import EveningSummary, TournamentSpec
+from session_cache import map_logs, parse_with_cache
+
+# The most sets of players the exact recursion visits before sampling instead
+MAX_EXACT_STEPS = 200_000
+SAMPLES = 20_000
+
+
+def _exact_steps(n_players: int, n_places: int) -> int:
+    return sum(math.comb(n_players, taken) * (n_players - taken) for taken in range(min(n_places, n_players)))
+
+
+def _icm_exact(stacks: np.ndarray, payouts: np.ndarray) -> np.ndarray:
+    n_hands, n_players = stacks.shape
+    # One contiguous row of hands per player
+    by_player = np.ascontiguousarray(stacks.T)
+    totals = by_player.sum(axis=0)
+    equities = np.zeros((n_players, n_hands))
+    # For each set of players (a bit mask), the probability that they took the first places in any order and
+    # their chips
+    level = {0: (np.ones(n_hands), np.zeros(n_hands))}
+    for place in range(min(len(payouts), n_players)):
+        last = place + 1 == min(len(payouts), n_players)
+        finishes = np.zeros((n_players, n_hands))
+        next_level = {}
+        for mask, (probability, taken) in level.items():
+            remaining = totals - taken
+            # The probability of the set divided by the chips left, 0 once only players without chips are left
+            share = np.divide(probability, remaining, out=np.zeros(n_hands), where=remaining > 0)
+            for player in range(n_players):
+                if mask >> player & 1:
+                    continue
+                finish = share * by_player[player]
+                finishes[player] += finish
+                if not last:
+                    following = mask | 1 << player
+                    if following in next_level:
+                        np.add(next_level[following][0], finish, out=next_level[following][0])
+                    else:
+                        next_level[following] = (finish, taken + by_player[player])
+        equities += payouts[place] * finishes
+        level = next_level
+    return equities.T
+
+
+def _icm_sampled(stacks: np.ndarray, payouts: np.ndarray, samples: int, seed: int) -> np.ndarray:
+    """
+    Estimates by sampling finishing orders: sorting exponential variables divided by the stacks gives an order in
+    which each next place goes to a player with the probability of their share of the remaining chips.
+    """
+    rng = np.random.default_rng(seed)
+    n_hands, n_players = stacks.shape
+    paid = np.zeros(n_players + 1)
+    paid[:min(len(payouts), n_players)] = payouts[:n_players]
+    equities = np.zeros((n_hands, n_players))
+    # Hands in batches of about a million keys
+    batch = max(1, 1_000_000 // (samples * n_players))
+    with np.errstate(divide="ignore"):
+        for start in range(0, n_hands, batch):
+            chunk = stacks[start:start + batch]
+            keys = rng.exponential(size=(len(chunk), samples, n_players)) / chunk[:, None, :]
+            places = keys.argsort(axis=2).argsort(axis=2)
+            # Players without chips never take a place among players with chips
+            places = np.where(chunk[:, None, :] > 0, places, n_players)
+            equities[start:start + batch] = paid[places].mean(axis=1)
+    return equities
+
+
+def icm_batch(stacks: np.ndarray, payouts: Sequence[float], samples: int = SAMPLES,
+              seed: int = 0) -> np.ndarray:
+    """
+    The equity of each player for each row of `stacks` (hands, players), given the prizes `payouts` of the places
+    from first on. Players without chips get nothing, places beyond the number of players with chips aren't paid.
+    Exact unless there are more than MAX_EXACT_STEPS sets of players to visit, then sampled `samples` times.
+    """
+    stacks = np.asarray(stacks, dtype=np.float64).reshape(-1, np.shape(stacks)[-1])
+    payouts = np.asarray(payouts, dtype=np.float64)
+    equities = np.zeros_like(stacks)
+    # Hands with the same players left are computed together, over the columns of those players only
+    groups, group_of_row = np.unique(stacks > 0, axis=0, return_inverse=True)
+    for group, alive in enumerate(groups):
+        rows = np.flatnonzero(group_of_row.ravel() == group)
+        columns = np.flatnonzero(alive)
+        if len(columns) == 0:
+            continue
+        left = stacks[np.ix_(rows, columns)]
+        if _exact_steps(len(columns), len(payouts)) <= MAX_EXACT_STEPS:
+            equities[np.ix_(rows, columns)] = _icm_exact(left, payouts)
+        else:
+            equities[np.ix_(rows, columns)] = _icm_sampled(left, payouts, samples, seed)
+    return equities
+
+
+def icm(stacks: Sequence[float], payouts: Sequence[float]) -> List[float]:
+    """
+    The equity of each player of a single hand, e.g. `icm([5000, 3000, 2000], [700, 300])`.
+    """
+    return icm_batch([stacks], payouts)[0].tolist()
+
+
+class TournamentEquity(NamedTuple):
+    players: List[str]
+    # Shape (hands + 1, players): stacks and equities after each hand, the first row before the first hand
+    stacks: np.ndarray
+    equities: np.ndarray
+
+
+def _stack_history(historical_amounts) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    The stacks of every player after each hand, and whether they had joined yet. A player's stack stays the last
+    one recorded for them.
+    """
+    players = list(historical_amounts)
+    # Entries are in the order of the rounds
+    n_rows = max((amounts[-1][0] for amounts in historical_amounts.values() if amounts), default=0) + 1
+    stacks = np.zeros((n_rows, len(players)))
+    joined = np.zeros((n_rows, len(players)), dtype=bool)
+    for column, player in enumerate(players):
+        if not historical_amounts[player]:
+            continue
+        round_numbers, amounts = np.array(historical_amounts[player], dtype=np.float64).T
+        # The index of the last entry at or before each row
+        latest = np.searchsorted(round_numbers, np.arange(n_rows), side="right") - 1
+        joined[:, column] = latest >= 0
+        stacks[:, column] = np.where(latest >= 0, amounts[np.maximum(latest, 0)], 0)
+    return players, stacks, joined
+
+
+def _busted_places(stacks: np.ndarray, joined: np.ndarray) -> np.ndarray:
+    """
+    For every row and player who busted, the place they hold (0 for first), else -1. A player busts in the row
+    their stack drops to 0 and holds a better place the later that was, then the more chips they had before. A
+    rebuy puts them back in the game.
+    """
+    n_rows, n_players = stacks.shape
+    busted = joined & (stacks == 0)
+    before = np.vstack([np.zeros((1, n_players)), stacks[:-1]])
+    busts = busted & ~np.vstack([np.zeros((1, n_players), dtype=bool), busted[:-1]])
+    rows = np.arange(n_rows)[:, None]
+    # The row of the latest bust and the stack before it, carried forward
+    bust_row = np.maximum.accumulate(np.where(busts, rows, -1), axis=0)
+    before_bust = before[np.maximum(bust_row, 0), np.arange(n_players)]
+    key = np.where(busted, bust_row + before_bust / (before_bust.max(initial=0) + 1), -np.inf)
+    # Busted players best first, then everyone else
+    order = np.argsort(-key, axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(n_players)[None, :].repeat(n_rows, axis=0), axis=1)
+    alive = (joined & (stacks > 0)).sum(axis=1, keepdims=True)
+    return np.where(busted, alive + rank, -1)
+
+
+def evening_icm(evening, spec: TournamentSpec) -> TournamentEquity:
+    """
+    The equity of every player of the tournament `evening` (an `Evening` or `EveningSummary`) after every hand,
+    paid like `SeriesStats.calc_stats`: the prize pool is the start amount of every player who played.
+    """
+    players, stacks, joined = _stack_history(evening.historical_amounts)
+    total_pot = spec.start_amount * len(players)
+    payouts = np.array([int(spec.prize_fraction_for_position(pos) * total_pot)
+                        for pos in range(1, len(players) + 1)], dtype=np.float64)
+    equities = icm_batch(np.where(joined, stacks, 0), payouts)
+    places = _busted_places(stacks, joined)
+    equities += np.where(places >= 0, payouts[np.clip(places, 0, len(payouts) - 1)], 0)
+    return TournamentEquity(players, stacks, equities)
+
+
+def plot_equity(equity: TournamentEquity, output=None):
+    """
+    Plots the equity of every player over the hands, and writes the plot to `output` if given instead of showing it.
+    """
+    from plotting import downsample, pixel_width, pyplot, show_or_save
+
+    plt = pyplot(output)
+    fig, ax = plt.subplots(1)
+    width = pixel_width(fig)
+    hands = np.arange(len(equity.equities))
+    for column, player in enumerate(equity.players):
+        ax.plot(*downsample(hands, equity.equities[:, column], width), label=player.split("@")[0].strip())
+    ax.set_xlabel("Round #")
+    ax.set_ylabel("ICM equity")
+    ax.legend()
+    show_or_save(plt, fig, output)
+
+
+def equity_of_log(file_name, spec: TournamentSpec, use_cache=True) -> TournamentEquity:
+    from log_processor import Parser
+
+    evening = parse_with_cache(Parser(ignore_warnings=False), "", file_name, use_cache)
+    return evening_icm(EveningSummary.of(evening), spec)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prints the ICM equity of every player of tournaments.")
+    arg_parser.add_argument("log_files", nargs="+", help="Paths to log files from pokernow.club, one per tournament")
+    arg_parser.add_argument("--prizes", type=float, nargs="+", default=[0.7, 0.3], help="Fractions of the prize pool paid to 1st, 2nd, ... place.")
+    arg_parser.add_argument("--start", type=float, default=2000, help="Amount every player paid to enter.")
+    arg_parser.add_argument("--hand", type=int, help="Prints the equities after this hand instead of before the last one.")
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the logs, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing logs in parallel.")
+    arg_parser.add_argument("--plot", action="store_true", help="Plots the equities over the hands of each log.")
+    arg_parser.add_argument("--output", help="Writes the plot to this file instead of showing it, with the log's number added for several logs.")
+    args = arg_parser.parse_args()
+
+    spec = TournamentSpec({place: fraction for place, fraction in enumerate(args.prizes, 1)}, args.start)
+    worker = functools.partial(equity_of_log, spec=spec, use_cache=not args.no_cache)
+    results = map_logs(worker, args.log_files, args.jobs)
+    for number, (file_name, equity) in enumerate(zip(args.log_files, results)):
+        # The last row is after the tournament is decided
+        row = args.hand if args.hand is not None else max(len(equity.equities) - 2, 0)
+        row = min(row, len(equity.equities) - 1)
+        print(f"{file_name} after hand {row}:")
+        for column in equity.equities[row].argsort()[::-1]:
+            print(f"{equity.players[column]:>32s}: {equity.stacks[row, column]:>8.0f} chips "
+                  f"{equity.equities[row, column]:>10.1f}")
+        print()
+        if args.plot or args.output:
+            output_file = args.output
+            if output_file is not None and len(args.log_files) > 1:
+                root, extension = os.path.splitext(output_file)
+                output_file = f"{root}_{number}{extension}"
+            plot_equity(equity, output_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Classification of single Pokernow.club log lines into typed events.
+
+Every pattern is compiled once at import time. Instead of testing a line against every known pattern in turn,
+`classify_line` picks a small set of candidate rules using a cheap key (the first word of the line, or the verb
+following the quoted player name for player actions) and only falls back to the full, ordered rule list when none
+of the candidates match. The full rule list preserves the precedence of the original if/elif chain.
+"""
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+
+class Ignored(NamedTuple):
+    """A line that is understood but carries no information we track."""
+
+
+class PlayerJoined(NamedTuple):
+    player: str
+    amount: int
+
+
+class PlayerQuit(NamedTuple):
+    player: str
+    # The stack they left the table with
+    amount: int
+
+
+class PlayerStacks(NamedTuple):
+    stacks: Dict[str, int]
+    # The seat number of each player
+    seats: Dict[str, int]
+
+
+class StartingHand(NamedTuple):
+    dealer: str
+    # The number of the hand in the log, which counts from 1
+    hand_number: int
+
+
+class EndingHand(NamedTuple):
+    pass
+
+
+class HoleCards(NamedTuple):
+    cards: List[str]
+
+
+class Shows(NamedTuple):
+    player: str
+    cards: List[str]
+
+
+class Move(NamedTuple):
+    player: str
+    action_name: str
+    amount: int
+
+
+class Board(NamedTuple):
+    # One of "flop", "turn", "river", "second_turn", "second_river"
+    street: str
+    # A list of cards for the flop, a single card otherwise
+    cards: Union[str, List[str]]
+
+
+class Collected(NamedTuple):
+    player: str
+    # None when the pot was won without a showdown
+    hand: Optional[List[str]]
+    amount: int
+
+
+class Unknown(NamedTuple):
+    line: str
+
+
+IGNORED = Ignored()
+ENDING_HAND = EndingHand()
+
+Rule = Callable[[str, str], Optional[tuple]]
+
+
+def _ignore_if_contains(*phrases) -> Rule:
+    def rule(line, normline):
+        for phrase in phrases:
+            if phrase in line:
+                return IGNORED
+        return None
+    return rule
+
+
+def _move_from_regex(pattern, action_name) -> Rule:
+    regex = re.compile(pattern)
+
+    def rule(line, normline):
+        match = regex.search(line)
+        if match is None:
+            return None
+        return Move(match.group(1), action_name, int(match.group(2)))
+    return rule
+
+
+def _move_from_suffix(phrase, action_name, amount_from_last_word) -> Rule:
+    # Lines of the form: "<player>" <phrase> [amount]
+    def rule(line, normline):
+        if phrase not in line:
+            return None
+        amount = int(line.split()[-1]) if amount_from_last_word else 0
+        return Move(line.split('"')[1], action_name, amount)
+    return rule
+
+
+def _player_joined(line, normline):
+    if "created the game with a stack of" in line or "The admin approved" in line \
+            or "joined the game with a stack" in line:
+        return PlayerJoined(line.split('"')[1], int(line.split()[-1][:-1]))
+    return None
+
+
+def _player_quit(line, normline):
+    if "quits the game with a stack of" in line:
+        return PlayerQuit(line.split('"')[1], int(line.split()[-1][:-1]))
+    return None
+
+
+def _entry_header(line, normline):
+    return IGNORED if line == "entry" else None
+
+
+def _undealt_cards(line, normline):
+    return IGNORED if line.startswith("Undealt cards:") else None
+
+
+_ANTE_CHANGED = re.compile(r"The game's ante was changed from (\d+) to (\d+).")
+_FORCED_AWAY = re.compile('The admin "(.*)" forced the player ".*" to away mode in the next hand.')
+_UNCALLED_BET = re.compile(r'Uncalled bet of (\d+) returned to "(.*)"')
+
+
+def _ante_changed(line, normline):
+    return IGNORED if _ANTE_CHANGED.search(line) else None
+
+
+def _dead_blind(line, normline):
+    return IGNORED if "dead small blind" in normline or "dead big blind" in normline else None
+
+
+def _forced_away(line, normline):
+    return IGNORED if _FORCED_AWAY.search(line) else None
+
+
+def _uncalled_bet(line, normline):
+    if "uncalled bet" not in normline:
+        return None
+    for amount, player_name in _UNCALLED_BET.findall(line):
+        return Move(player_name, "uncalled_bet", int(amount))
+    return IGNORED
+
+
+def _run_it_twice(line, normline):
+    return IGNORED if "run it twice" in line else None
+
+
+def _player_stacks(line, normline):
+    if not line.startswith("Player stacks:"):
+        return None
+    entries = line[len("Player stacks: "):].split(" | ")
+    stack_sizes = [x.strip().rsplit(' ', 1)[1] for x in entries]
+    stack_size_counts = [int(x.strip('()')) for x in stack_sizes]
+    players = [x.split('"')[1] for x in entries]
+    seats = [int(x.split(' ', 1)[0].lstrip('#')) for x in entries]
+    return PlayerStacks({player: stack_size for (player, stack_size) in zip(players, stack_size_counts)},
+                        dict(zip(players, seats)))
+
+
+def _starting_hand(line, normline):
+    if "-- starting hand" not in line:
+        return None
+    hand_number = int(line[line.index("#") + 1:].split(" ", 1)[0])
+    if "dead button" in line:
+        return StartingHand("None", hand_number)
+    return StartingHand(line.split('"')[1], hand_number)
+
+
+def _hole_cards(line, normline):
+    if not line.startswith("Your hand is "):
+        return None
+    return HoleCards(line[len("Your hand is "):].split(", "))
+
+
+def _shows(line, normline):
+    if " shows a " not in line:
+        return None
+    assert line.endswith('.')
+    return Shows(line.split('"')[1], line.split(" shows a ")[1][:-1].split(", "))
+
+
+def _board(prefix, street) -> Rule:
+    def rule(line, normline):
+        if not normline.startswith(prefix):
+            return None
+        card_string = line.split('[')[1].split(']')[0]
+        if street == "flop":
+            return Board(street, card_string.split(', '))
+        return Board(street, card_string)
+    return rule
+
+
+_COLLECTED = re.compile(r'"(.*)" collected (\d+) from pot$')
+_COLLECTED_WITH_HAND = re.compile(r'"(.*)" collected (\d+) from pot with .* \(combination: (.*)\)')
+
+
+def _collected(line, normline):
+    match = _COLLECTED.search(line)
+    if match is not None:
+        return Collected(match.group(1), None, int(match.group(2)))
+    return None
+
+
+def _collected_with_hand(line, normline):
+    match = _COLLECTED_WITH_HAND.search(line)
+    if match is not None:
+        return Collected(match.group(1), match.group(3).split(", "), int(match.group(2)))
+    return None
+
+
+def _collected_fallback(line, normline):
+    # obsoleted and covered by the previous case?
+    if " collected " not in line:
+        return None
+    return Collected(line.split('"')[1], None, int(line.split()[-1]))
+
+
+def _wins(line, normline):
+    # obsoleted?
+    if " wins " not in line:
+        return None
+    winner_name, rest = line.split('"')[1:]
+    amount = int(rest.split()[1])
+    assert rest.endswith(')')
+    return Collected(winner_name, rest.split("hand: ")[1][:-1].split(", "), amount)
+
+
+def _ending_hand(line, normline):
+    return ENDING_HAND if "-- ending hand" in line else None
+
+
+# The full rule list, in order of precedence.
+_RULES: Dict[str, Rule] = {
+    "player_joined": _player_joined,
+    "player_quit": _player_quit,
+    "entry": _entry_header,
+    "undealt_cards": _undealt_cards,
+    "noop_phrases": _ignore_if_contains(
+        "requested a seat",
+        "canceled the seat request",
+        "rejected the seat request",
+        "changed the ID from",
+        "stand up with the stack",
+        "sit back with the stack",
+        "joined the game with a stack of",
+        "passed the room ownership",
+        "queued the stack change for the player",
+        "enqueued the removal of the player ",
+        "updated the player",
+        "small blind was changed from",
+        "big blind was changed from",
+    ),
+    "ante_changed": _ante_changed,
+    "dead_blind": _dead_blind,
+    "forced_away": _forced_away,
+    "uncalled_bet": _uncalled_bet,
+    "run_it_twice": _run_it_twice,
+    "player_stacks": _player_stacks,
+    "starting_hand": _starting_hand,
+    "hole_cards": _hole_cards,
+    "shows": _shows,
+    "missing_small_blind": _move_from_suffix("posts a missing small blind of", "missing_small_blind", True),
+    "small_blind": _move_from_suffix("posts a small blind of", "small_blind", True),
+    "missing_big_blind": _move_from_suffix("posts a missed big blind of", "missing_big_blind", True),
+    "big_blind": _move_from_regex(r'"(.*)" posts a big blind of (\d+)', "big_blind"),
+    "straddle": _move_from_regex(r'"(.*)" posts a straddle of (\d+)', "straddle"),
+    "fold": lambda line, normline: Move(line.split('"')[1], "fold", 0) if line.endswith("folds") else None,
+    "check": lambda line, normline: Move(line.split('"')[1], "check", 0) if line.endswith("checks") else None,
+    "call": _move_from_regex(r'"(.*)" calls (\d+)$', "call"),
+    "call_all_in": _move_from_regex(r'"(.*)" calls (\d+) and go all ', "call (all in)"),
+    "raise": _move_from_regex(r'"(.*)" raises to (\d+)$', "raise"),
+    "raise_all_in": _move_from_regex(r'"(.*)" raises to (\d+) and go all ', "raise (all in)"),
+    # TODO: This is the first bet in a round, should be treated differently
+    "bet": _move_from_regex(r'"(.*)" bets (\d+)$', "raise"),
+    "bet_all_in": _move_from_regex(r'"(.*)" bets (\d+) and go all ', "raise (all in)"),
+    "raise_all_in_old": _move_from_suffix("raises and all in with", "raise (all in)", True),
+    "flop": _board("flop", "flop"),
+    "second_turn": _board("turn (second run):", "second_turn"),
+    "second_river": _board("river (second run):", "second_river"),
+    "turn": _board("turn:", "turn"),
+    "river": _board("river:", "river"),
+    "collected": _collected,
+    "collected_with_hand": _collected_with_hand,
+    "collected_fallback": _collected_fallback,
+    "wins": _wins,
+    "ending_hand": _ending_hand,
+}
+
+_ORDER = list(_RULES)
+_ALL_RULES = list(_RULES.values())
+
+
+def _candidates(*names) -> List[Rule]:
+    # Candidates are always tried in the order of precedence of the full rule list.
+    return [_RULES[name] for name in sorted(names, key=_ORDER.index)]
+
+
+# Candidate rules for lines starting with a quoted player name, keyed by the word following the name.
+_PLAYER_VERB_RULES: Dict[str, List[Rule]] = {
+    "folds": _candidates("fold"),
+    "checks": _candidates("check"),
+    "calls": _candidates("call", "call_all_in"),
+    "bets": _candidates("bet", "bet_all_in"),
+    "raises": _candidates("raise", "raise_all_in", "raise_all_in_old"),
+    "posts": _candidates("missing_small_blind", "small_blind", "missing_big_blind", "big_blind", "straddle"),
+    "shows": _candidates("shows"),
+    "collected": _candidates("collected", "collected_with_hand", "collected_fallback"),
+    "wins": _candidates("wins"),
+}
+
+# Candidate rules for all other lines, keyed by their first word.
+_FIRST_WORD_RULES: Dict[str, List[Rule]] = {
+    "--": _candidates("starting_hand", "ending_hand"),
+    "Your": _candidates("hole_cards"),
+    "Uncalled": _candidates("uncalled_bet"),
+    "Player": _candidates("player_stacks"),
+    "Flop:": _candidates("flop"),
+    "Flop": _candidates("flop"),
+    "Turn:": _candidates("turn"),
+    "Turn": _candidates("second_turn", "turn"),
+    "River:": _candidates("river"),
+    "River": _candidates("second_river", "river"),
+}
+
+
+def _candidate_rules(line) -> Optional[List[Rule]]:
+    if line.startswith('"'):
+        name_end = line.find('" ', 1)
+        if name_end == -1:
+            return None
+        verb_start = name_end + 2
+        verb_end = line.find(' ', verb_start)
+        return _PLAYER_VERB_RULES.get(line[verb_start:] if verb_end == -1 else line[verb_start:verb_end])
+    first_word_end = line.find(' ')
+    return _FIRST_WORD_RULES.get(line if first_word_end == -1 else line[:first_word_end])
+
+
+def classify_line(line: str) -> tuple:
+    """
+    Turns a single log line into one of the event types defined in this module.
+    Lines that are not understood are returned as `Unknown`.
+    """
+    normline = line.lower()
+    candidates = _candidate_rules(line)
+    if candidates is not None:
+        for rule in candidates:
+            event = rule(line, normline)
+            if event is not None:
+                return event
+    for rule in _ALL_RULES:
+        event = rule(line, normline)
+        if event is not None:
+            return event
+    return Unknown(line)
@@ -0,0 +1,99 @@
+"""
+Incremental processing of a live Pokernow.club game.
+
+The log of a running game is either a single file that keeps being re-downloaded, or a directory the re-downloads
+are saved into. `LogFollower` remembers the `order` of the last row it has parsed and on every refresh only parses
+the rows after it, adding the hands finished since the previous refresh to the running stats. A log whose order or
+hand numbers go backwards, a new game or a log that starts over, starts a new evening: the stats are reset and the
+log is parsed from its first row.
+"""
+import time
+
+from line_classifier import classify_line, StartingHand
+from log_reader import latest_log, newest_order, row_order, rows_after
+from player_stats import WinStats, PlayStats, PreFlopStats
+from stats_engine import StatsEngine
+
+
+class LogFollower:
+    def __init__(self, path, parser, username=""):
+        self.path = path
+        self.parser = parser
+        self.username = username
+        self._start_evening()
+
+    def _start_evening(self):
+        """
+        Starts an empty evening with empty stats, before the first refresh and whenever the log starts over.
+        """
+        self.evening = self.parser.start_evening(self.username)
+        # Order of the last row that was parsed
+        self.high_water_mark = -1
+        # Number of rounds of the evening already added to the stats
+        self._rounds_counted = 0
+
+        self.win_stats = WinStats(self.evening)
+        self.play_stats = PlayStats(self.evening, self.win_stats)
+        self.preflop_stats = PreFlopStats(self.evening, self.play_stats)
+        self.stats_engine = StatsEngine([self.win_stats, self.play_stats, self.preflop_stats])
+
+    def refresh(self) -> int:
+        """
+        Parses the rows added to the log since the last refresh and updates the stats with every round that has
+        finished since. Returns the number of newly finished rounds.
+        """
+        log = latest_log(self.path)
+        new_rows = rows_after(log, self.high_water_mark)
+        if self._restarted(log, new_rows):
+            self._start_evening()
+            new_rows = rows_after(log, self.high_water_mark)
+        self.parser.parse_rows(new_rows)
+        if new_rows:
+            self.high_water_mark = row_order(new_rows[-1])
+
+        new_rounds = 0
+        for round in self.evening.rounds[self._rounds_counted:]:
+            if not round.finished:
+                break
+            if round.total_money_in_round():
+                self.stats_engine.add_round(round)
+            new_rounds += 1
+        self._rounds_counted += new_rounds
+        return new_rounds
+
+    def _restarted(self, log, new_rows) -> bool:
+        """
+        Whether `log` no longer continues the rows parsed so far: its newest row is older than the high water
+        mark, or the first hand of `new_rows` doesn't come after the last hand parsed.
+        """
+        if self.high_water_mark == -1:
+            return False
+        if not new_rows:
+            return newest_order(log) < self.high_water_mark
+        last_hand = next((round.hand_number for round in reversed(self.evening.rounds)
+                          if round.hand_number is not None), None)
+        if last_hand is None:
+            return False
+        for row in new_rows:
+            if row[0].startswith("-- starting hand"):
+                event = classify_line(row[0])
+                return isinstance(event, StartingHand) and event.hand_number <= last_hand
+        return False
+
+    def print(self):
+        self.play_stats.print()
+        self.win_stats.print()
+        self.preflop_stats.print()
+
+    def run(self, interval):
+        """
+        Refreshes every `interval` seconds and prints the stats whenever new rounds have finished,
+        until interrupted.
+        """
+        try:
+            while True:
+                if self.refresh():
+                    self.print()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,520 @@
+"""
+Generator of synthetic Pokernow.club logs, for benchmarks and for trying the parser on games bigger than the
+bundled log.
+
+`LogGenerator` plays No Limit Texas Hold'em hands between simple random players and writes the log Pokernow.club
+would have produced: newest row first, with the same line formats, time stamps and order column. Side pots, uncalled
+bets and dead blinds are settled like on Pokernow.club, so the stacks of the parsed evening match the "Player stacks"
+lines. Straddles, run-it-twice, missing blinds, rebuys and players standing up and sitting back can each be tuned or
+turned off. The same seed always produces the same log.
+"""
+import argparse
+import csv
+import datetime
+import itertools
+import random
+import shutil
+import string
+import tempfile
+from typing import Dict, List, NamedTuple, Optional
+
+from hand_evaluator import HAND_CATEGORIES, card_str, category, evaluate
+
+START_TIME = datetime.datetime(2022, 7, 21, 21, 0, tzinfo=datetime.timezone.utc)
+MAX_SEATS = 10
+
+_NAMES = ("Alice", "Big Bob", "carol#3060", "Dave_99", "Eve", "Frank T", "Grace", "heidi.k", "Ivan", "Judy",
+          "Mallory", "Niaj", "Olivia", "Peggy", "Rupert", "Sybil", "Trent", "Victor", "Walter", "Xena")
+_ID_CHARS = string.ascii_letters + string.digits + "-_"
+
+
+class GeneratedLog(NamedTuple):
+    hands: int
+    # Rows written, not counting the header
+    lines: int
+
+
+class _Player:
+    def __init__(self, name: str, seat: int, stack: int):
+        self.name = name
+        self.seat = seat
+        self.stack = stack
+        # One of "playing", "away" (stood up) or "out" (quit the game)
+        self.state = "playing"
+        # Missing blinds to post when sitting back in
+        self.owes_blinds = False
+
+
+class _Hand:
+    """
+    The state of the players of a single hand. `players` are in seat order starting left of the dealer.
+    """
+    def __init__(self, players: List[_Player]):
+        self.players = players
+        self.hole_cards: Dict[str, List[int]] = {}
+        self.folded = set()
+        # Chips put in the pot over the whole hand, including dead blinds
+        self.contributed = {p.name: 0 for p in players}
+        # Live bets of the current street
+        self.street_bets = {p.name: 0 for p in players}
+        self.board: List[int] = []
+
+    def in_hand(self) -> List[_Player]:
+        return [p for p in self.players if p.name not in self.folded]
+
+    def can_act(self) -> List[_Player]:
+        return [p for p in self.in_hand() if p.stack > 0]
+
+    def pot(self) -> int:
+        return sum(self.contributed.values())
+
+
+class _ReversedRows:
+    """
+    Pokernow.club logs list the newest row first. Rows are collected in chronological order in chunks, each chunk is
+    written reversed to a temporary file, and the chunks are copied to the log last to first, so writing huge logs
+    takes little memory.
+    """
+    def __init__(self, chunk_rows: int = 50000):
+        self.chunk_rows = chunk_rows
+        self.n_rows = 0
+        self._rows = []
+        self._chunks = []
+
+    def append(self, row):
+        self._rows.append(row)
+        self.n_rows += 1
+        if len(self._rows) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        chunk = tempfile.TemporaryFile("w+", encoding="utf-8", newline="")
+        csv.writer(chunk, lineterminator="\n").writerows(reversed(self._rows))
+        self._chunks.append(chunk)
+        self._rows = []
+
+    def write(self, f):
+        self._flush()
+        f.write("entry,at,order\n")
+        for chunk in reversed(self._chunks):
+            chunk.seek(0)
+            shutil.copyfileobj(chunk, f)
+            chunk.close()
+        self._chunks = []
+
+
+class LogGenerator:
+    def __init__(self, players: int = 8, seed: int = 0, small_blind: int = 10, big_blind: int = 20,
+                 starting_stack: int = 1000, straddle_rate: float = 0.1, run_it_twice_rate: float = 0.5,
+                 missing_blinds: bool = True, rebuy_rate: float = 0.5, seat_change_rate: float = 0.02,
+                 decision_seconds: float = 6.0):
+        """
+        `players` are seated at the start. Every hand, the player under the gun straddles with `straddle_rate`.
+        When all but one player are all in before the river, the board is run twice with `run_it_twice_rate`.
+        A busted player buys in again with `rebuy_rate`, otherwise they quit. Between hands, each player stands up
+        or sits back in with `seat_change_rate`, and with `missing_blinds` a player sitting back in posts the blinds
+        they missed. Players take `decision_seconds` on average to act.
+        """
+        if not 2 <= players <= MAX_SEATS:
+            raise ValueError(f"players must be between 2 and {MAX_SEATS}")
+        self.n_players = players
+        self.seed = seed
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.starting_stack = starting_stack
+        self.straddle_rate = straddle_rate
+        self.run_it_twice_rate = run_it_twice_rate
+        self.missing_blinds = missing_blinds
+        self.rebuy_rate = rebuy_rate
+        self.seat_change_rate = seat_change_rate
+        self.decision_seconds = decision_seconds
+
+    def write(self, file_name, hands: Optional[int] = None, lines: Optional[int] = None) -> GeneratedLog:
+        """
+        Writes a log of `hands` hands, or of as many hands as it takes to write at least `lines` rows, to
+        `file_name`. Fewer hands are played if only one player is left with chips and nobody can join.
+        """
+        if hands is None and lines is None:
+            raise ValueError("either hands or lines must be given")
+        self._rng = random.Random(self.seed)
+        self._rows = _ReversedRows()
+        self._millis = int(START_TIME.timestamp() * 1000)
+        self._last_millis = None
+        self._same_millis = 0
+        self._players: List[_Player] = []
+        self._dealer_seat = 0
+        self._hand_number = 0
+        # Lines of players joining and leaving between hands, which Pokernow.club logs after the next
+        # "-- starting hand" line
+        self._queued = None
+
+        self._log_start()
+        while (hands is None or self._hand_number < hands) and (lines is None or self._rows.n_rows < lines):
+            if not self._between_hands():
+                break
+            self._play_hand()
+
+        with open(file_name, "w", encoding="utf-8", newline="") as f:
+            self._rows.write(f)
+        return GeneratedLog(self._hand_number, self._rows.n_rows)
+
+    # Log rows
+
+    def _emit(self, line: str):
+        if self._queued is not None:
+            self._queued.append(line)
+            return
+        millis = self._millis
+        if millis == self._last_millis:
+            self._same_millis += 1
+            if self._same_millis == 100:
+                # The order column only has room for 100 rows per millisecond
+                self._millis = millis = millis + 1
+                self._same_millis = 0
+        else:
+            self._same_millis = 0
+        if millis != self._last_millis:
+            self._last_millis = millis
+            time = datetime.datetime.fromtimestamp(millis / 1000, datetime.timezone.utc)
+            self._time_stamp = time.strftime("%Y-%m-%dT%H:%M:%S.") + f"{millis % 1000:03d}Z"
+        self._rows.append((line, self._time_stamp, str(millis * 100 + self._same_millis)))
+
+    def _wait(self, mean_seconds: float):
+        self._millis += 1 + int(self._rng.expovariate(1 / mean_seconds) * 1000)
+
+    def _player_line(self, player: _Player, text: str):
+        self._emit(f'"{player.name}" {text}')
+
+    # Players coming and going
+
+    def _new_player(self) -> Optional[_Player]:
+        """
+        A player taking a free seat. Once twice as many players as there are seats at the start have played,
+        players who quit earlier come back instead of new ones.
+        """
+        taken = {p.seat for p in self._players if p.state != "out"}
+        free = [seat for seat in range(1, MAX_SEATS + 1) if seat not in taken]
+        if not free:
+            return None
+        returning = [p for p in self._players if p.state == "out"]
+        if len(self._players) >= 2 * self.n_players and returning:
+            player = self._rng.choice(returning)
+            player.seat = free[0]
+            player.owes_blinds = False
+            return player
+        base_name = _NAMES[len(self._players) % len(_NAMES)]
+        player_id = "".join(self._rng.choice(_ID_CHARS) for _ in range(10))
+        player = _Player(f"{base_name} @ {player_id}", free[0], self.starting_stack)
+        self._players.append(player)
+        return player
+
+    def _log_start(self):
+        for _ in range(self.n_players):
+            player = self._new_player()
+            self._emit(f'The player "{player.name}" joined the game with a stack of {player.stack}.')
+        # Our own hole cards are shown for the first player
+        self._hero = self._players[0]
+
+    def _buy_in(self, player: _Player):
+        self._emit(f'The player "{player.name}" requested a seat.')
+        player.stack = self.starting_stack
+        player.state = "playing"
+        self._emit(f'The admin approved the player "{player.name}" participation with a stack of {player.stack}.')
+
+    def _between_hands(self) -> bool:
+        """
+        Rebuys, quits and seat changes before the next hand. False if fewer than two players are left.
+        """
+        rng = self._rng
+        self._wait(2)
+        self._queued = []
+        for player in self._players:
+            if player.state == "playing" and player.stack == 0:
+                self._emit(f'The player "{player.name}" quits the game with a stack of 0.')
+                player.state = "out"
+                if rng.random() < self.rebuy_rate:
+                    self._buy_in(player)
+            elif player.state == "playing" and player is not self._hero and rng.random() < self.seat_change_rate:
+                self._emit(f'The player "{player.name}" stand up with the stack of {player.stack}.')
+                player.state = "away"
+            elif player.state == "away" and rng.random() < self.seat_change_rate * 5:
+                self._emit(f'The player "{player.name}" sit back with the stack of {player.stack}.')
+                player.state = "playing"
+                player.owes_blinds = self.missing_blinds
+
+        playing = [p for p in self._players if p.state == "playing"]
+        # Empty seats are taken by new players, right away if the game could not go on otherwise
+        while len(playing) < self.n_players and self.seat_change_rate > 0 \
+                and (len(playing) < 2 or rng.random() < self.seat_change_rate * 5):
+            player = self._new_player()
+            if player is None:
+                break
+            self._buy_in(player)
+            playing.append(player)
+        return len(playing) >= 2
+
+    # Playing a hand
+
+    def _play_hand(self):
+        rng = self._rng
+        self._hand_number += 1
+        seated = sorted((p for p in self._players if p.state == "playing"), key=lambda p: p.seat)
+        dealer = next((p for p in seated if p.seat > self._dealer_seat), seated[0])
+        self._dealer_seat = dealer.seat
+        dealer_index = seated.index(dealer)
+        hand = _Hand(seated[dealer_index + 1:] + seated[:dealer_index + 1])
+
+        queued, self._queued = self._queued, None
+        self._emit(f'-- starting hand #{self._hand_number}  (No Limit Texas Hold\'em) (dealer: "{dealer.name}") --')
+        for line in queued:
+            self._emit(line)
+        self._emit("Player stacks: " + " | ".join(f'#{p.seat} "{p.name}" ({p.stack})' for p in seated))
+
+        deck = list(range(52))
+        rng.shuffle(deck)
+        for player in hand.players:
+            hand.hole_cards[player.name] = [deck.pop(), deck.pop()]
+        if self._hero in hand.players:
+            self._emit("Your hand is " + ", ".join(card_str(c) for c in hand.hole_cards[self._hero.name]))
+
+        current_bet, first_to_act = self._post_blinds(hand)
+        self._betting_round(hand, first_to_act, current_bet)
+        streets = (("Flop", 3), ("Turn", 1), ("River", 1))
+        for street_index, (street, n_cards) in enumerate(streets):
+            if len(hand.in_hand()) == 1:
+                break
+            if len(hand.can_act()) < 2:
+                # Nobody can bet anymore, the board is run out
+                self._run_out(hand, deck, streets[street_index:])
+                break
+            self._wait(1)
+            self._deal(hand, deck, street, n_cards)
+            self._betting_round(hand, hand.players, 0)
+        else:
+            if len(hand.in_hand()) > 1:
+                self._showdown(hand)
+                self._award(hand, [hand.board])
+        if len(hand.in_hand()) == 1:
+            winner = hand.in_hand()[0]
+            self._player_line(winner, f"collected {hand.pot()} from pot")
+            winner.stack += hand.pot()
+        self._emit(f"-- ending hand #{self._hand_number} --")
+
+    def _post(self, hand: _Hand, player: _Player, text: str, amount: int, live=True):
+        self._player_line(player, f"posts a {text} of {amount}")
+        player.stack -= amount
+        hand.contributed[player.name] += amount
+        if live:
+            hand.street_bets[player.name] = amount
+
+    def _post_blinds(self, hand: _Hand):
+        """
+        Posts the blinds, a straddle and missing blinds. Returns the bet to call and the players in the order
+        they act preflop.
+        """
+        players = hand.players
+        if len(players) == 2:
+            # Heads up, the dealer posts the small blind
+            small, big = players[1], players[0]
+        else:
+            small, big = players[0], players[1]
+        self._post(hand, small, "small blind", min(self.small_blind, small.stack - 1))
+        self._post(hand, big, "big blind", min(self.big_blind, big.stack - 1))
+        current_bet = self.big_blind
+        last_forced = players.index(big)
+
+        straddler = players[2] if len(players) > 3 else None
+        if straddler is not None and self._rng.random() < self.straddle_rate \
+                and straddler.stack > 4 * self.big_blind:
+            current_bet = 2 * self.big_blind
+            self._post(hand, straddler, "straddle", current_bet)
+            straddler.owes_blinds = False
+            last_forced = 2
+
+        for player in players:
+            if not player.owes_blinds:
+                continue
+            player.owes_blinds = False
+            if player in (small, big) or player.stack <= self.small_blind + self.big_blind:
+                continue
+            # The missed small blind is dead, the missed big blind is live
+            self._post(hand, player, "missing small blind", self.small_blind, live=False)
+            self._post(hand, player, "missed big blind", self.big_blind)
+        return current_bet, players[last_forced + 1:] + players[:last_forced + 1]
+
+    def _strength(self, hand: _Hand, player: _Player) -> float:
+        """
+        A rough 0 to 1 guess of how good the hand of `player` is.
+        """
+        cards = hand.hole_cards[player.name]
+        if not hand.board:
+            high, low = sorted((cards[0] >> 2, cards[1] >> 2), reverse=True)
+            strength = (high + low) / 40 + (0.35 if high == low else 0) + (0.05 if cards[0] & 3 == cards[1] & 3 else 0)
+            return min(strength, 1.0)
+        return min((category(evaluate(cards + hand.board)) + 1) / 5, 1.0)
+
+    def _betting_round(self, hand: _Hand, order: List[_Player], current_bet: int):
+        rng = self._rng
+        min_raise = max(current_bet, self.big_blind)
+        pending = {p.name for p in hand.can_act()}
+        while pending and len(hand.in_hand()) > 1:
+            for player in order:
+                if player.name not in pending:
+                    continue
+                pending.discard(player.name)
+                if len(hand.in_hand()) == 1:
+                    break
+                self._wait(self.decision_seconds)
+                bet = hand.street_bets[player.name]
+                to_call = current_bet - bet
+                total = bet + player.stack
+                strength = self._strength(hand, player)
+                others_can_act = any(p is not player for p in hand.can_act())
+                roll = rng.random()
+
+                if others_can_act and total > current_bet and roll < 0.05 + 0.3 * strength ** 2:
+                    raise_to = current_bet + max(min_raise, int(hand.pot() * rng.uniform(0.4, 1.0)))
+                    if raise_to >= total or rng.random() < 0.03 * strength:
+                        raise_to = total
+                    verb = "bets" if current_bet == 0 else "raises to"
+                    self._player_line(player, f"{verb} {raise_to}" + (" and go all in" if raise_to == total else ""))
+                    min_raise = max(min_raise, raise_to - current_bet)
+                    current_bet = raise_to
+                    self._put_in(hand, player, raise_to)
+                    pending = {p.name for p in hand.can_act() if p is not player}
+                elif to_call == 0:
+                    self._player_line(player, "checks")
+                elif roll > 0.95 - 0.7 * (1 - strength):
+                    self._player_line(player, "folds")
+                    hand.folded.add(player.name)
+                elif total <= current_bet:
+                    self._player_line(player, f"calls {total} and go all in")
+                    self._put_in(hand, player, total)
+                else:
+                    self._player_line(player, f"calls {current_bet}")
+                    self._put_in(hand, player, current_bet)
+        self._return_uncalled(hand)
+
+    def _put_in(self, hand: _Hand, player: _Player, street_total: int):
+        added = street_total - hand.street_bets[player.name]
+        player.stack -= added
+        hand.contributed[player.name] += added
+        hand.street_bets[player.name] = street_total
+
+    def _return_uncalled(self, hand: _Hand):
+        bets = sorted(hand.street_bets.items(), key=lambda kv: kv[1], reverse=True)
+        (top_name, top), (_, second) = bets[0], bets[1]
+        if top > second:
+            player = next(p for p in hand.players if p.name == top_name)
+            self._emit(f'Uncalled bet of {top - second} returned to "{player.name}"')
+            player.stack += top - second
+            hand.contributed[top_name] -= top - second
+        hand.street_bets = {name: 0 for name in hand.street_bets}
+
+    def _deal(self, hand: _Hand, deck: List[int], street: str, n_cards: int, board=None, run=""):
+        board = hand.board if board is None else board
+        new_cards = [deck.pop() for _ in range(n_cards)]
+        cards = ", ".join(card_str(c) for c in new_cards)
+        if street == "Flop":
+            self._emit(f"Flop{run}:  [{cards}]")
+        else:
+            self._emit(f"{street}{run}: {', '.join(card_str(c) for c in board)} [{cards}]")
+        board.extend(new_cards)
+
+    def _showdown(self, hand: _Hand):
+        for player in hand.in_hand():
+            self._player_line(player, "shows a " + ", ".join(card_str(c) for c in hand.hole_cards[player.name]) + ".")
+
+    def _run_out(self, hand: _Hand, deck: List[int], streets):
+        self._showdown(hand)
+        boards = [hand.board]
+        run_twice = self._rng.random() < self.run_it_twice_rate
+        if run_twice:
+            self._emit("All players in hand choose to run it twice.")
+        for street, n_cards in streets:
+            self._wait(1)
+            self._deal(hand, deck, street, n_cards)
+        if run_twice:
+            second_board = list(boards[0][:5 - sum(n for _, n in streets)])
+            for street, n_cards in streets:
+                self._wait(1)
+                self._deal(hand, deck, street, n_cards, second_board, " (second run)")
+            boards.append(second_board)
+        self._award(hand, boards)
+
+    def _pots(self, hand: _Hand):
+        """
+        The main pot and side pots, as (amount, names of the players who can win it).
+        """
+        in_hand = hand.in_hand()
+        levels = sorted({hand.contributed[p.name] for p in in_hand})
+        pots = []
+        previous = 0
+        for level in levels:
+            amount = sum(min(c, level) - min(c, previous) for c in hand.contributed.values())
+            pots.append([amount, [p.name for p in in_hand if hand.contributed[p.name] >= level]])
+            previous = level
+        # Dead blinds of folded players beyond what anyone still in the hand put in
+        pots[-1][0] += hand.pot() - sum(amount for amount, _ in pots)
+        return pots
+
+    def _award(self, hand: _Hand, boards: List[List[int]]):
+        self._wait(1)
+        best = [{name: _best_hand(hand.hole_cards[name] + board) for name in hand.contributed
+                 if name not in hand.folded} for board in boards]
+        collected = {}
+        for pot, eligible in self._pots(hand):
+            # Each run of the board is worth an equal share of every pot
+            for run, run_best in enumerate(best):
+                share = pot // len(best) + (pot % len(best) if run == 0 else 0)
+                top = max(run_best[name][0] for name in eligible)
+                winners = [name for name in eligible if run_best[name][0] == top]
+                for i, name in enumerate(winners):
+                    won = share // len(winners) + (share % len(winners) if i == 0 else 0)
+                    collected[run, name] = collected.get((run, name), 0) + won
+
+        players = {p.name: p for p in hand.players}
+        for (run, name), amount in collected.items():
+            if amount == 0:
+                continue
+            value, combination = best[run][name]
+            self._player_line(players[name], f"collected {amount} from pot with {HAND_CATEGORIES[category(value)]} "
+                                             f"(combination: {', '.join(card_str(c) for c in combination)})")
+            players[name].stack += amount
+        # Everything is paid out, nobody is left to collect the pot without a showdown
+        hand.folded.update(players)
+
+
+def _best_hand(cards: List[int]):
+    """
+    The value of the best five card hand among `cards` and those five cards.
+    """
+    return max(((evaluate(combination), combination) for combination in itertools.combinations(cards, 5)),
+               key=lambda value_and_cards: value_and_cards[0])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Writes a synthetic Pokernow.club log.")
+    arg_parser.add_argument("output", help="Log file to write")
+    arg_parser.add_argument("--hands", type=int, help="Number of hands to play")
+    arg_parser.add_argument("--lines", type=int, help="Play hands until the log has at least this many rows")
+    arg_parser.add_argument("--players", type=int, default=8, help="Players seated at the start")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the random players")
+    arg_parser.add_argument("--straddle_rate", type=float, default=0.1, help="How often the player under the gun straddles")
+    arg_parser.add_argument("--run_it_twice_rate", type=float, default=0.5, help="How often all-ins are run twice")
+    arg_parser.add_argument("--no_missing_blinds", action="store_true", help="Players sitting back in don't post the blinds they missed")
+    arg_parser.add_argument("--rebuy_rate", type=float, default=0.5, help="How often busted players buy in again")
+    arg_parser.add_argument("--seat_change_rate", type=float, default=0.02, help="How often players stand up between hands")
+    args = arg_parser.parse_args()
+
+    generator = LogGenerator(players=args.players, seed=args.seed, straddle_rate=args.straddle_rate,
+                             run_it_twice_rate=args.run_it_twice_rate, missing_blinds=not args.no_missing_blinds,
+                             rebuy_rate=args.rebuy_rate, seat_change_rate=args.seat_change_rate)
+    generated = generator.write(args.output, hands=args.hands, lines=args.lines if args.hands is None else None)
+    print(f"Wrote {generated.hands} hands, {generated.lines} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
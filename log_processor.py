@@ -1,12 +1,22 @@
 import sys
-import csv
-import colorama
-import re
+import time
+import logging
 import argparse
-from typing import List, Set
+from typing import Dict, List, NamedTuple, Set, Tuple
 from collections import defaultdict
+from collections.abc import Sequence
 from player_stats import WinStats, PlayStats, PreFlopStats
-colorama.init()
+from stats_engine import StatsEngine, STREETS
+from action_table import ActionTable, ACTION_NAMES, epoch_millis
+from log_reader import chronological_rows
+from profiler import Profiler, section
+from positions import label_positions, PositionStats
+from line_classifier import (
+    classify_line, Ignored, PlayerJoined, PlayerQuit, PlayerStacks, StartingHand, EndingHand, HoleCards, Shows, Move, Board,
+    Collected, Unknown
+)
+# Named explicitly, so it is the same logger when this module is run as a script
+logger = logging.getLogger("log_processor")
 
 
 # Ideas for analyses
@@ -33,41 +43,102 @@ class Player:
         self.stack_amt = starting_amount
 
 
+class StackMismatch(NamedTuple):
+    """
+    A stack in a "Player stacks" line of the log that differs from the amount we computed from the hands.
+    The amount from the log is used from then on.
+    """
+    round_number: int
+    player: str
+    log_amount: int
+    our_amount: int
+    # Winners of the round before, which is usually where the difference comes from
+    previous_winners: list
+
+    def __str__(self):
+        return (f"start of round #{self.round_number}: {self.player}: {self.log_amount} (amount from log) != "
+                f"{self.our_amount} (our amount), winners in prev round: {self.previous_winners}")
+
+
 class Evening:
     def __init__(self, username):
         self.username = username
         self.rounds = []
         self.players = {}
         self.historical_amounts = defaultdict(list)
+        # Players out of the game, with the number of rounds played when they were and their stack at the start of
+        # the round they busted in. Their amounts are no longer recorded, until they rebuy.
+        self.eliminations: Dict[str, Tuple[int, int]] = {}
+        # Players who quit the table since the amounts were last recorded
+        self._quits = set()
+        # The moves of all rounds
+        self.actions = ActionTable()
+        # Stacks of the log that differ from ours, see `stack_report`
+        self.stack_mismatches: List[StackMismatch] = []
 
     def get_rounds(self):
         return [x for x in self.rounds if x.total_money_in_round()]
 
-    def plot_progression(self):
-        import matplotlib.pyplot as plt
+    def plot_progression(self, luck_adjusted_amounts=None, output=None):
+        """
+        Plots the chips of each player after every round. `luck_adjusted_amounts`, shaped like
+        `historical_amounts`, is drawn as a dashed line next to each player's real chips. With `output` the plot is
+        written to that file instead of being shown.
+        """
+        from plotting import downsample, pixel_width, pyplot, show_or_save, unzip
 
+        plt = pyplot(output)
+        fig, ax = plt.subplots(1)
+        width = pixel_width(fig)
         for player, round_amts in self.historical_amounts.items():
-            rounds, amts = list(zip(*round_amts))
+            rounds, amts = downsample(*unzip(round_amts), width)
             player_name = player.split("@")[0].strip()
-            plt.plot(rounds, amts, label=player_name)
+            line, = ax.plot(rounds, amts, label=player_name)
+            if luck_adjusted_amounts is not None and player in luck_adjusted_amounts:
+                rounds, amts = downsample(*unzip(luck_adjusted_amounts[player]), width)
+                ax.plot(rounds, amts, linestyle="--", color=line.get_color(), label=f"{player_name} (all-in EV)")
+
+        ax.set_xlabel("Round #")
+        ax.set_ylabel("# of Chips")
 
-        plt.xlabel("Round #")
-        plt.ylabel("# of Chips")
+        ax.legend()
+        show_or_save(plt, fig, output)
 
-        plt.legend()
-        plt.show()
+    def stack_report(self) -> str:
+        """
+        A report of all stacks in the log that differed from ours, empty if there were none.
+        """
+        if not self.stack_mismatches:
+            return ""
+        lines = [f"**WARNING** {len(self.stack_mismatches)} stack(s) in the log differ from the amounts computed "
+                 f"from the hands, the amounts from the log were used:"]
+        lines += [f"  {mismatch}" for mismatch in self.stack_mismatches]
+        return "\n".join(lines) + "\n"
 
     def add_player(self, name, amount):
         if name in self.players:
             # rebuy
-            pass
+            self._quits.discard(name)
+            if self.eliminations.pop(name, None) is not None:
+                # Back in the game with `amount` from the round being dealt, if any, so it is their stack before
+                # the round if they bust again
+                in_progress = self.rounds and not self.rounds[-1].finished
+                self.historical_amounts[name].append((len(self.rounds) - 1 if in_progress else len(self.rounds),
+                                                      amount))
         self.players[name] = amount
 
-    def add_round(self, dealer):
+    def quit_player(self, name):
+        """
+        Takes `name` out of the game when the amounts are next recorded, i.e. once the hand they left during (if
+        any) is settled.
+        """
+        self._quits.add(name)
+
+    def add_round(self, dealer, hand_number=None, order=None, started_at=None):
         if len(self.rounds) != 0:
             self._update_amounts()
         self._record_amounts()
-        new_round = Round(dealer, self.players, len(self.rounds) + 1)
+        new_round = Round(dealer, self.players, len(self.rounds) + 1, self.actions, hand_number, order, started_at)
         self.rounds.append(new_round)
         return new_round
 
@@ -76,30 +147,82 @@ class Evening:
         self._record_amounts()
 
     def _record_amounts(self):
+        round_no = len(self.rounds)
         for player, amt in self.players.items():
-            self.historical_amounts[player].append((len(self.rounds), amt))
+            if player in self.eliminations:
+                continue
+            round_amts = self.historical_amounts[player]
+            if amt == 0 or player in self._quits:
+                # Busted or left: a last 0, and their stack before the round as a tie breaker between players out
+                # in the same round
+                self.eliminations[player] = (round_no, round_amts[-1][1] if round_amts else amt)
+                amt = 0
+            round_amts.append((round_no, amt))
+        self._quits.clear()
+
+    def to_state(self) -> dict:
+        """
+        Everything about the evening except its action table, as plain JSON compatible values.
+        """
+        return {
+            "username": self.username,
+            "players": self.players,
+            "historical_amounts": self.historical_amounts,
+            "eliminations": self.eliminations,
+            "rounds": [round.to_state() for round in self.rounds],
+            "stack_mismatches": self.stack_mismatches,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, actions: ActionTable) -> "Evening":
+        evening = cls(state["username"])
+        evening.players = state["players"]
+        for player, round_amts in state["historical_amounts"].items():
+            evening.historical_amounts[player] = [tuple(x) for x in round_amts]
+        evening.eliminations = {player: tuple(elimination) for player, elimination in state["eliminations"].items()}
+        evening.actions = actions
+        evening.rounds = [Round.from_state(round_state, actions) for round_state in state["rounds"]]
+        evening.stack_mismatches = [
+            StackMismatch(round_number, player, log_amount, our_amount, [tuple(winner) for winner in winners])
+            for round_number, player, log_amount, our_amount, winners in state["stack_mismatches"]
+        ]
+        return evening
 
     def _update_amounts(self):
         last_round = self.rounds[-1]
-        spent = last_round.money_spent()
-        pot_size = sum(spent.values())
-        for user, amount in spent.items():
+        for user, amount in last_round.money_spent().items():
             self.players[user] -= amount
 
-        if len(last_round.winners) == 1:
-            for (winner_name, hand, amt, _) in last_round.winners:
-                self.players[winner_name] += pot_size
-        elif len(last_round.winners) > 1:
-            for (winner_name, hand, amt, _) in last_round.winners:
-                self.players[winner_name] += amt
+        for winner_name, amount in last_round.winnings().items():
+            self.players[winner_name] += amount
 
 
 class Action:
-    def __init__(self, player, action_name, amount, time_stamp):
-        self.player = player
-        self.action_name = action_name
-        self.amount = amount
-        self.time_stamp = time_stamp
+    """
+    A single move, viewed from its row in the evening's ActionTable.
+    """
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: ActionTable, row: int):
+        self._table = table
+        self._row = row
+
+    @property
+    def player(self) -> str:
+        return self._table.player_names[self._table.player_ids[self._row]]
+
+    @property
+    def action_name(self) -> str:
+        return ACTION_NAMES[self._table.action_ids[self._row]]
+
+    @property
+    def amount(self) -> int:
+        return self._table.amounts[self._row]
+
+    @property
+    def time_stamp(self) -> int:
+        """Milliseconds since the epoch."""
+        return self._table.time_stamps[self._row]
 
     def __str__(self):
         return f"{self.player} {self.action_name} {self.amount}"
@@ -108,15 +231,61 @@ class Action:
         return self.__str__()
 
 
+class Moves(Sequence):
+    """
+    The moves of one street of a round: a contiguous range of rows of the evening's ActionTable.
+    """
+    def __init__(self, table: ActionTable, start: int, stop: int):
+        self._table = table
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Action(self._table, row) for row in range(self._start, self._stop)[index]]
+        return Action(self._table, range(self._start, self._stop)[index])
+
+    def __iter__(self):
+        table = self._table
+        for row in range(self._start, self._stop):
+            yield Action(table, row)
+
+    def __str__(self):
+        return "[" + ", ".join(str(action) for action in self) + "]"
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class Round:
-    def __init__(self, dealer, players, number):
+    def __init__(self, dealer, players, number, actions: ActionTable = None, hand_number=None, order=None,
+                 started_at=None):
         self.initial_amounts = {name: amt for (name, amt) in players.items()}
         self.dealer = dealer
+        # (player, winning hand or None, amount, time in epoch milliseconds)
         self.winners = []
         self.number = number  # start numbering from 1
+        # The hand number given by the log and the `order` of its "-- starting hand" row, which together identify
+        # the hand across logs, and the time it started in epoch milliseconds
+        self.hand_number = hand_number
+        self.order = order
+        self.started_at = started_at
+        # Seat number of each player dealt in, the first forced bet of each kind ("small_blind", "big_blind",
+        # "straddle") as (player, amount), and the position of each player, labelled once the round is finished
+        self.seats = {}
+        self.blinds = {}
+        self.positions = {}
+        # Set once the "-- ending hand" line has been seen
+        self.finished = False
 
         # Username to hand
         self.known_hands = {}
+        # Username to the two hole cards, for players whose cards were dealt to us or shown.
+        # Unlike known_hands this is not replaced by the winning combination.
+        self.hole_cards = {}
 
         self.flop = None
         self.turn = None
@@ -125,20 +294,61 @@ class Round:
         # Only populated if a round is "run twice"
         self.second_flop = None
         self.second_turn = None
-        self.preflop_moves: List[Action] = []
-        self.flop_moves: List[Action] = []
-        self.turn_moves: List[Action] = []
-        self.river_moves: List[Action] = []
+        self.second_river = None
+
+        # The moves of a round are contiguous rows of the action table and streets follow each other,
+        # so the moves of each street are given by the row after its last move.
+        self.actions = actions if actions is not None else ActionTable()
+        self._first_row = len(self.actions)
+        self._street_ends = [self._first_row] * len(STREETS)
+
+        # Caches of money_spent() and total_money_in_round(), reset whenever a move is added
+        self._money_spent = None
+        self._total_money = None
+
+    _STATE_FIELDS = ("initial_amounts", "dealer", "winners", "number", "hand_number", "order", "started_at",
+                     "seats", "blinds", "positions", "finished", "known_hands", "hole_cards", "flop", "turn", "river", "second_flop", "second_turn",
+                     "second_river", "_first_row", "_street_ends")
+
+    def to_state(self) -> dict:
+        return {field: getattr(self, field) for field in self._STATE_FIELDS}
+
+    @classmethod
+    def from_state(cls, state: dict, actions: ActionTable) -> "Round":
+        round = cls(state["dealer"], state["initial_amounts"], state["number"], actions)
+        for field in cls._STATE_FIELDS:
+            setattr(round, field, state[field])
+        round.winners = [tuple(winner) for winner in round.winners]
+        round.blinds = {name: tuple(blind) for name, blind in round.blinds.items()}
+        return round
+
+    def _street_moves(self, street: int) -> Moves:
+        start = self._street_ends[street - 1] if street > 0 else self._first_row
+        return Moves(self.actions, start, self._street_ends[street])
+
+    @property
+    def preflop_moves(self) -> Moves:
+        return self._street_moves(0)
+
+    @property
+    def flop_moves(self) -> Moves:
+        return self._street_moves(1)
+
+    @property
+    def turn_moves(self) -> Moves:
+        return self._street_moves(2)
+
+    @property
+    def river_moves(self) -> Moves:
+        return self._street_moves(3)
 
     @property
     def small_blind(self) -> (str, int):
-        small_blind_action = [x for x in self.preflop_moves if x.action_name == "small_blind"][0]
-        return small_blind_action.player, small_blind_action.amount
+        return self.blinds["small_blind"]
 
     @property
     def big_blind(self) -> (str, int):
-        big_blind_action = [x for x in self.preflop_moves if x.action_name == "big_blind"][0]
-        return big_blind_action.player, big_blind_action.amount
+        return self.blinds["big_blind"]
 
     @staticmethod
     def find_moves(player, action_name, moves):
@@ -157,23 +367,66 @@ class Round:
                 else:
                     spent[m.player] = m.amount
 
+        missing_small_blinds = {m.player for m in moves if m.action_name == "missing_small_blind"}
         for m in moves:
             if m.action_name == "missing_small_blind":
                 spent[m.player] += m.amount
-            if m.action_name == "missing_big_blind" and not Round.find_moves(m.player, "missing_small_blind", moves):
+            if m.action_name == "missing_big_blind" and m.player not in missing_small_blinds:
                 spent[m.player] += m.amount
 
         return spent
 
     def total_money_in_round(self):
-        return sum(self.money_spent().values())
+        if self._total_money is None:
+            self._total_money = sum(self.money_spent().values())
+        return self._total_money
 
     def money_spent(self):
-        spent = defaultdict(int)
-        for moves in [self.preflop_moves, self.flop_moves, self.turn_moves, self.river_moves]:
-            for player, amount in Round.money_in_round(moves).items():
-                spent[player] += amount
-        return spent
+        """
+        How much money was spent by each player over the whole round. The result is computed once and kept
+        until another move is added, so it must not be modified by the caller.
+        """
+        if self._money_spent is None:
+            spent = defaultdict(int)
+            for moves in [self.preflop_moves, self.flop_moves, self.turn_moves, self.river_moves]:
+                for player, amount in Round.money_in_round(moves).items():
+                    spent[player] += amount
+            self._money_spent = spent
+        return self._money_spent
+
+    def winnings(self) -> Dict[str, int]:
+        """
+        How much each winner of the round collected. A single winner takes the whole pot.
+        """
+        won = defaultdict(int)
+        if len(self.winners) == 1:
+            won[self.winners[0][0]] += self.total_money_in_round()
+        else:
+            for (winner_name, hand, amt, _) in self.winners:
+                won[winner_name] += amt
+        return won
+
+    def finish(self):
+        """
+        Called once the "-- ending hand" line has been seen. Computes the money spent in the round up front,
+        since every stats pass needs it, and labels the positions.
+        """
+        self.finished = True
+        self.total_money_in_round()
+        self.label_positions()
+
+    def label_positions(self):
+        """
+        Labels the position of every player dealt in, see positions.label_positions. Without a "Player stacks" line
+        the players are ordered as they joined.
+        """
+        if self.seats:
+            seat_order = sorted(self.seats, key=self.seats.get)
+        else:
+            seat_order = list(self.initial_amounts)
+        self.positions = label_positions(seat_order, self.dealer if self.dealer in seat_order else None,
+                                         *(self.blinds[name][0] if name in self.blinds else None
+                                           for name in ("small_blind", "big_blind", "straddle")))
 
     def voluntary_contributors(self) -> Set[str]:
         voluntary_contributors = set()
@@ -199,15 +452,22 @@ class Round:
         return list(names)
 
     def add_move(self, player, action_name, amount, time_stamp):
-        action = Action(player, action_name, amount, time_stamp)
+        self._money_spent = None
+        self._total_money = None
+        if action_name in ("small_blind", "big_blind", "straddle") and action_name not in self.blinds:
+            self.blinds[action_name] = (player, amount)
         if self.flop is None:
-            self.preflop_moves.append(action)
+            street = 0
         elif self.turn is None:
-            self.flop_moves.append(action)
+            street = 1
         elif self.river is None:
-            self.turn_moves.append(action)
+            street = 2
         else:
-            self.river_moves.append(action)
+            street = 3
+        row = self.actions.append(self.number, street, player, action_name, amount, time_stamp)
+        assert row == self._street_ends[-1], "moves can only be added to the latest round"
+        for later_street in range(street, len(STREETS)):
+            self._street_ends[later_street] = row + 1
 
     def __str__(self):
         s = f"Round {self.number}\n"
@@ -224,28 +484,61 @@ class Round:
         return s
 
 
+# Bump whenever a change to the parser changes the resulting evenings, this invalidates cached sessions.
+PARSER_VERSION = 8
+
+
 class Parser:
-    def __init__(self, ignore_warnings):
+    def __init__(self, ignore_warnings, profiler: Profiler = None):
         self.username = None
         # If there is a line that is not understood on the log, this field decides whether
         # to immediately exit, or to ignore the line and continue parsing the log.
         self._ignore_warnings = ignore_warnings
+        # Only set when profiling, then every line and the evening's bookkeeping is timed
+        self.profiler = profiler
+
+    @property
+    def ignore_warnings(self) -> bool:
+        return self._ignore_warnings
 
     @property
     def _current_round(self):
         return self.evening.rounds[-1]
 
-    def parse(self, username, file_name) -> Evening:
+    def parse(self, username, file_name, row_reader=chronological_rows) -> Evening:
+        """
+        Parses the log file `file_name`. `row_reader` yields the rows of the file in chronological order,
+        `log_reader.chronological_rows_in_memory` can be passed to use the non-streaming reference reader.
+        """
+        self.start_evening(username)
+        self.parse_rows(row_reader(file_name))
+        return self.finish_evening()
+
+    def start_evening(self, username) -> Evening:
+        """
+        Starts a new evening. Rows can then be fed incrementally with `parse_rows` until `finish_evening` is called.
+        """
         self.evening = Evening(username)
         self.username = username
-        f = open(file_name, 'r')
-        csv_reader = csv.reader(f)
-        for row in reversed([row for row in csv_reader]):
+        if self.profiler is not None:
+            self.profiler.wrap(self.evening, "_update_amounts", "evening/_update_amounts")
+            self.profiler.wrap(self.evening, "_record_amounts", "evening/_record_amounts")
+        return self.evening
+
+    def parse_rows(self, rows):
+        parse_line = self.parse_line if self.profiler is None else self._parse_line_profiled
+        for row in rows:
             try:
-                self.parse_line(row)
+                parse_line(row)
             except Exception as e:
-                print(row)
+                logger.error("Failed to parse row: %s", row)
                 raise e
+
+    def finish_evening(self) -> Evening:
+        rounds = self.evening.rounds
+        if rounds and not rounds[-1].finished:
+            # A log cut off in the middle of a hand
+            rounds[-1].label_positions()
         self.evening.handle_last_round()
         evening = self.evening
         self.evening = None
@@ -253,231 +546,185 @@ class Parser:
 
     def parse_line(self, row):
         line, time, token = row
-        normline = line.lower()
-        if "created the game with a stack of" in line or "The admin approved" in line or "joined the game with a stack" in line:
-            player_name = line.split('"')[1]
-            start_amount = int(line.split()[-1][:-1])
-            self.evening.add_player(player_name, start_amount)
-        elif line == "entry":
-            pass
-        elif line.startswith("Undealt cards:"):
-            pass
-        elif "requested a seat" in line:
-            pass
-        elif "canceled the seat request" in line:
-            pass
-        elif "rejected the seat request" in line:
-            pass
-        elif "changed the ID from" in line:
-            pass
-        elif "stand up with the stack" in line:
-            pass
-        elif "sit back with the stack" in line:
-            pass
-        elif "quits the game with a stack of" in line:
-            pass
-        elif "joined the game with a stack of" in line:
-            pass
-        elif "passed the room ownership" in line:
-            pass
-        elif "queued the stack change for the player" in line:
-            pass
-        elif "enqueued the removal of the player " in line:
-            pass
-        elif "updated the player" in line:
-            pass
-        elif "small blind was changed from" in line:
-            pass
-        elif "big blind was changed from" in line:
-            pass
-        elif re.search("The game's ante was changed from (\d+) to (\d+).", line):
-            pass
-        elif "dead small blind" in normline or "dead big blind" in normline:
-            pass
-        elif re.search('The admin "(.*)" forced the player ".*" to away mode in the next hand.', line):
-            pass
-        elif "uncalled bet" in normline:
-            for amount, player_name in re.findall(r'Uncalled bet of (\d+) returned to "(.*)"', line):
-                self._current_round.add_move(player_name, "uncalled_bet", int(amount), time)
-                break
-        elif re.search("run it twice", line):
-            pass
-        elif line.startswith("Player stacks:"):
-            line = line[len("Player stacks: "):]
-            entries = line.split(" | ")
-            stack_sizes = [x.strip().rsplit(' ', 1)[1] for x in entries]
-            stack_size_counts = [int(x.strip('()')) for x in stack_sizes]
-            players = [x.split('"')[1] for x in entries]
-            player_amounts = {player: stack_size for (player, stack_size) in zip(players, stack_size_counts)}
-            for player, amount in player_amounts.items():
-                if amount != self.evening.players[player]:
-                    round_no = self._current_round.number
-                    print(f"**WARNING** start of round #{round_no}: "
-                          f"{player}: {amount} (amount from log) != {self.evening.players[player]} (our amount)")
-                    if len(self.evening.rounds) > 1:
-                        print("winners in prev round: ", self.evening.rounds[-2].winners)
-                    self.evening.players[player] = amount
-        elif "-- starting hand" in line:
-            if "dead button" in line:
-                dealer_name = "None"
-            else:
-                dealer_name = line.split('"')[1]
-            print(f"Started hand dealer: {dealer_name}")
-            self.evening.add_round(dealer_name)
-        elif line.startswith("Your hand is "):
-            cards = line[len("Your hand is "):].split(", ")
-            self._current_round.known_hands[self.username] = cards
-        elif " shows a " in line:
-            player_name = line.split('"')[1]
-            assert line.endswith('.')
-            cards = line.split(" shows a ")[1][:-1].split(", ")
-            self._current_round.known_hands[player_name] = cards
-            self._current_round.add_move(player_name, "show", 0, time)
-        elif "posts a missing small blind of" in line:
-            player_name = line.split('"')[1]
-            small_blind = int(line.split()[-1])
-            self._current_round.add_move(player_name, "missing_small_blind", small_blind, time)
-        elif "posts a small blind of" in line:
-            player_name = line.split('"')[1]
-            small_blind = int(line.split()[-1])
-            self._current_round.add_move(player_name, "small_blind", small_blind, time)
-        elif "posts a missed big blind of" in line:
-            player_name = line.split('"')[1]
-            big_blind = int(line.split()[-1])
-            self._current_round.add_move(player_name, "missing_big_blind", big_blind, time)
-        elif re.search(r'"(.*)" posts a big blind of (\d+)', line):
-            match = re.search(r'"(.*)" posts a big blind of (\d+)', line)
-            player_name = match.group(1)
-            big_blind = int(match.group(2))
-            self._current_round.add_move(player_name, "big_blind", big_blind, time)
-        elif re.search('"(.*)" posts a straddle of (\d+)', line):
-            match = re.search('"(.*)" posts a straddle of (\d+)', line)
-            player_name = match.group(1)
-            straddle = int(match.group(2))
-            self._current_round.add_move(player_name, "straddle", straddle, time)
-        elif re.search('"(.*)" posts a straddle of (\d+)', line):
-            match = re.search('"(.*)" posts a straddle of (\d+)', line)
-            player_name = match.group(1)
-            straddle = int(match.group(2))
-            self._current_round.add_move(player_name, "straddle", straddle, time)
-        elif line.endswith("folds"):
-            player_name = line.split('"')[1]
-            self._current_round.add_move(player_name, "fold", 0, time)
-        elif line.endswith("checks"):
-            player_name = line.split('"')[1]
-            self._current_round.add_move(player_name, "check", 0, time)
-        elif re.search(r'"(.*)" calls (\d+)$', line):
-            match = re.search(r'"(.*)" calls (\d+)$', line)
-            player_name = match.group(1)
-            call_amount = int(match.group(2))
-            self._current_round.add_move(player_name, "call", call_amount, time)
-        elif re.search(r'"(.*)" calls (\d+) and go all ', line):
-            match = re.search(r'"(.*)" calls (\d+) and go all ', line)
-            player_name = match.group(1)
-            call_amount = int(match.group(2))
-            self._current_round.add_move(player_name, "call (all in)", call_amount, time)
-        elif re.search(r'"(.*)" raises to (\d+)$', line):
-            match = re.search(r'"(.*)" raises to (\d+)$', line)
-            player_name = match.group(1)
-            raise_amount = int(match.group(2))
-            self._current_round.add_move(player_name, "raise", raise_amount, time)
-        elif re.search(r'"(.*)" raises to (\d+) and go all ', line):
-            match = re.search(r'"(.*)" raises to (\d+) and go all ', line)
-            player_name = match.group(1)
-            raise_amount = int(match.group(2))
-            self._current_round.add_move(player_name, "raise (all in)", raise_amount, time)
-        elif re.search(r'"(.*)" bets (\d+)$', line):
-            # TODO: This is the first bet in a round, should be treated differently
-            match = re.search(r'"(.*)" bets (\d+)$', line)
-            player_name = match.group(1)
-            raise_amount = int(match.group(2))
-            self._current_round.add_move(player_name, "raise", raise_amount, time)
-        elif re.search(r'"(.*)" bets (\d+) and go all ', line):
-            # TODO: This is the first bet in a round, should be treated differently
-            match = re.search(r'"(.*)" bets (\d+) and go all ', line)
-            player_name = match.group(1)
-            raise_amount = int(match.group(2))
-            self._current_round.add_move(player_name, "raise (all in)", raise_amount, time)
-        elif "raises and all in with" in line:
-            player_name = line.split('"')[1]
-            raise_amount = int(line.split()[-1])
-            self._current_round.add_move(player_name, "raise (all in)", raise_amount, time)
-        elif normline.startswith("flop"):
-            card_string = line.split('[')[1].split(']')[0]
-            cards = card_string.split(', ')
-            self._current_round.flop = cards
-        elif normline.startswith("turn (second run):"):
-            card = line.split('[')[1].split(']')[0]
-            self._current_round.second_turn = card
-        elif normline.startswith("river (second run):"):
-            card = line.split('[')[1].split(']')[0]
-            self._current_round.second_river = card
-        elif normline.startswith("turn:"):
-            card = line.split('[')[1].split(']')[0]
-            self._current_round.turn = card
-        elif normline.startswith("river:"):
-            card = line.split('[')[1].split(']')[0]
-            self._current_round.river = card
-        elif re.search(r'"(.*)" collected (\d+) from pot$', line):
-            match = re.search(r'"(.*)" collected (\d+) from pot$', line)
-            winner_name = match.group(1)
-            win_amount = int(match.group(2))
-            self._current_round.winners.append((winner_name, None, win_amount, time))
-        elif re.search(r'"(.*)" collected (\d+) from pot with .* \(combination: (.*)\)', line):
-            match = re.search(r'"(.*)" collected (\d+) from pot with .* \(combination: (.*)\)', line)
-            winner_name = match.group(1)
-            win_amount = int(match.group(2))
-            combination = match.group(3)
-            winning_hand = combination.split(", ")
-            self._current_round.known_hands[winner_name] = winning_hand
-            self._current_round.winners.append((winner_name, winning_hand, win_amount, time))
-        elif " collected " in line:  # obsoleted and covered by the previous case?
-            winner_name = line.split('"')[1]
-            win_amount = int(line.split()[-1])
-            self._current_round.winners.append((winner_name, None, win_amount, time))
-        elif " wins " in line:  # obsoleted?
-            winner_name, rest = line.split('"')[1:]
-            amount = int(rest.split()[1])
-            assert rest.endswith(')')
-            winning_hand = rest.split("hand: ")[1][:-1].split(", ")
-            self._current_round.known_hands[winner_name] = winning_hand
-            self._current_round.winners.append((winner_name, winning_hand, amount, time))
-        elif "-- ending hand" in line:
-            print(self._current_round)
-            # self._current_round = None
-        else:
-            print("**WARNING**: Unexpected line found in log. "
-                  "Likely the log format has changed and this script needs to be updated.")
-            print(line)
-            if not self._ignore_warnings:
-                assert False
-
-
-def compute_stats(evening, args):
+        # Only needed by the "-- starting hand" handler
+        self._order = token
+        event = classify_line(line)
+        self._handlers[type(event)](self, event, time)
+
+    def _parse_line_profiled(self, row):
+        line, time_stamp, token = row
+        self._order = token
+        start = time.perf_counter_ns()
+        event = classify_line(line)
+        classified = time.perf_counter_ns()
+        handler = self._handlers[type(event)]
+        handler(self, event, time_stamp)
+        self.profiler.add("line/" + _line_category(event), classified - start)
+        self.profiler.add("handler/" + handler.__name__, time.perf_counter_ns() - classified)
+
+    def _on_ignored(self, event, time):
+        pass
+
+    def _on_player_joined(self, event: PlayerJoined, time):
+        self.evening.add_player(event.player, event.amount)
+
+    def _on_player_quit(self, event: PlayerQuit, time):
+        self.evening.quit_player(event.player)
+
+    def _on_player_stacks(self, event: PlayerStacks, time):
+        self._current_round.seats = event.seats
+        for player, amount in event.stacks.items():
+            if amount != self.evening.players[player]:
+                previous_winners = list(self.evening.rounds[-2].winners) if len(self.evening.rounds) > 1 else []
+                mismatch = StackMismatch(self._current_round.number, player, amount, self.evening.players[player],
+                                         previous_winners)
+                self.evening.stack_mismatches.append(mismatch)
+                logger.debug("**WARNING** %s", mismatch)
+                self.evening.players[player] = amount
+
+    def _on_starting_hand(self, event: StartingHand, time):
+        logger.debug("Started hand dealer: %s", event.dealer)
+        self.evening.add_round(event.dealer, event.hand_number, int(self._order), epoch_millis(time))
+
+    def _on_ending_hand(self, event: EndingHand, time):
+        self._current_round.finish()
+        # Only formatted when debug output is on
+        logger.debug("%s", self._current_round)
+
+    def _on_hole_cards(self, event: HoleCards, time):
+        self._current_round.known_hands[self.username] = event.cards
+        self._current_round.hole_cards[self.username] = event.cards
+
+    def _on_shows(self, event: Shows, time):
+        self._current_round.known_hands[event.player] = event.cards
+        self._current_round.hole_cards[event.player] = event.cards
+        self._current_round.add_move(event.player, "show", 0, time)
+
+    def _on_move(self, event: Move, time):
+        self._current_round.add_move(event.player, event.action_name, event.amount, time)
+
+    def _on_board(self, event: Board, time):
+        setattr(self._current_round, event.street, event.cards)
+
+    def _on_collected(self, event: Collected, time):
+        if event.hand is not None:
+            self._current_round.known_hands[event.player] = event.hand
+        self._current_round.winners.append((event.player, event.hand, event.amount, epoch_millis(time)))
+
+    def _on_unknown(self, event: Unknown, time):
+        logger.warning("**WARNING**: Unexpected line found in log. "
+                       "Likely the log format has changed and this script needs to be updated.\n%s", event.line)
+        if not self._ignore_warnings:
+            assert False
+
+    _handlers = {
+        Ignored: _on_ignored,
+        PlayerJoined: _on_player_joined,
+        PlayerQuit: _on_player_quit,
+        PlayerStacks: _on_player_stacks,
+        StartingHand: _on_starting_hand,
+        EndingHand: _on_ending_hand,
+        HoleCards: _on_hole_cards,
+        Shows: _on_shows,
+        Move: _on_move,
+        Board: _on_board,
+        Collected: _on_collected,
+        Unknown: _on_unknown,
+    }
+
+
+def _line_category(event) -> str:
+    if isinstance(event, Move):
+        return f"Move ({event.action_name})"
+    if isinstance(event, Board):
+        return f"Board ({event.street})"
+    return type(event).__name__
+
+
+def compute_stats(evening, args, profiler: Profiler = None):
     win_stats = WinStats(evening)
     play_stats = PlayStats(evening, win_stats)
     preflop_stats = PreFlopStats(evening, play_stats)
-    play_stats.print()
-    win_stats.print()
-    preflop_stats.print()
-    evening.plot_progression()
+    stats = [win_stats, play_stats, preflop_stats]
+    if args.positions:
+        stats.append(PositionStats(evening))
+    if profiler is not None:
+        for stat in stats:
+            for callback in ("on_round_start", "on_move", "on_round_end"):
+                profiler.wrap(stat, callback, f"stats/{type(stat).__name__}")
+    with section(profiler, "stats/get_rounds"):
+        rounds = evening.get_rounds()
+    StatsEngine(stats).run(rounds)
+    with section(profiler, "print"):
+        play_stats.print()
+        win_stats.print()
+        preflop_stats.print()
+        if args.positions:
+            stats[-1].print()
+    if args.times:
+        from time_stats import TimeSummary, session_times
+        with section(profiler, "times"):
+            TimeSummary.of_times(session_times(evening), args.log_file).print()
+    luck_adjusted = None
+    if args.luck:
+        from luck_stats import luck_adjusted_amounts, print_luck
+        with section(profiler, "luck"):
+            luck_adjusted = luck_adjusted_amounts(evening)
+            print_luck(evening, luck_adjusted)
+    if args.plot_chips or args.output:
+        with section(profiler, "plot"):
+            evening.plot_progression(luck_adjusted, args.output)
     # hand_variance(evening)
 
 
 def main():
     arg_parser = argparse.ArgumentParser()
-    arg_parser.add_argument("log_file", help='Path to a log file from pokernow.com')
-    arg_parser.add_argument("--output", help='File to write results to')
-    arg_parser.add_argument("--plot_chips", help='Attempts to plot the progression of chips')
+    arg_parser.add_argument("log_file", help='Path to a log file from pokernow.com. With --follow this may also be '
+                                             'a directory of periodically re-downloaded logs.')
+    arg_parser.add_argument("--output", help='File to write the plot of the progression of chips to instead of showing it, e.g. chips.png or chips.svg. Works without a display.')
+    arg_parser.add_argument("--plot_chips", action="store_true", help='Plots the progression of chips')
     arg_parser.add_argument("--ignore_warnings", action="store_true", help="Ignores lines in the log that are not understood. This may cause additional inaccuracies.")
+    arg_parser.add_argument("--positions", action="store_true", help="Also shows VPIP, PFR and the win rate of every player in each position.")
+    arg_parser.add_argument("--times", action="store_true", help="Also shows how long every player takes to decide, hands per hour and how long the session lasted.")
+    arg_parser.add_argument("--luck", action="store_true", help="Shows how chips would have gone if every all-in with known hands had paid out its equity.")
+    arg_parser.add_argument("--follow", action="store_true", help="Keeps watching the log for new hands and prints updated stats as they are played.")
+    arg_parser.add_argument("--interval", type=float, default=5.0, help="Seconds between checks for new hands with --follow.")
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the log, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--rebuild-cache", dest="rebuild_cache", action="store_true", help="Parses the log again and replaces its entry in the cache of parsed logs.")
+    arg_parser.add_argument("--verbose", action="store_true", help="Prints every hand as it is parsed, for debugging the parser.")
+    arg_parser.add_argument("--quiet", action="store_true", help="Only prints the stats, no warnings.")
+    arg_parser.add_argument("--profile", action="store_true", help="Prints how long parsing each kind of line, the stats and plotting took. Use with --no-cache to profile the parser.")
+    arg_parser.add_argument("--profile-json", dest="profile_json", help="Writes the profile to this file as JSON.")
 
     args = arg_parser.parse_args()
 
+    logging.basicConfig(level=logging.ERROR if args.quiet else logging.WARNING, format="%(message)s")
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
     filename = args.log_file
 
-    p = Parser(ignore_warnings= args.ignore_warnings)
-    evening = p.parse("", filename)
-    compute_stats(evening, args)
+    # Only needed to color the output on Windows
+    import colorama
+    colorama.init()
+
+    profiler = Profiler() if args.profile or args.profile_json else None
+    p = Parser(ignore_warnings= args.ignore_warnings, profiler=profiler)
+    if args.follow:
+        from log_follower import LogFollower
+        LogFollower(filename, p).run(args.interval)
+        return
+    from session_cache import parse_with_cache
+    with section(profiler, "parse"):
+        evening = parse_with_cache(p, "", filename, use_cache=not args.no_cache, rebuild=args.rebuild_cache)
+    if evening.stack_mismatches:
+        logger.warning("%s", evening.stack_report())
+    compute_stats(evening, args, profiler)
+    if profiler is not None:
+        if args.profile:
+            profiler.print()
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
 
 
 if __name__ == "__main__":
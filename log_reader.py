@@ -0,0 +1,114 @@
+"""
+Reading of Pokernow.club log files in chronological order.
+
+The logs are exported newest entry first, so the rows have to be replayed in reverse. `chronological_rows` does this
+by reading the file backwards in fixed size blocks, so memory use is bounded by the block size and the longest row,
+no matter how long the log is. `chronological_rows_in_memory` is the straightforward reference implementation which
+loads the whole file first.
+"""
+import csv
+import os
+from typing import BinaryIO, Iterator, List
+
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+
+def _reversed_lines(f: BinaryIO, block_size: int) -> Iterator[bytes]:
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    remainder = b""
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        lines = (f.read(read_size) + remainder).split(b"\n")
+        # The first line may continue in the previous block, keep it until that block is read.
+        remainder = lines[0]
+        for line in reversed(lines[1:]):
+            yield line
+    yield remainder
+
+
+def _reversed_records(f: BinaryIO, block_size: int) -> Iterator[str]:
+    # A quoted field may span several physical lines. Such a record has an odd number of quotes in each of its
+    # first and last lines, so lines are joined until the quotes are balanced.
+    pending = None
+    for line in _reversed_lines(f, block_size):
+        if pending is not None:
+            line = line + b"\n" + pending
+        elif not line.strip():
+            continue
+        if line.count(b'"') % 2:
+            pending = line
+            continue
+        pending = None
+        yield line.rstrip(b"\r").decode("utf-8")
+
+
+def chronological_rows(file_name, block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[List[str]]:
+    """
+    Yields the rows of the log file `file_name` oldest first, reading the file backwards in blocks of `block_size`
+    bytes. The header row comes last, exactly as with `chronological_rows_in_memory`.
+    """
+    with open(file_name, 'rb') as f:
+        yield from csv.reader(_reversed_records(f, block_size))
+
+
+def chronological_rows_in_memory(file_name) -> Iterator[List[str]]:
+    """
+    Reference implementation of `chronological_rows`, which reads and reverses the whole file at once.
+    """
+    with open(file_name, 'r', encoding="utf-8", newline='') as f:
+        rows = [row for row in csv.reader(f)]
+    return reversed(rows)
+
+
+def row_order(row: List[str]) -> int:
+    """
+    The value of the `order` column of a row, which increases monotonically over the course of a game.
+    The header row has order -1.
+    """
+    order = row[2]
+    return int(order) if order.isdigit() else -1
+
+
+def newest_order(file_name) -> int:
+    """
+    The order of the newest row of the log file `file_name`, -1 if it has none.
+    """
+    with open(file_name, 'r', encoding="utf-8", newline='') as f:
+        for row in csv.reader(f):
+            order = row_order(row) if row else -1
+            if order != -1:
+                return order
+    return -1
+
+
+def rows_after(file_name, high_water_mark: int) -> List[List[str]]:
+    """
+    The rows of the log file `file_name` whose order is greater than `high_water_mark`, oldest first.
+    Since the newest rows are at the top of the file, only the new part of the file is read.
+    """
+    new_rows = []
+    with open(file_name, 'r', encoding="utf-8", newline='') as f:
+        for row in csv.reader(f):
+            order = row_order(row) if row else -1
+            if order == -1:
+                continue
+            if order <= high_water_mark:
+                break
+            new_rows.append(row)
+    new_rows.reverse()
+    return new_rows
+
+
+def latest_log(path) -> str:
+    """
+    `path` itself if it is a file, otherwise the most recently modified .csv file in the directory `path`.
+    """
+    if not os.path.isdir(path):
+        return path
+    logs = [entry for entry in os.scandir(path) if entry.is_file() and entry.name.endswith(".csv")]
+    if not logs:
+        raise FileNotFoundError(f"No .csv logs found in {path}")
+    return max(logs, key=lambda entry: entry.stat().st_mtime).path
@@ -0,0 +1,62 @@
+"""
+All-in luck: how a player's chips would have gone if every all-in had paid out its expected value.
+
+For each round decided by an all-in between players with known hole cards, the chips those players collected are
+redistributed according to their equity at the moment of the all-in. The difference to what they actually collected
+is that round's luck, and subtracting the accumulated luck from the real chip counts gives the luck adjusted chips.
+"""
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from equity import all_in_spots
+
+
+def all_in_adjustments(evening, spots) -> Dict[str, Dict[int, float]]:
+    """
+    For each player, the chips by which the expected value of each all-in round in `spots` differs from what they
+    actually collected, keyed by round number.
+    """
+    rounds = {round.number: round for round in evening.rounds}
+    adjustments = defaultdict(dict)
+    for spot in spots:
+        won = rounds[spot.round_number].winnings()
+        contested = sum(won.get(player, 0) for player in spot.players)
+        for player, player_equity in zip(spot.players, spot.equities):
+            adjustments[player][spot.round_number] = player_equity * contested - won.get(player, 0)
+    return adjustments
+
+
+def luck_adjusted_amounts(evening, seed: int = 0) -> Dict[str, List[Tuple[int, float]]]:
+    """
+    The chips of each player after every round, like `Evening.historical_amounts`, with every all-in paying out
+    its expected value.
+    """
+    import numpy as np
+
+    adjustments = all_in_adjustments(evening, all_in_spots(evening, seed))
+    n_rounds = len(evening.rounds)
+    adjusted = {}
+    for player, round_amts in evening.historical_amounts.items():
+        rounds, amts = (np.array(column) for column in zip(*round_amts))
+        # Chips are recorded after `round_no` rounds were played, so they include all adjustments up to that round.
+        per_round = np.zeros(n_rounds + 1)
+        for round_no, adjustment in adjustments.get(player, {}).items():
+            per_round[round_no] = adjustment
+        adjusted_amts = amts + np.cumsum(per_round)[rounds]
+        adjusted[player] = list(zip(rounds.tolist(), adjusted_amts.tolist()))
+    return adjusted
+
+
+def print_luck(evening, luck_adjusted: Dict[str, List[Tuple[int, float]]]):
+    from termcolor import colored
+
+    print(colored("All-in Luck (Real chips vs. chips if every all-in paid out its equity)", "white",
+                  attrs=["underline"]))
+    for player in evening.players.keys():
+        if player not in luck_adjusted:
+            continue
+        real = evening.historical_amounts[player][-1][1]
+        expected = luck_adjusted[player][-1][1]
+        print(colored(f"  {player}", "white", attrs=["bold"]))
+        print(f"    Real / All-in EV chips (luck) : {real:>6.0f} / {expected:>6.0f} ({real - expected:>+6.0f})")
+    print()
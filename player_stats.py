@@ -1,29 +1,31 @@
-import statistics
-from termcolor import colored
 from collections import defaultdict
 from utilities import avg, safe_div, median
+from stats_engine import StatAccumulator, PREFLOP, RIVER
 
+# Blinds a player is forced to post, which don't count as voluntarily putting money in the pot
+FORCED_BETS = ("small_blind", "big_blind", "missing_big_blind", "missing_small_blind")
 
-class WinStats:
+
+class WinStats(StatAccumulator):
     def __init__(self, evening):
         # # of wins
         # avg size of wins
         self.evening = evening
-        wins = defaultdict(list)
-        showdown_wins = defaultdict(list)
-        preshowdown_wins = defaultdict(list)
-        for round in evening.get_rounds():
-            for (player, hand, amt, _) in round.winners:
-                wins[player].append(amt)
-                if hand is None:
-                    preshowdown_wins[player].append(amt)
-                else:
-                    showdown_wins[player].append(amt)
-        self.wins = wins
-        self.showdown_wins = showdown_wins
-        self.preshowdown_wins = preshowdown_wins
+        self.wins = defaultdict(list)
+        self.showdown_wins = defaultdict(list)
+        self.preshowdown_wins = defaultdict(list)
+
+    def on_round_end(self, round):
+        for (player, hand, amt, _) in round.winners:
+            self.wins[player].append(amt)
+            if hand is None:
+                self.preshowdown_wins[player].append(amt)
+            else:
+                self.showdown_wins[player].append(amt)
 
     def print(self):
+        from termcolor import colored
+
         showdown_wins = self.showdown_wins
         preshowdown_wins = self.preshowdown_wins
 
@@ -45,30 +47,44 @@ class WinStats:
         print()
 
 
-class PlayStats:
+class PlayStats(StatAccumulator):
+    streets = (PREFLOP, RIVER)
+
     def __init__(self, evening, win_stats: WinStats):
         self.evening = evening
         self.win_stats = win_stats
-        rounds_present = defaultdict(int)
-        rounds_contributed = defaultdict(int)
-        showdowns_played = defaultdict(int)
-        for round in evening.get_rounds():
-            for player in round.names_in_showdown():
-                showdowns_played[player] += 1
-
-            for player in round.voluntary_contributors():
-                rounds_contributed[player] += 1
-
-            for player in round.players_present():
-                rounds_present[player] += 1
-
-        self.rounds_present = rounds_present
-        self.rounds_contributed = rounds_contributed
-        self.showdowns_played = showdowns_played
+        self.rounds_present = defaultdict(int)
+        self.rounds_contributed = defaultdict(int)
+        self.showdowns_played = defaultdict(int)
+
+    def on_round_start(self, round):
+        self._present = set()
+        self._contributed = set()
+        self._in_showdown = set()
+
+    def on_move(self, round, street, move):
+        # Same as Round.players_present(), Round.voluntary_contributors() and Round.names_in_showdown()
+        if street == PREFLOP:
+            self._present.add(move.player)
+            if move.action_name not in FORCED_BETS and move.amount > 0:
+                self._contributed.add(move.player)
+        elif move.action_name != "fold":
+            self._in_showdown.add(move.player)
+
+    def on_round_end(self, round):
+        for player in self._in_showdown:
+            self.showdowns_played[player] += 1
+
+        for player in self._contributed:
+            self.rounds_contributed[player] += 1
+
+        for player in self._present:
+            self.rounds_present[player] += 1
 
     def print(self):
         # % How often you saw each stage
         # % Showdowns won
+        from termcolor import colored
 
         print(colored("Play Stats (What happened when you played in a round?)", "white", attrs=["underline"]))
         max_rounds = len(self.evening.get_rounds())
@@ -94,54 +110,84 @@ class PlayStats:
         print()
 
 
-class PreFlopStats:
+class PreFlopStats(StatAccumulator):
+    streets = (PREFLOP,)
+
     def __init__(self, evening, play_stats: PlayStats):
         # How many times did you limp
         # How many times did you call, what was your avg call
         # How many times did you raise, what was your avg raise
         self.evening = evening
         self.play_stats = play_stats
-        limp_rounds = defaultdict(list)
-        raise_amts = defaultdict(list)
-        raise_rounds = defaultdict(list)
-        three_bet_amts = defaultdict(list)
-        three_bet_rounds = defaultdict(list)
-
-        for round in evening.get_rounds():
-            preflop_amounts = round.money_in_round(round.preflop_moves)
-            for player, amt in preflop_amounts.items():
-                if amt == round.big_blind[1] and 0 == len(round.find_moves(player, "fold", round.preflop_moves)):
-                    limp_rounds[player].append(round)
-
-            # In case there are multiple raises in a single round
-            round_raises = {}
-            round_3bets = {}
-            open_raise = False
-            three_bet = False
-            for move in round.preflop_moves:
-                if move.action_name == "raise":
-                    round_raises[move.player] = move.amount
-                    if not open_raise:
-                        open_raise = True
-                    elif not three_bet:
-                        round_3bets[move.player] = move.amount
-                        three_bet = True
-
-            for player, amt in round_raises.items():
-                raise_amts[player].append(amt)
-                raise_rounds[player].append(round)
-
-            for player, amt in round_3bets.items():
-                three_bet_amts[player].append(amt)
-                three_bet_rounds[player].append(round)
-
-        self.limp_rounds = limp_rounds
-        self.raise_amts = raise_amts
-        self.raise_rounds = raise_rounds
-        self.three_bet_amts = three_bet_amts
-        self.three_bet_rounds = three_bet_rounds
+        self.limp_rounds = defaultdict(list)
+        self.raise_amts = defaultdict(list)
+        self.raise_rounds = defaultdict(list)
+        self.three_bet_amts = defaultdict(list)
+        self.three_bet_rounds = defaultdict(list)
+
+    def on_round_start(self, round):
+        # Builds up Round.money_in_round(round.preflop_moves) move by move
+        self._preflop_amounts = {}
+        self._missing_small_blinds = defaultdict(int)
+        self._missing_big_blinds = defaultdict(int)
+        self._folded = set()
+        self._big_blind = None
+
+        # In case there are multiple raises in a single round
+        self._round_raises = {}
+        self._round_3bets = {}
+        self._open_raise = False
+        self._three_bet = False
+
+    def on_move(self, round, street, move):
+        player = move.player
+        action_name = move.action_name
+        if move.amount != 0:
+            if action_name == "uncalled_bet":
+                self._preflop_amounts[player] = self._preflop_amounts.get(player, 0) - move.amount
+            else:
+                self._preflop_amounts[player] = move.amount
+
+        if action_name == "missing_small_blind":
+            self._missing_small_blinds[player] += move.amount
+        elif action_name == "missing_big_blind":
+            self._missing_big_blinds[player] += move.amount
+        elif action_name == "fold":
+            self._folded.add(player)
+        elif action_name == "big_blind":
+            if self._big_blind is None:
+                self._big_blind = move.amount
+        elif action_name == "raise":
+            self._round_raises[player] = move.amount
+            if not self._open_raise:
+                self._open_raise = True
+            elif not self._three_bet:
+                self._round_3bets[player] = move.amount
+                self._three_bet = True
+
+    def on_round_end(self, round):
+        preflop_amounts = self._preflop_amounts
+        for player, amt in self._missing_small_blinds.items():
+            preflop_amounts[player] += amt
+        for player, amt in self._missing_big_blinds.items():
+            if player not in self._missing_small_blinds:
+                preflop_amounts[player] += amt
+
+        for player, amt in preflop_amounts.items():
+            if amt == self._big_blind and player not in self._folded:
+                self.limp_rounds[player].append(round)
+
+        for player, amt in self._round_raises.items():
+            self.raise_amts[player].append(amt)
+            self.raise_rounds[player].append(round)
+
+        for player, amt in self._round_3bets.items():
+            self.three_bet_amts[player].append(amt)
+            self.three_bet_rounds[player].append(round)
 
     def print(self):
+        from termcolor import colored
+
         print(colored("Preflop Behavior:", "white", attrs=["underline"]))
         for player in self.evening.players.keys():
             total_rounds = self.play_stats.rounds_present[player]
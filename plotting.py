@@ -0,0 +1,80 @@
+"""
+Helpers shared by the plots of log_processor.py and series_stats.py.
+
+Plots are either shown in a window or, given an output file, rendered without a display to a file whose format
+matplotlib picks from its extension (PNG, SVG, PDF, ...). Long series are downsampled to the minimum and maximum of
+each pixel column before they are drawn, so rendering takes as long for a thousand hands as for a million.
+"""
+from typing import Optional, Sequence, Tuple
+
+# Renamed in matplotlib 3.6, the old name is gone since 3.8
+STYLES = ("seaborn-v0_8-bright", "seaborn-bright")
+
+
+def pyplot(output: Optional[str] = None):
+    """
+    matplotlib.pyplot, switched to a non-interactive backend if the plots are written to `output`.
+    """
+    import matplotlib
+
+    if output is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def use_style(plt, styles: Sequence[str] = STYLES):
+    """
+    Uses the first of `styles` this version of matplotlib has, or the default style if it has none of them.
+    """
+    for style in styles:
+        if style in plt.style.available:
+            plt.style.use(style)
+            return
+
+
+def downsample(xs: Sequence[float], ys: Sequence[float], buckets: int) -> Tuple[Sequence[float], Sequence[float]]:
+    """
+    At most 2 * `buckets` points of the line through `xs` and `ys`: the lowest and the highest point of each of
+    `buckets` runs of consecutive points, in their original order. Drawn `buckets` pixels wide, the result looks
+    the same as the whole line. Lines that are short enough are returned unchanged.
+    """
+    import numpy as np
+
+    n = len(xs)
+    if n <= 2 * buckets:
+        return xs, ys
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    size = -(-n // buckets)
+    # Padded with the last point, which argmin and argmax only pick if it's the extreme of its bucket anyway
+    padded = np.concatenate([ys, np.full(size * buckets - n, ys[-1])]).reshape(buckets, size)
+    starts = np.arange(buckets) * size
+    lows = np.minimum(starts + padded.argmin(axis=1), n - 1)
+    highs = np.minimum(starts + padded.argmax(axis=1), n - 1)
+    # Sorted by position, each index at most once; always keeping the ends of the line
+    indices = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return xs[indices], ys[indices]
+
+
+def unzip(points: Sequence[Tuple[float, float]]) -> Tuple[list, list]:
+    """
+    The xs and ys of `points`, much faster than `zip(*points)` for long lists.
+    """
+    return [x for x, _ in points], [y for _, y in points]
+
+
+def pixel_width(fig) -> int:
+    return int(fig.get_figwidth() * fig.dpi)
+
+
+def show_or_save(plt, fig, output: Optional[str] = None):
+    """
+    Writes `fig` to `output`, or shows it if there is no output file.
+    """
+    fig.tight_layout()
+    if output is None:
+        plt.show()
+    else:
+        fig.savefig(output)
+        plt.close(fig)
@@ -0,0 +1,136 @@
+"""
+Positions at the table.
+
+`label_positions` names the position of every player dealt into a hand, from the order of their seats, the dealer
+and who posted the blinds and a straddle. The parser labels every round once, when it's finished, and keeps the labels
+in `Round.positions` (and the session cache), so stats can be sliced by position without working positions out again.
+
+`PositionStats` is VPIP, PFR and the win rate of every player in each position, computed in the same single pass as
+the other stats.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from player_stats import FORCED_BETS
+from stats_engine import StatAccumulator, PREFLOP
+from utilities import safe_div
+
+BUTTON = "BTN"
+SMALL_BLIND = "SB"
+BIG_BLIND = "BB"
+STRADDLE = "STR"
+# The last positions to act before the button, latest last
+LATE_POSITIONS = ("LJ", "HJ", "CO")
+
+
+def middle_positions(count: int) -> List[str]:
+    """
+    The positions of `count` players between the blinds (or the straddle) and the button, first to act first:
+    UTG, UTG+1, ..., LJ, HJ, CO. Only the player right before the button is CO when there are two, and so on.
+    """
+    if count <= 0:
+        return []
+    n_late = min(count - 1, len(LATE_POSITIONS))
+    n_early = count - n_late
+    return ["UTG"] + [f"UTG+{i}" for i in range(1, n_early)] + list(LATE_POSITIONS[len(LATE_POSITIONS) - n_late:])
+
+
+def position_order(positions) -> List[str]:
+    """
+    `positions` sorted like at the table, first to act preflop first and the blinds last.
+    """
+    def key(position):
+        if position.startswith("UTG"):
+            return 0, int(position[4:] or 0)
+        order = LATE_POSITIONS + (BUTTON, SMALL_BLIND, BIG_BLIND, STRADDLE)
+        return (1, order.index(position)) if position in order else (2, position)
+    return sorted(positions, key=key)
+
+
+def label_positions(seat_order: Sequence[str], dealer: Optional[str], small_blind: Optional[str],
+                    big_blind: Optional[str], straddler: Optional[str] = None) -> Dict[str, str]:
+    """
+    The position of every player of `seat_order`, the players dealt into the hand in the order of their seats.
+
+    The dealer is BTN, also when they post the small blind heads up, the players who posted the blinds and a straddle
+    are SB, BB and STR, and everyone else gets the positions of `middle_positions` in the order they act after the
+    button, so with a straddle the first player after the straddler is UTG. Without a dealer (a dead button) the
+    order starts after the big blind.
+    """
+    positions = {}
+    if dealer is not None:
+        positions[dealer] = BUTTON
+    for player, position in ((small_blind, SMALL_BLIND), (big_blind, BIG_BLIND), (straddler, STRADDLE)):
+        if player is not None and player not in positions:
+            positions[player] = position
+
+    anchor = dealer if dealer in seat_order else big_blind
+    order = list(seat_order)
+    if anchor in seat_order:
+        index = order.index(anchor) + 1
+        order = order[index:] + order[:index]
+    middle = [player for player in order if player not in positions]
+    positions.update(zip(middle, middle_positions(len(middle))))
+    return positions
+
+
+class PositionStats(StatAccumulator):
+    streets = (PREFLOP,)
+
+    def __init__(self, evening):
+        self.evening = evening
+        # Keyed by (player, position)
+        self.hands = defaultdict(int)
+        self.voluntary = defaultdict(int)
+        self.raised = defaultdict(int)
+        # Chips won minus chips put in
+        self.net = defaultdict(int)
+        # Net in big blinds, over hands with a big blind
+        self.net_big_blinds = defaultdict(float)
+        self.hands_with_big_blind = defaultdict(int)
+
+    def on_round_start(self, round):
+        self._present = set()
+        self._contributed = set()
+        self._raised = set()
+
+    def on_move(self, round, street, move):
+        # The same as PlayStats and PreFlopStats
+        self._present.add(move.player)
+        if move.action_name not in FORCED_BETS and move.amount > 0:
+            self._contributed.add(move.player)
+        if move.action_name == "raise":
+            self._raised.add(move.player)
+
+    def on_round_end(self, round):
+        won = round.winnings()
+        spent = round.money_spent()
+        big_blind = round.blinds.get("big_blind")
+        for player in self._present:
+            key = (player, round.positions.get(player, "?"))
+            self.hands[key] += 1
+            self.voluntary[key] += player in self._contributed
+            self.raised[key] += player in self._raised
+            net = won.get(player, 0) - spent.get(player, 0)
+            self.net[key] += net
+            if big_blind is not None and big_blind[1] > 0:
+                self.net_big_blinds[key] += net / big_blind[1]
+                self.hands_with_big_blind[key] += 1
+
+    def print(self):
+        from termcolor import colored
+
+        print(colored("Position Stats (How did you play from each seat?)", "white", attrs=["underline"]))
+        for player in self.evening.players.keys():
+            played = [position for p, position in self.hands if p == player]
+            if not played:
+                continue
+            print(colored(f"  Player: {player}", "white", attrs=["bold"]))
+            print(f"    {'position':<8} {'hands':>6} {'VPIP':>8} {'PFR':>8} {'net':>8} {'bb/100':>8}")
+            for position in position_order(played):
+                key = (player, position)
+                hands = self.hands[key]
+                bb_per_100 = safe_div(self.net_big_blinds[key], self.hands_with_big_blind[key]) * 100
+                print(f"    {position:<8} {hands:>6} {safe_div(self.voluntary[key], hands) * 100:7.2f}% "
+                      f"{safe_div(self.raised[key], hands) * 100:7.2f}% {self.net[key]:>8} {bb_per_100:>8.1f}")
+        print()
@@ -0,0 +1,265 @@
+"""
+The 169 classes of starting hands (AA, AKs, AKo, ..., 32o) and how the known hands of players are distributed over them.
+
+Classes are indexed by their rank in resources/hand_order.txt, strongest first, so a lower index is a stronger hand.
+The ranking is read once, and a 52x52 table built from it maps any two cards, encoded as in hand_evaluator.py, to
+their class, so classifying many hands is a single NumPy lookup.
+
+A `HandDistribution` counts the classes of the hands of a player. Distributions of single logs add up over an
+archive and are compared with the distribution expected from dealing, as a chi-square statistic over ten groups of
+equally strong hands. Only the hands dealt to the player who downloaded the log are a fair sample: the hands of
+other players are only known when they're shown, which favours strong hands.
+
+    python3 preflop_classes.py logs/*.csv --username "Big Kenny" [--jobs 4]
+"""
+import argparse
+import functools
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from hand_evaluator import parse_card
+from series_stats import NameMapping
+from session_cache import file_hash, map_logs, parse_with_cache
+from utilities import CARD_ORDER, HAND_ORDER_FILE, hand_ranks, safe_div
+
+N_CLASSES = 169
+# Hands are grouped by the percentile of their class in the ranking for the chi-square test, so that every group is
+# expected often enough
+N_GROUPS = 10
+
+
+def class_name(rank1: int, rank2: int, suited: bool) -> str:
+    """
+    The name of the class of two cards of ranks indexing `utilities.CARD_ORDER`, e.g. "AKs", "T9o" or "77".
+    """
+    high, low = CARD_ORDER[max(rank1, rank2)], CARD_ORDER[min(rank1, rank2)]
+    if high == low:
+        return high + low
+    return high + low + ("s" if suited else "o")
+
+
+class _Tables:
+    def __init__(self):
+        ranking = hand_ranks()
+        self.names: List[str] = list(ranking)
+        # The share of all starting hands, in percent, that are at least as strong as each class
+        self.percentiles = np.array(list(ranking.values()))
+        index = {name: i for i, name in enumerate(self.names)}
+        assert len(index) == N_CLASSES, f"{HAND_ORDER_FILE} should rank all {N_CLASSES} starting hands"
+
+        # -1 for the same card twice
+        self.classes = np.full((52, 52), -1, dtype=np.int16)
+        for card1 in range(52):
+            for card2 in range(52):
+                if card1 != card2:
+                    suited = card1 & 3 == card2 & 3
+                    self.classes[card1, card2] = index[class_name(card1 >> 2, card2 >> 2, suited)]
+        # Of the 1326 two card combinations, 6 make each pair, 4 each suited and 12 each offsuit hand
+        self.combinations = np.array([6 if len(name) == 2 else 4 if name[2] == "s" else 12 for name in self.names])
+        self.expected = self.combinations / self.combinations.sum()
+        # 0 for the strongest 10% of hands (percentiles up to 10), 1 up to 20, ...
+        self.groups = np.clip(np.ceil(self.percentiles * N_GROUPS / 100) - 1, 0, N_GROUPS - 1).astype(np.int64)
+
+
+_tables: Optional[_Tables] = None
+
+
+def _get_tables() -> _Tables:
+    global _tables
+    if _tables is None:
+        _tables = _Tables()
+    return _tables
+
+
+def class_names() -> List[str]:
+    return _get_tables().names
+
+
+def hand_class(cards: Sequence[str]) -> int:
+    """
+    The class of two cards as written in the logs, e.g. ["10♦", "K♠"].
+    """
+    card1, card2 = cards
+    return int(_get_tables().classes[parse_card(card1), parse_card(card2)])
+
+
+def classify_batch(cards: np.ndarray) -> np.ndarray:
+    """
+    The classes of many hands at once. `cards` is an integer array of encoded cards of shape (number of hands, 2).
+    """
+    cards = np.asarray(cards, dtype=np.int64).reshape(-1, 2)
+    return _get_tables().classes[cards[:, 0], cards[:, 1]].astype(np.int64)
+
+
+def class_percentiles(classes: np.ndarray) -> np.ndarray:
+    """
+    The percentile in the ranking of each of `classes`, the share of starting hands at least as strong.
+    """
+    return _get_tables().percentiles[classes]
+
+
+class ChiSquare:
+    def __init__(self, statistic: float, degrees_of_freedom: int):
+        self.statistic = statistic
+        self.degrees_of_freedom = degrees_of_freedom
+
+    @property
+    def p_value(self) -> float:
+        """
+        The chance of a statistic at least this large from fairly dealt hands, with the Wilson-Hilferty
+        approximation of the chi-square distribution.
+        """
+        k = self.degrees_of_freedom
+        if k <= 0:
+            return 1.0
+        z = ((self.statistic / k) ** (1 / 3) - (1 - 2 / (9 * k))) / math.sqrt(2 / (9 * k))
+        return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+class HandDistribution:
+    def __init__(self, counts: np.ndarray = None):
+        # Hands of each class
+        self.counts = np.zeros(N_CLASSES, dtype=np.int64) if counts is None else counts
+
+    @classmethod
+    def of_classes(cls, classes: np.ndarray) -> "HandDistribution":
+        return cls(np.bincount(classes, minlength=N_CLASSES).astype(np.int64))
+
+    def merge(self, other: "HandDistribution") -> "HandDistribution":
+        self.counts += other.counts
+        return self
+
+    @property
+    def hands(self) -> int:
+        return int(self.counts.sum())
+
+    def median_percentile(self) -> float:
+        """
+        The percentile in the ranking of the median hand, 50 for fairly dealt hands, lower for stronger ones.
+        """
+        if self.hands == 0:
+            return 0.0
+        middle = np.searchsorted(np.cumsum(self.counts), (self.hands + 1) / 2)
+        return float(_get_tables().percentiles[middle])
+
+    def share_of(self, strongest: float) -> Tuple[float, float]:
+        """
+        The share of the hands in the `strongest` percent of starting hands, and the share expected from dealing.
+        """
+        tables = _get_tables()
+        best = tables.percentiles <= strongest
+        return safe_div(int(self.counts[best].sum()), self.hands), float(tables.expected[best].sum())
+
+    def chi_square(self) -> ChiSquare:
+        """
+        How far the hands are from fairly dealt ones, over N_GROUPS groups of classes of about equal strength.
+        """
+        tables = _get_tables()
+        observed = np.bincount(tables.groups, weights=self.counts, minlength=N_GROUPS)
+        expected = np.bincount(tables.groups, weights=tables.expected, minlength=N_GROUPS) * self.hands
+        if self.hands == 0:
+            return ChiSquare(0.0, 0)
+        return ChiSquare(float(((observed - expected) ** 2 / expected).sum()), N_GROUPS - 1)
+
+
+def known_hands(evening, username: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    The encoded hole cards of every player with known hands in `evening`, as arrays of shape (hands, 2). The hands
+    dealt to the player who downloaded the log are filed under `username` if given.
+    """
+    hands: Dict[str, List[Tuple[int, int]]] = {}
+    for round in evening.rounds:
+        # Shown hands of the player who downloaded the log are also their dealt hands, count them once
+        by_player = {}
+        for player, cards in round.hole_cards.items():
+            if player == evening.username and username is not None:
+                player = username
+            by_player[player] = cards
+        for player, cards in by_player.items():
+            hands.setdefault(player, []).append((parse_card(cards[0]), parse_card(cards[1])))
+    return {player: np.array(cards, dtype=np.int64).reshape(-1, 2) for player, cards in hands.items()}
+
+
+def distributions(evening, username: Optional[str] = None,
+                  name_mapping: NameMapping = None) -> Dict[str, HandDistribution]:
+    result: Dict[str, HandDistribution] = {}
+    for player, cards in known_hands(evening, username).items():
+        if name_mapping is not None:
+            player = name_mapping.normalise_name(player)
+        distribution = HandDistribution.of_classes(classify_batch(cards))
+        if player in result:
+            result[player].merge(distribution)
+        else:
+            result[player] = distribution
+    return result
+
+
+def distributions_of_log(file_name, username: Optional[str] = None, name_mapping: NameMapping = None,
+                         use_cache=True) -> Tuple[str, Dict[str, HandDistribution]]:
+    """
+    The id (hash) of the log `file_name` and the distributions of its known hands.
+    """
+    from log_processor import Parser
+
+    evening = parse_with_cache(Parser(ignore_warnings=False), "", file_name, use_cache)
+    return file_hash(file_name), distributions(evening, username, name_mapping)
+
+
+def archive_distributions(file_names, username: Optional[str] = None, name_mapping: NameMapping = None, jobs=1,
+                          use_cache=True) -> Dict[str, HandDistribution]:
+    """
+    The distributions of the known hands of every player over all logs `file_names`, parsed by a pool of `jobs`
+    processes if `jobs` > 1. The same log given twice is only counted once.
+    """
+    worker = functools.partial(distributions_of_log, username=username, name_mapping=name_mapping,
+                               use_cache=use_cache)
+    merged: Dict[str, HandDistribution] = {}
+    logs = set()
+    for log_id, result in map_logs(worker, file_names, jobs):
+        if log_id in logs:
+            continue
+        logs.add(log_id)
+        for player, distribution in result.items():
+            if player in merged:
+                merged[player].merge(distribution)
+            else:
+                merged[player] = distribution
+    return merged
+
+
+def print_distributions(distributions: Dict[str, HandDistribution], username: Optional[str] = None):
+    from termcolor import colored
+
+    print(colored("Starting Hands (Were you dealt your fair share?)", "white", attrs=["underline"]))
+    print(f"  {'player':<24} {'hands':>6} {'median %':>8} {'top 10%':>8} {'expected':>8} {'chi2':>7} {'p':>6}")
+    for player, distribution in sorted(distributions.items(), key=lambda item: item[1].hands, reverse=True):
+        top, expected = distribution.share_of(10)
+        chi_square = distribution.chi_square()
+        shown = "" if player == username else " (shown)"
+        print(f"  {player:<24} {distribution.hands:>6} {distribution.median_percentile():>8.1f} "
+              f"{top * 100:7.2f}% {expected * 100:7.2f}% {chi_square.statistic:>7.1f} "
+              f"{chi_square.p_value:>6.3f}{shown}")
+    print()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prints how the known starting hands of every player compare "
+                                                     "to fairly dealt ones over many logs.")
+    arg_parser.add_argument("log_files", nargs="+", help="Paths to log files from pokernow.club")
+    arg_parser.add_argument("--username", help="Your name in the logs, the hands dealt to you are filed under it.")
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the logs, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing logs in parallel.")
+    args = arg_parser.parse_args()
+
+    import colorama
+    colorama.init()
+
+    username = args.username if args.username is not None else "You"
+    print_distributions(archive_distributions(args.log_files, username, jobs=args.jobs, use_cache=not args.no_cache),
+                        username)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Opt-in profiling of where the time of a run goes.
+
+A `Profiler` keeps a call count and cumulative time per named section. Code is only instrumented when a profiler is
+given: the parser then switches to a timed version of `parse_line`, and methods of single objects are wrapped with
+`Profiler.wrap`, so nothing changes on the hot paths of a normal run.
+
+Section names are grouped by their prefix, e.g. "line/Move (call)" for classifying a line or "handler/_on_move" for
+handling it. Sections nest, the time of "parse" includes the time of all lines and handlers.
+"""
+import contextlib
+import time
+from typing import Dict, List, Optional
+
+
+class Profiler:
+    def __init__(self):
+        # Section name to [number of calls, nanoseconds]
+        self.sections: Dict[str, List[int]] = {}
+
+    def add(self, name: str, nanoseconds: int, count: int = 1):
+        section = self.sections.get(name)
+        if section is None:
+            self.sections[name] = [count, nanoseconds]
+        else:
+            section[0] += count
+            section[1] += nanoseconds
+
+    @contextlib.contextmanager
+    def section(self, name: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter_ns() - start)
+
+    def wrap(self, obj, method_name: str, name: str):
+        """
+        Times every call of the method `method_name` of `obj` (only that object) as the section `name`.
+        """
+        method = getattr(obj, method_name)
+        add = self.add
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                add(name, perf_counter_ns() - start)
+        setattr(obj, method_name, timed)
+
+    def to_json(self) -> dict:
+        return {name: {"count": count, "seconds": nanoseconds / 1e9}
+                for name, (count, nanoseconds) in self.sections.items()}
+
+    def write_json(self, file_name):
+        import json
+
+        with open(file_name, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def print(self):
+        print("Profile")
+        print(f"  {'section':<40} {'count':>9} {'ms':>10} {'us/call':>9}")
+        # Groups in the order they were first seen, slowest sections first within each group
+        groups = {}
+        for name in self.sections:
+            groups.setdefault(name.split("/")[0], []).append(name)
+        for names in groups.values():
+            for name in sorted(names, key=lambda n: self.sections[n][1], reverse=True):
+                count, nanoseconds = self.sections[name]
+                print(f"  {name:<40} {count:>9} {nanoseconds / 1e6:10.3f} {nanoseconds / 1e3 / count:9.1f}")
+        print()
+
+
+def section(profiler: Optional[Profiler], name: str):
+    """
+    `profiler.section(name)`, or a context doing nothing if there is no profiler.
+    """
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.section(name)
@@ -0,0 +1,246 @@
+"""
+Monte Carlo "what-if" simulation of a tournament series: how much of the standings is skill and how much variance.
+
+Each game of the series is reduced to what every player won and spent in it under a `TournamentSpec`, as in
+`SeriesStats.calc_stats`. Simulated series are then drawn in one of two ways:
+
+ - "bootstrap": a series of as many games, drawn with replacement from the games played. The spread of each
+   player's totals over the simulated series is a confidence interval on their won/spent ratio and winnings.
+ - "luck": the games that were played, with the finishing positions of each game shuffled at random, i.e. a series
+   between players of equal skill. The share of simulated series in which a player did at least as well as they
+   really did tells how likely their result is from luck alone.
+
+Series are simulated in chunks with NumPy, a chunk of bootstrapped series being a matrix product of multinomial game
+counts with the per-game amounts. Chunks run on a pool of processes, each with its own seed spawned from a single
+`seed`, so results only depend on the seed and not on the number of processes. The totals of each player are
+accumulated in fixed histograms, so millions of series take no more memory than a thousand.
+
+    python3 series_stats.py logs/series/*.csv --simulate 1000000 --method luck --jobs 4
+"""
+import concurrent.futures
+import contextlib
+import functools
+import math
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+from series_stats import NameMapping, SeriesStats, TournamentSpec
+
+METHODS = ("bootstrap", "luck")
+CHUNK_SIZE = 20000
+# Bins of the histograms of each player's totals, and how many standard deviations around the mean they cover
+BINS = 4096
+SPREAD = 8
+
+
+class SeriesTable(NamedTuple):
+    players: List[str]
+    # By game and player, 0 for the games a player wasn't in
+    won: np.ndarray
+    spent: np.ndarray
+    # For each game, the player of each finishing position and the prize for each position
+    game_players: List[np.ndarray]
+    game_prizes: List[np.ndarray]
+
+
+def series_table(evenings, name_mapping: NameMapping, spec: TournamentSpec) -> SeriesTable:
+    """
+    The winnings and spending of every player in every game of `evenings`, paid out like `SeriesStats.calc_stats`.
+    """
+    rankings = [[name_mapping.normalise_name(player) for player in SeriesStats.evening_ranking(evening)]
+                for evening in evenings]
+    players = sorted({player for ranking in rankings for player in ranking})
+    index = {player: i for i, player in enumerate(players)}
+    won = np.zeros((len(rankings), len(players)))
+    spent = np.zeros((len(rankings), len(players)))
+    game_players, game_prizes = [], []
+    for game, ranking in enumerate(rankings):
+        total_pot = spec.start_amount * len(ranking)
+        prizes = np.array([int(spec.prize_fraction_for_position(pos) * total_pot)
+                           for pos in range(1, len(ranking) + 1)], dtype=np.float64)
+        columns = np.array([index[player] for player in ranking], dtype=np.int64)
+        # Aliases of one player in the same game add up
+        np.add.at(won[game], columns, prizes)
+        np.add.at(spent[game], columns, spec.start_amount)
+        game_players.append(columns)
+        game_prizes.append(prizes)
+    return SeriesTable(players, won, spent, game_players, game_prizes)
+
+
+class Histograms:
+    """
+    The distribution of the total winnings and of the won/spent ratio of every player over simulated series.
+    """
+    def __init__(self, low: np.ndarray, high: np.ndarray, realised: np.ndarray):
+        # By player and then winnings (0) and ratio (1): the range of the histogram, values outside it are counted
+        # in the first or last bin
+        self.low = low
+        self.high = high
+        # The realised winnings and ratio of each player
+        self.realised = realised
+        n_players = len(low)
+        self.counts = np.zeros((n_players, 2, BINS), dtype=np.int64)
+        self.sums = np.zeros((n_players, 2))
+        # Series in which a player's winnings and ratio were at least the realised ones
+        self.at_least = np.zeros((n_players, 2), dtype=np.int64)
+
+    def add(self, values: np.ndarray):
+        """
+        Adds the outcomes of many series, `values` has shape (series, players, 2). NaN (a ratio with nothing spent)
+        is skipped.
+        """
+        n_players = len(self.low)
+        defined = ~np.isnan(values)
+        bins = np.clip(((values - self.low) / (self.high - self.low) * BINS), 0, BINS - 1)
+        bins = np.where(defined, bins, 0).astype(np.int64)
+        keys = (np.arange(n_players * 2).reshape(n_players, 2) * BINS + bins)[defined]
+        self.counts += np.bincount(keys, minlength=n_players * 2 * BINS).reshape(n_players, 2, BINS)
+        self.sums += np.where(defined, values, 0).sum(axis=0)
+        self.at_least += (defined & (values >= self.realised - 1e-9)).sum(axis=0)
+
+    def merge(self, other: "Histograms") -> "Histograms":
+        self.counts += other.counts
+        self.sums += other.sums
+        self.at_least += other.at_least
+        return self
+
+    def quantile(self, q: float) -> np.ndarray:
+        """
+        The `q` quantile of the winnings and the ratio of each player, shape (players, 2), to within a bin.
+        """
+        cumulative = np.cumsum(self.counts, axis=2)
+        totals = cumulative[:, :, -1:]
+        bins = (cumulative < np.maximum(q * totals, 1)).sum(axis=2)
+        return self.low + (bins + 0.5) / BINS * (self.high - self.low)
+
+    def mean(self) -> np.ndarray:
+        return self.sums / np.maximum(self.counts.sum(axis=2), 1)
+
+    def share_at_least(self) -> np.ndarray:
+        return self.at_least / np.maximum(self.counts.sum(axis=2), 1)
+
+
+def _ranges(table: SeriesTable, method: str) -> np.ndarray:
+    """
+    The range of the histograms of each player, shape (players, 2, 2): low and high of winnings and ratio. Winnings
+    cover SPREAD standard deviations around their exact mean, within the extremes a series can reach.
+    """
+    n_games, n_players = table.won.shape
+    played = table.spent > 0
+    if method == "bootstrap":
+        net = table.won - table.spent
+        mean = n_games * net.mean(axis=0)
+        deviation = math.sqrt(n_games) * net.std(axis=0)
+        lowest, highest = n_games * net.min(axis=0), n_games * net.max(axis=0)
+        ratios = np.where(played, table.won / np.where(played, table.spent, 1), 0)
+        ratio_low, ratio_high = np.zeros(n_players), ratios.max(axis=0)
+    else:
+        # Every player gets one of the prizes of each of their games with equal chances, independently
+        spent = table.spent.sum(axis=0)
+        mean, variance = -spent, np.zeros(n_players)
+        lowest, highest = -spent, -spent
+        for columns, prizes in zip(table.game_players, table.game_prizes):
+            np.add.at(mean, columns, prizes.mean())
+            np.add.at(variance, columns, prizes.var())
+            np.add.at(lowest, columns, prizes.min())
+            np.add.at(highest, columns, prizes.max())
+        deviation = np.sqrt(variance)
+        ratio_low, ratio_high = (lowest + spent) / np.maximum(spent, 1), (highest + spent) / np.maximum(spent, 1)
+    low = np.maximum(mean - SPREAD * deviation, lowest)
+    high = np.minimum(mean + SPREAD * deviation, highest)
+    # Every histogram needs a range, even of a single value
+    high = np.maximum(high, low + 1)
+    ratio_high = np.maximum(ratio_high, ratio_low + 1e-6)
+    return np.stack([np.stack([low, ratio_low], axis=1), np.stack([high, ratio_high], axis=1)], axis=2)
+
+
+def _outcomes(won: np.ndarray, spent: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where(spent > 0, won / spent, np.nan)
+    return np.stack([won - spent, ratios], axis=-1)
+
+
+def _simulate_chunk(table: SeriesTable, method: str, n_series: int, seed, ranges: np.ndarray,
+                    realised: np.ndarray) -> Histograms:
+    rng = np.random.default_rng(seed)
+    n_games, n_players = table.won.shape
+    if method == "bootstrap":
+        counts = rng.multinomial(n_games, np.full(n_games, 1 / n_games), size=n_series).astype(np.float64)
+        won, spent = counts @ table.won, counts @ table.spent
+    else:
+        won = np.zeros((n_series, n_players))
+        for columns, prizes in zip(table.game_players, table.game_prizes):
+            shuffled = rng.permuted(np.tile(prizes, (n_series, 1)), axis=1)
+            for position, column in enumerate(columns):
+                won[:, column] += shuffled[:, position]
+        spent = np.broadcast_to(table.spent.sum(axis=0), won.shape)
+    histograms = Histograms(ranges[:, :, 0], ranges[:, :, 1], realised)
+    histograms.add(_outcomes(won, spent))
+    return histograms
+
+
+class Simulation(NamedTuple):
+    spec: TournamentSpec
+    method: str
+    n_series: int
+    players: List[str]
+    # Shape (players, 2): winnings and ratio
+    realised: np.ndarray
+    histograms: Histograms
+
+    def print(self, confidence: float = 0.95):
+        tail = (1 - confidence) / 2
+        low, high = self.histograms.quantile(tail), self.histograms.quantile(1 - tail)
+        mean = self.histograms.mean()
+        share = self.histograms.share_at_least()
+        description = ("games drawn with replacement" if self.method == "bootstrap"
+                       else "positions of every game shuffled, i.e. no skill")
+        print(f"{self.spec}: {self.n_series} simulated series, {description}, {confidence * 100:g}% intervals")
+        header = f"{'player':>16s}  {'ratio':>6s} {'mean':>6s} {'interval':>15s}  {'winnings':>9s} {'mean':>9s} " \
+                 f"{'interval':>21s}"
+        print(header + ("  by luck" if self.method == "luck" else ""))
+        order = sorted(range(len(self.players)), key=lambda i: self.realised[i, 0], reverse=True)
+        for i in order:
+            line = (f"{self.players[i]:>16s}: {self.realised[i, 1]:6.2f} {mean[i, 1]:6.2f} "
+                    f"[{low[i, 1]:6.2f}, {high[i, 1]:6.2f}]  {self.realised[i, 0]:9.0f} {mean[i, 0]:9.0f} "
+                    f"[{low[i, 0]:9.0f}, {high[i, 0]:9.0f}]")
+            if self.method == "luck":
+                # How likely a result at least this good is without any skill
+                line += f"  {share[i, 0] * 100:6.2f}%"
+            print(line)
+        print()
+
+
+def simulate(evenings, name_mapping: NameMapping, spec: TournamentSpec, n_series: int, method: str = "bootstrap",
+             jobs: int = 1, seed: int = 0) -> Simulation:
+    """
+    Simulates `n_series` series of the games `evenings` with `method`, one of METHODS, on `jobs` processes.
+    The same `seed` gives the same results with any number of processes.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown method {method!r}, expected one of {METHODS}")
+    table = series_table(evenings, name_mapping, spec)
+    realised = _outcomes(table.won.sum(axis=0), table.spent.sum(axis=0))
+    ranges = _ranges(table, method)
+    sizes = [min(CHUNK_SIZE, n_series - start) for start in range(0, n_series, CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    worker = functools.partial(_simulate_chunk, table, method, ranges=ranges, realised=realised)
+    histograms = Histograms(ranges[:, :, 0], ranges[:, :, 1], realised)
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=jobs))
+            results = executor.map(worker, sizes, seeds)
+        else:
+            results = map(worker, sizes, seeds)
+        for chunk in results:
+            histograms.merge(chunk)
+    return Simulation(spec, method, n_series, table.players, realised, histograms)
+
+
+def simulate_specs(evenings, name_mapping: NameMapping, specs: Sequence[TournamentSpec], n_series: int,
+                   method: str = "bootstrap", jobs: int = 1, seed: int = 0) -> List[Simulation]:
+    """
+    `simulate` for each of `specs`, every one from the same seed.
+    """
+    return [simulate(evenings, name_mapping, spec, n_series, method, jobs, seed) for spec in specs]
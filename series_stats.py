@@ -5,12 +5,14 @@ In tournament games (as opposed to cash games) we are interested in the order in
 and this affects awarded prizes. The chips are not that important and are not directly tied to cash.
 """
 import argparse
+import functools
+import os
+import sys
 from collections import defaultdict
-from typing import Dict, List, Callable
-
-import matplotlib.pyplot as plt
+from typing import Dict, List, Callable, Tuple
 
 from log_processor import Parser
+from session_cache import map_logs, parse_with_cache
 
 
 class NameMapping:
@@ -106,6 +108,44 @@ class PlayerStats:
         return self.cumulated_spending[-1] if self.cumulated_spending else 0.0
 
 
+class EveningSummary:
+    """
+    The parts of a parsed evening the series stats need. Unlike a full `Evening` this is small and cheap to
+    send between processes.
+    """
+    def __init__(self, historical_amounts: Dict[str, List[Tuple[int, int]]],
+                 eliminations: Dict[str, Tuple[int, int]]):
+        self.historical_amounts = dict(historical_amounts)
+        self.eliminations = dict(eliminations)
+
+    @classmethod
+    def of(cls, evening) -> "EveningSummary":
+        return cls(evening.historical_amounts, evening.eliminations)
+
+
+def summarise_log(file_name, use_cache=True, rebuild_cache=False) -> Tuple[EveningSummary, str]:
+    """
+    Parses a single log and returns its summary along with its report of stacks that differ from the log, so
+    reports from parallel workers can be shown in a deterministic order.
+    """
+    evening = parse_with_cache(Parser(ignore_warnings=False), "", file_name, use_cache, rebuild_cache)
+    report = evening.stack_report()
+    return EveningSummary.of(evening), f"{file_name}:\n{report}" if report else ""
+
+
+def summarise_logs(file_names, jobs=1, use_cache=True, rebuild_cache=False) -> List[EveningSummary]:
+    """
+    Summaries of the logs `file_names`, in the same order. With `jobs` > 1 the logs are parsed by a pool of
+    that many processes.
+    """
+    worker = functools.partial(summarise_log, use_cache=use_cache, rebuild_cache=rebuild_cache)
+    summaries = []
+    for summary, report in map_logs(worker, file_names, jobs):
+        sys.stdout.write(report)
+        summaries.append(summary)
+    return summaries
+
+
 class SeriesStats:
     def __init__(self, evenings, name_mapping, tournament_spec):
         self.evenings = evenings
@@ -113,28 +153,36 @@ class SeriesStats:
         self.tournament_spec = tournament_spec
         self.player_stats = defaultdict(PlayerStats)
 
-    def run(self):
+    def run(self, output=None):
+        """
+        Prints the stats and plots them. With `output`, e.g. series.png, the plots are written to series_ratios.png
+        and series_diffs.png instead of being shown.
+        """
         self.calc_stats()
         self.print_stats()
-        self.plot_ratios()
-        self.plot_diffs()
+        self.plot_ratios(self._plot_file(output, "ratios"))
+        self.plot_diffs(self._plot_file(output, "diffs"))
+
+    @staticmethod
+    def _plot_file(output, name):
+        if output is None:
+            return None
+        root, extension = os.path.splitext(output)
+        return f"{root}_{name}{extension}"
 
     @staticmethod
     def evening_ranking(evening) -> List[str]:
         elimination = {}
 
-        # For each player find the round when they were eliminated (first reached 0.0).
-        # Also track chip amount for tie breakers.
+        # The round each player was eliminated in, recorded by the parser, and their chips before it as a tie
+        # breaker. Players still in are ranked by their last amount.
         for player, rounds_amts in evening.historical_amounts.items():
-            eliminated_round = next((round_no for round_no, amt in rounds_amts if amt == 0.0), None)
-
-            if eliminated_round is None:
+            if player in evening.eliminations:
+                elimination[player] = evening.eliminations[player]
+            else:
                 _, last_amount = rounds_amts[-1]
                 never = float("inf")
                 elimination[player] = (never, last_amount)
-            else:
-                _, amount_at_prev_round = rounds_amts[eliminated_round - 1] if eliminated_round > 0 else 0
-                elimination[player] = (eliminated_round, amount_at_prev_round)
 
         # Now calculate the rankings by sorting based on eliminated round (the greater the better)
         # and last non-zero amounts as a potential tie breaker (also the greater the better).
@@ -192,23 +240,30 @@ class SeriesStats:
             print(f"{player_name:>16s}: {v:.0f}")
         print()
 
-    def plot_ratios(self):
+    def plot_ratios(self, output=None):
         title = "Won/Spent ratios over time"
         ylabel = "Won/Spent ratio"
-        self.plot(self.player_stats, lambda s: s.ratios, title, ylabel)
+        self.plot(self.player_stats, lambda s: s.ratios, title, ylabel, output)
 
-    def plot_diffs(self):
+    def plot_diffs(self, output=None):
         title = "Total winnings over time"
         ylabel = "Total winnings, chips"
-        self.plot(self.player_stats, lambda s: s.diffs, title, ylabel)
+        self.plot(self.player_stats, lambda s: s.diffs, title, ylabel, output)
 
     def plot(self,
              data: Dict[str, PlayerStats],
              key: Callable[[PlayerStats], List[float]],
              title: str,
-             ylabel: str):
+             ylabel: str,
+             output: str = None):
+        """
+        Plots `key` of every player's stats over the games, and writes the plot to `output` if given instead of
+        showing it.
+        """
+        from plotting import downsample, pixel_width, pyplot, show_or_save, use_style
 
-        plt.style.use('seaborn-bright')
+        plt = pyplot(output)
+        use_style(plt)
 
         # Other nice styles to try: Solarize_Light2
         #
@@ -229,25 +284,31 @@ class SeriesStats:
         n = len(self.player_stats)
         ax.set_prop_cycle('color', [color_map(i / n) for i in range(n)])
 
+        width = pixel_width(fig)
         for player, stats in data.items():
-            ax.plot(stats.game_numbers, key(stats), label=player)
+            ax.plot(*downsample(stats.game_numbers, key(stats), width), label=player)
 
         ax.set_title(title)
         ax.set_xlabel("Game #")
         ax.set_ylabel(ylabel)
         ax.legend(loc="upper right")
 
-        plt.tight_layout()
-        plt.show()
+        show_or_save(plt, fig, output)
 
 
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("log_files", nargs="+", help='Paths to log files from pokernow.club')
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the logs, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--rebuild-cache", dest="rebuild_cache", action="store_true", help="Parses the logs again and replaces their entries in the cache of parsed logs.")
+    arg_parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing logs in parallel.")
+    arg_parser.add_argument("--simulate", type=int, metavar="N", help="Also simulates N series of the games played to tell skill from variance, see series_simulation.py.")
+    arg_parser.add_argument("--method", choices=("bootstrap", "luck"), default="bootstrap", help="How --simulate draws series: games drawn with replacement (confidence intervals), or the positions of every game shuffled (results without skill).")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of --simulate, the same seed gives the same results with any --jobs.")
+    arg_parser.add_argument("--output", help="Writes the plots to files named after this one instead of showing them, e.g. series.png gives series_ratios.png and series_diffs.png. Works without a display.")
     args = arg_parser.parse_args()
 
-    p = Parser()
-    evenings = [p.parse("", file) for file in args.log_files]
+    evenings = summarise_logs(args.log_files, args.jobs, use_cache=not args.no_cache, rebuild_cache=args.rebuild_cache)
 
     # TODO: move that to a config file.
     name_mapping = NameMapping({
@@ -263,7 +324,13 @@ def main():
     # spec = TournamentSpec({1: 0.5, 2: 0.3, 3: 0.2}, 2000)
 
     series_stats = SeriesStats(evenings, name_mapping, spec)
-    series_stats.run()
+    series_stats.run(args.output)
+
+    if args.simulate:
+        from series_simulation import simulate_specs
+        for simulation in simulate_specs(evenings, name_mapping, [spec], args.simulate, args.method, args.jobs,
+                                         args.seed):
+            simulation.print()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""
+On-disk cache of parsed evenings.
+
+A cached evening is stored in a single binary file: a JSON header with the evening's rounds, stacks and player names,
+followed by the raw columns of its action table. Entries are keyed by the SHA-256 of the log file's contents, the
+parser version, the username and whether unknown lines were ignored, so a log is only parsed again when it or the
+parser changes. Files of the cache directory are evicted least recently used first once it grows beyond its size
+limit, along with temporary files left behind by interrupted writes.
+"""
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Iterator, Optional
+
+from action_table import ActionTable
+from log_processor import Evening, PARSER_VERSION
+
+MAGIC = b"PNSTATS\n"
+SUFFIX = ".session"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+TMP_SUFFIX = ".tmp"
+# Temporary files older than this are left over from interrupted writes rather than being written
+STALE_TMP_SECONDS = 3600
+
+_HEADER_LENGTH = struct.Struct("<Q")
+
+
+def default_cache_dir() -> str:
+    return os.environ.get("POKERNOW_STATS_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "pokernow_club_stats"))
+
+
+def file_hash(file_name) -> str:
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def evict_lru(directory, suffix, max_bytes):
+    """
+    Removes the least recently used files of `directory` ending in `suffix` until they fit in `max_bytes`, and stale
+    temporary files.
+    """
+    # Several processes may share the directory, so files can disappear while we look at them.
+    stats = {}
+    stale = time.time() - STALE_TMP_SECONDS
+    for entry in os.scandir(directory):
+        try:
+            if entry.name.endswith(suffix):
+                stats[entry.path] = entry.stat()
+            elif entry.name.endswith(TMP_SUFFIX) and entry.stat().st_mtime < stale:
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+    total = sum(stat.st_size for stat in stats.values())
+    for path in sorted(stats, key=lambda p: stats[p].st_mtime):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= stats[path].st_size
+
+
+def write_evening(evening: Evening, f):
+    columns = evening.actions.to_bytes()
+    header = {
+        "parser_version": PARSER_VERSION,
+        "byteorder": sys.byteorder,
+        "state": evening.to_state(),
+        "player_names": evening.actions.player_names,
+        "columns": [[name, len(data)] for name, data in columns.items()],
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    f.write(MAGIC)
+    f.write(_HEADER_LENGTH.pack(len(header_bytes)))
+    f.write(header_bytes)
+    for data in columns.values():
+        f.write(data)
+
+
+def read_evening(f) -> Optional[Evening]:
+    """
+    Reads an evening written by `write_evening`. Returns None if it was written by another parser version or
+    on a machine with a different byte order.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        return None
+    header_length, = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+    header = json.loads(f.read(header_length).decode("utf-8"))
+    if header["parser_version"] != PARSER_VERSION or header["byteorder"] != sys.byteorder:
+        return None
+    columns = {name: f.read(length) for name, length in header["columns"]}
+    actions = ActionTable.from_bytes(header["player_names"], columns)
+    return Evening.from_state(header["state"], actions)
+
+
+class SessionCache:
+    def __init__(self, directory: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory if directory is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def _path(self, file_name, username, ignore_warnings) -> str:
+        user_hash = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+        # Ignoring unknown lines can give a different evening than stopping at them
+        mode = "lenient" if ignore_warnings else "strict"
+        return os.path.join(self.directory,
+                            f"{file_hash(file_name)}-{user_hash}-{mode}-v{PARSER_VERSION}{SUFFIX}")
+
+    def load(self, file_name, username, ignore_warnings=False) -> Optional[Evening]:
+        path = self._path(file_name, username, ignore_warnings)
+        try:
+            with open(path, 'rb') as f:
+                evening = read_evening(f)
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        if evening is not None:
+            # Mark as recently used
+            os.utime(path)
+        return evening
+
+    def store(self, file_name, username, evening: Evening, ignore_warnings=False):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(file_name, username, ignore_warnings)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_evening(evening, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in `max_bytes`.
+        """
+        evict_lru(self.directory, SUFFIX, self.max_bytes)
+
+    def parse(self, parser, username, file_name, rebuild=False) -> Evening:
+        """
+        The evening of the log file `file_name`, from the cache if possible, otherwise parsed with `parser` and
+        then cached. With `rebuild` the log is always parsed and the cache entry replaced.
+        """
+        if not rebuild:
+            evening = self.load(file_name, username, parser.ignore_warnings)
+            if evening is not None:
+                return evening
+        evening = parser.parse(username, file_name)
+        self.store(file_name, username, evening, parser.ignore_warnings)
+        return evening
+
+
+def parse_with_cache(parser, username, file_name, use_cache=True, rebuild=False) -> Evening:
+    """
+    Parses `file_name` through the default session cache, or directly if `use_cache` is False.
+    """
+    if not use_cache:
+        return parser.parse(username, file_name)
+    return SessionCache().parse(parser, username, file_name, rebuild)
+
+
+def map_logs(worker, file_names, jobs=1) -> Iterator:
+    """
+    The results of `worker` on each of the logs `file_names`, in order. With `jobs` > 1 the logs are handled by a
+    pool of that many processes, so `worker` has to be picklable, e.g. a module level function or a
+    `functools.partial` of one.
+    """
+    if jobs <= 1:
+        yield from map(worker, file_names)
+        return
+    # Only needed for parallel runs, kept out of the start up of log_processor.py
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(worker, file_names)
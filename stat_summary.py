@@ -0,0 +1,314 @@
+"""
+Mergeable summaries of player stats.
+
+A `StatsSummary` holds everything archive_stats.py prints about each player in a form that can be merged: counts and
+sums of amounts, which simply add up, and a `QuantileSketch` of the win amounts in place of the list of all wins that
+exact medians need. Merging is associative and commutative, so a summary can be computed for each log on its own,
+in parallel, saved to disk, and summaries of any set of logs merged later in any order.
+
+`SummaryStore` keeps the summary of every log on disk, keyed by the hash of the log. When a log is added to an
+archive only that log is parsed, and the stats of the whole archive are a merge of small summaries.
+
+    python3 stat_summary.py logs/*.csv --jobs 4
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import tempfile
+from typing import Dict, Iterable, List
+
+from archive_stats import COUNTS, PlayerRow, print_rows, session_totals
+from series_stats import NameMapping
+from log_processor import PARSER_VERSION
+from session_cache import default_cache_dir, evict_lru, file_hash, map_logs, parse_with_cache
+
+# Bump whenever the format of saved summaries or the stats in them change
+SUMMARY_VERSION = 1
+DEFAULT_STORE_BYTES = 64 * 1024 * 1024
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# The win amounts sketched for each player
+SKETCHES = ("wins", "showdown_wins", "preshowdown_wins")
+
+
+class QuantileSketch:
+    """
+    Quantiles of non-negative values with a bounded relative error.
+
+    Values are counted in buckets whose bounds grow geometrically by `gamma` = (1 + a) / (1 - a), for a relative
+    accuracy a. Any quantile is then known to within a factor of (1 ± a) of the true value, the sketch has one bucket
+    per factor of `gamma` between the smallest and the largest value (about 1000 for chip amounts up to 10^9 at 1%),
+    and merging sketches just adds up the counts of their buckets.
+    """
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # Bucket i counts the values in (gamma^(i-1), gamma^i], zeros are counted apart
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values: Iterable[float]):
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        if (values < 0).any():
+            raise ValueError("only non-negative values can be sketched")
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        self.count += len(values)
+        if len(positive) == 0:
+            return
+        indexes = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        lowest = int(indexes.min())
+        for index, count in enumerate(np.bincount(indexes - lowest).tolist()):
+            if count:
+                self.buckets[index + lowest] = self.buckets.get(index + lowest, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        Adds the values of `other` to this sketch.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("sketches of different accuracies can't be merged")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def value_at_rank(self, rank: int) -> float:
+        """
+        The `rank`-th smallest value, counting from 0.
+        """
+        if not 0 <= rank < self.count:
+            raise IndexError(rank)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        return self.value_at_rank(round(q * (self.count - 1))) if self.count else 0.0
+
+    def median(self) -> float:
+        """
+        Like `utilities.median`: the mean of the two middle values for an even count, and 0 without any values.
+        """
+        if self.count == 0:
+            return 0.0
+        return (self.value_at_rank((self.count - 1) // 2) + self.value_at_rank(self.count // 2)) / 2
+
+    def to_json(self) -> dict:
+        return {"relative_accuracy": self.relative_accuracy, "zeros": self.zeros,
+                "buckets": sorted(self.buckets.items())}
+
+    @classmethod
+    def from_json(cls, state: dict) -> "QuantileSketch":
+        sketch = cls(state["relative_accuracy"])
+        sketch.buckets = {index: count for index, count in state["buckets"]}
+        sketch.zeros = state["zeros"]
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
+
+
+class PlayerSummary:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.counts: Dict[str, int] = {name: 0 for name in COUNTS}
+        self.sketches: Dict[str, QuantileSketch] = {name: QuantileSketch(relative_accuracy) for name in SKETCHES}
+
+    def merge(self, other: "PlayerSummary") -> "PlayerSummary":
+        for name in COUNTS:
+            self.counts[name] += other.counts[name]
+        for name in SKETCHES:
+            self.sketches[name].merge(other.sketches[name])
+        return self
+
+    def row(self, player: str) -> PlayerRow:
+        return PlayerRow(player, dict(self.counts), *(self.sketches[name].median() for name in SKETCHES))
+
+    def to_json(self) -> dict:
+        return {"counts": self.counts, "sketches": {name: sketch.to_json() for name, sketch in self.sketches.items()}}
+
+    @classmethod
+    def from_json(cls, state: dict) -> "PlayerSummary":
+        summary = cls()
+        summary.counts.update(state["counts"])
+        summary.sketches = {name: QuantileSketch.from_json(sketch) for name, sketch in state["sketches"].items()}
+        return summary
+
+
+class StatsSummary:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        # Ids (hashes) of the logs summarised, so no log is counted twice
+        self.logs = set()
+        self.players: Dict[str, PlayerSummary] = {}
+
+    @classmethod
+    def of_totals(cls, totals, log_id: str, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> "StatsSummary":
+        """
+        The summary of the `archive_stats.SessionTotals` of the log `log_id`.
+        """
+        summary = cls(relative_accuracy)
+        summary.logs.add(log_id)
+        for player_id, player in enumerate(totals.players):
+            if not player:
+                continue
+            player_summary = summary._player(player)
+            for name in COUNTS:
+                player_summary.counts[name] += int(totals.counts[name][player_id])
+            wins = totals.win_players == player_id
+            player_summary.sketches["wins"].add(totals.win_amounts[wins])
+            player_summary.sketches["showdown_wins"].add(totals.win_amounts[wins & totals.win_showdown])
+            player_summary.sketches["preshowdown_wins"].add(totals.win_amounts[wins & ~totals.win_showdown])
+        return summary
+
+    def _player(self, player: str) -> PlayerSummary:
+        player_summary = self.players.get(player)
+        if player_summary is None:
+            player_summary = self.players[player] = PlayerSummary(self.relative_accuracy)
+        return player_summary
+
+    def merge(self, other: "StatsSummary", name_mapping: NameMapping = None) -> "StatsSummary":
+        """
+        Adds the stats of `other` to this summary, merging players by their name under `name_mapping` if given.
+        """
+        if self.logs & other.logs:
+            raise ValueError(f"{len(self.logs & other.logs)} log(s) would be counted twice")
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("summaries of different accuracies can't be merged")
+        self.logs |= other.logs
+        for player, player_summary in other.players.items():
+            if name_mapping is not None:
+                player = name_mapping.normalise_name(player)
+            self._player(player).merge(player_summary)
+        return self
+
+    def rows(self) -> List[PlayerRow]:
+        """
+        The stats of every player, most hands first. Medians are within the relative accuracy of the summary.
+        """
+        rows = [player_summary.row(player) for player, player_summary in self.players.items()]
+        return sorted(rows, key=lambda row: row.counts["hands"], reverse=True)
+
+    def print(self):
+        print_rows(f"Archive Stats ({len(self.logs)} logs, medians within "
+                   f"{self.relative_accuracy * 100:g}%)", self.rows())
+
+    def to_json(self) -> dict:
+        return {
+            "version": SUMMARY_VERSION,
+            "relative_accuracy": self.relative_accuracy,
+            "logs": sorted(self.logs),
+            "players": {player: player_summary.to_json() for player, player_summary in self.players.items()},
+        }
+
+    @classmethod
+    def from_json(cls, state: dict) -> "StatsSummary":
+        if state.get("version") != SUMMARY_VERSION:
+            raise ValueError(f"summary version {state.get('version')} is not {SUMMARY_VERSION}")
+        summary = cls(state["relative_accuracy"])
+        summary.logs = set(state["logs"])
+        summary.players = {player: PlayerSummary.from_json(player_state)
+                           for player, player_state in state["players"].items()}
+        return summary
+
+    def save(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.to_json(), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "StatsSummary":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_json(json.load(f))
+
+
+class SummaryStore:
+    """
+    The summaries of single logs, keyed by the hash of the log and the versions of the parser and the summaries.
+    Like the session cache, the least recently used summaries are evicted once the store grows beyond `max_bytes`.
+    """
+    def __init__(self, directory: str = None, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 max_bytes: int = DEFAULT_STORE_BYTES):
+        self.directory = directory if directory is not None else os.path.join(default_cache_dir(), "summaries")
+        self.relative_accuracy = relative_accuracy
+        self.max_bytes = max_bytes
+
+    def _path(self, log_hash: str) -> str:
+        return os.path.join(self.directory, f"{log_hash}-{self.relative_accuracy:g}-v{SUMMARY_VERSION}"
+                                            f"-p{PARSER_VERSION}.json")
+
+    def summary(self, file_name, use_cache=True) -> StatsSummary:
+        """
+        The summary of the log `file_name`, from the store if possible, otherwise parsed and then stored.
+        """
+        from log_processor import Parser
+
+        log_hash = file_hash(file_name)
+        path = self._path(log_hash)
+        try:
+            summary = StatsSummary.load(path)
+            # Mark as recently used
+            os.utime(path)
+            return summary
+        except (OSError, ValueError, KeyError):
+            pass
+        evening = parse_with_cache(Parser(ignore_warnings=False), "", file_name, use_cache)
+        summary = StatsSummary.of_totals(session_totals(evening), log_hash, self.relative_accuracy)
+        summary.save(path)
+        evict_lru(self.directory, ".json", self.max_bytes)
+        return summary
+
+
+def summarise_archive(file_names, name_mapping: NameMapping = None, jobs=1, use_cache=True,
+                      store: SummaryStore = None) -> StatsSummary:
+    """
+    The merged summary of all logs `file_names`. Logs without a stored summary are parsed, by a pool of `jobs`
+    processes if `jobs` > 1. The same log given twice is only counted once.
+    """
+    store = store if store is not None else SummaryStore()
+    worker = functools.partial(store.summary, use_cache=use_cache)
+    merged = StatsSummary(store.relative_accuracy)
+    for summary in map_logs(worker, file_names, jobs):
+        if not summary.logs <= merged.logs:
+            merged.merge(summary, name_mapping or NameMapping({}))
+    return merged
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prints the stats of every player over many logs, from "
+                                                     "mergeable summaries of each log.")
+    arg_parser.add_argument("log_files", nargs="+", help="Paths to log files from pokernow.club")
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses logs without a summary, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing logs in parallel.")
+    arg_parser.add_argument("--summary_dir", help="Directory of the summaries of single logs, by default in the cache directory.")
+    arg_parser.add_argument("--accuracy", type=float, default=DEFAULT_RELATIVE_ACCURACY, help="Relative accuracy of medians.")
+    arg_parser.add_argument("--save", help="Also writes the merged summary to this file, e.g. for a dashboard.")
+    args = arg_parser.parse_args()
+
+    import colorama
+    colorama.init()
+
+    store = SummaryStore(args.summary_dir, args.accuracy)
+    summary = summarise_archive(args.log_files, jobs=args.jobs, use_cache=not args.no_cache, store=store)
+    summary.print()
+    if args.save:
+        summary.save(args.save)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Single pass computation of any number of statistics over the rounds of an evening.
+
+Each statistic is a `StatAccumulator` which is notified when a round starts, for every move of the streets it is
+interested in, and when a round ends. `StatsEngine` walks the moves of each round exactly once and dispatches them to
+all registered accumulators, so adding another statistic does not add another pass over the rounds.
+"""
+from typing import Iterable, List, Tuple
+
+PREFLOP = "preflop"
+FLOP = "flop"
+TURN = "turn"
+RIVER = "river"
+STREETS = (PREFLOP, FLOP, TURN, RIVER)
+
+
+class StatAccumulator:
+    """
+    Base class for statistics driven by a `StatsEngine`. Subclasses override the callbacks they need,
+    callbacks which are not overridden are never called.
+    """
+    # Streets whose moves are passed to `on_move`
+    streets: Tuple[str, ...] = STREETS
+
+    def on_round_start(self, round):
+        pass
+
+    def on_move(self, round, street, move):
+        pass
+
+    def on_round_end(self, round):
+        pass
+
+    def add_round(self, round):
+        """
+        Adds a single round to this statistic alone. Use a `StatsEngine` to update several statistics at once.
+        """
+        StatsEngine([self]).add_round(round)
+
+
+def _overrides(accumulator, callback_name) -> bool:
+    return getattr(type(accumulator), callback_name) is not getattr(StatAccumulator, callback_name)
+
+
+class StatsEngine:
+    def __init__(self, accumulators: Iterable[StatAccumulator]):
+        self.accumulators: List[StatAccumulator] = list(accumulators)
+        self._round_start = [a.on_round_start for a in self.accumulators if _overrides(a, "on_round_start")]
+        self._round_end = [a.on_round_end for a in self.accumulators if _overrides(a, "on_round_end")]
+        move_listeners = [a for a in self.accumulators if _overrides(a, "on_move")]
+        self._moves = {street: [a.on_move for a in move_listeners if street in a.streets] for street in STREETS}
+
+    def add_round(self, round):
+        for on_round_start in self._round_start:
+            on_round_start(round)
+
+        for street, moves in zip(STREETS, (round.preflop_moves, round.flop_moves, round.turn_moves, round.river_moves)):
+            listeners = self._moves[street]
+            if not listeners:
+                continue
+            for move in moves:
+                for on_move in listeners:
+                    on_move(round, street, move)
+
+        for on_round_end in self._round_end:
+            on_round_end(round)
+
+    def run(self, rounds):
+        for round in rounds:
+            self.add_round(round)
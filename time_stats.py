@@ -0,0 +1,238 @@
+"""
+Time analytics: how long each player takes to decide, how many hands are played per hour and how long sessions last.
+
+A decision time is the time between a move and the move before it in the same hand, for folds, checks, calls and
+raises (blinds are posted automatically). The first decision of a street therefore includes dealing the board. Each
+evening is reduced with NumPy over the time stamps of its action table, which the parser keeps in epoch milliseconds.
+Decision times, session durations and hands per hour go into `stat_summary.QuantileSketch`es, so the summaries of
+any number of logs merge into a few kilobytes per player.
+
+    python3 time_stats.py logs/*.csv --jobs 4
+"""
+import argparse
+import functools
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from action_table import ACTION_IDS
+from series_stats import NameMapping
+from session_cache import file_hash, map_logs, parse_with_cache
+from stat_summary import DEFAULT_RELATIVE_ACCURACY, QuantileSketch
+from utilities import safe_div
+
+DECISIONS = ("fold", "check", "call", "call (all in)", "raise", "raise (all in)")
+_DECISION_IDS = [ACTION_IDS[name] for name in DECISIONS]
+# Players with fewer decisions don't qualify as the quickest or slowest
+MIN_DECISIONS = 20
+
+
+class SessionTimes(NamedTuple):
+    # Names of the players, indexed by the session's player ids
+    players: List[str]
+    # One entry per decision: the player id and the seconds it took
+    decision_players: np.ndarray
+    decision_seconds: np.ndarray
+    # By player id: the hands they were dealt into and the seconds from the start of their first hand to the end
+    # of their last one
+    hands: np.ndarray
+    seconds_at_table: np.ndarray
+    # Of the whole session
+    total_hands: int
+    duration: float
+
+
+def session_times(evening, name_mapping: NameMapping = None) -> SessionTimes:
+    """
+    The decision times of every player of `evening` and how long they and the session lasted.
+    """
+    table = evening.actions
+    columns = table.columns()
+    names = list(table.player_names)
+    n_players = max(len(names), 1)
+    times = columns["time_stamps"]
+    round_numbers = columns["round_numbers"].astype(np.int64)
+    player_ids = columns["player_ids"]
+
+    gaps = np.diff(times)
+    decided = ((round_numbers[1:] == round_numbers[:-1]) & np.isin(columns["action_ids"][1:], _DECISION_IDS)
+               & (gaps >= 0))
+    decision_players = player_ids[1:][decided].astype(np.int64)
+    decision_seconds = gaps[decided] / 1000
+
+    # The start of each hand and, last, the end of the session: the hand after a player's last one starts when
+    # they're done
+    rounds = evening.rounds
+    ends = [times[-1]] if len(times) else []
+    if rounds:
+        ends += [rounds[-1].started_at] + [time for _, _, _, time in rounds[-1].winners]
+    starts = np.array([round.started_at for round in rounds] + [max(ends, default=0)], dtype=np.int64)
+
+    preflop = columns["streets"] == 0
+    dealt = np.zeros((len(rounds) + 1) * n_players, dtype=bool)
+    dealt[round_numbers[preflop] * n_players + player_ids[preflop]] = True
+    hands = dealt.reshape(-1, n_players).sum(axis=0)
+    first = np.full(n_players, len(rounds) + 1, dtype=np.int64)
+    last = np.zeros(n_players, dtype=np.int64)
+    np.minimum.at(first, player_ids[preflop], round_numbers[preflop])
+    np.maximum.at(last, player_ids[preflop], round_numbers[preflop])
+    played = hands > 0
+    seconds_at_table = np.zeros(n_players)
+    # Round numbers start from 1, so round k starts at starts[k - 1] and is over at starts[k]
+    seconds_at_table[played] = (starts[last[played]] - starts[first[played] - 1]) / 1000
+
+    if name_mapping is not None:
+        names = [name_mapping.normalise_name(name) for name in names]
+    players = names + [""] * (n_players - len(names))
+    duration = (starts[-1] - starts[0]) / 1000 if rounds else 0.0
+    return SessionTimes(players, decision_players, decision_seconds, hands, seconds_at_table, len(rounds),
+                        float(duration))
+
+
+class PlayerTimes:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.decisions = QuantileSketch(relative_accuracy)
+        self.decision_seconds = 0.0
+        self.hands = 0
+        self.seconds_at_table = 0.0
+
+    def merge(self, other: "PlayerTimes") -> "PlayerTimes":
+        self.decisions.merge(other.decisions)
+        self.decision_seconds += other.decision_seconds
+        self.hands += other.hands
+        self.seconds_at_table += other.seconds_at_table
+        return self
+
+    @property
+    def hands_per_hour(self) -> float:
+        return safe_div(self.hands, self.seconds_at_table / 3600)
+
+    @property
+    def mean_decision(self) -> float:
+        return safe_div(self.decision_seconds, self.decisions.count)
+
+
+class TimeSummary:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        # Ids (hashes) of the logs summarised, so no log is counted twice
+        self.logs = set()
+        self.hands = 0
+        self.seconds = 0.0
+        # One value per session
+        self.durations = QuantileSketch(relative_accuracy)
+        self.hands_per_hour = QuantileSketch(relative_accuracy)
+        self.players: Dict[str, PlayerTimes] = {}
+
+    @classmethod
+    def of_times(cls, times: SessionTimes, log_id: str,
+                 relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> "TimeSummary":
+        summary = cls(relative_accuracy)
+        summary.logs.add(log_id)
+        summary.hands = times.total_hands
+        summary.seconds = times.duration
+        summary.durations.add([times.duration / 60])
+        if times.duration > 0:
+            summary.hands_per_hour.add([times.total_hands / times.duration * 3600])
+
+        order = np.argsort(times.decision_players, kind="stable")
+        counts = np.bincount(times.decision_players, minlength=len(times.players))
+        per_player = np.split(times.decision_seconds[order], np.cumsum(counts)[:-1])
+        for player_id, player in enumerate(times.players):
+            if not player or (not times.hands[player_id] and not counts[player_id]):
+                continue
+            player_times = summary._player(player)
+            player_times.decisions.add(per_player[player_id])
+            player_times.decision_seconds += float(per_player[player_id].sum())
+            player_times.hands += int(times.hands[player_id])
+            player_times.seconds_at_table += float(times.seconds_at_table[player_id])
+        return summary
+
+    def _player(self, player: str) -> PlayerTimes:
+        player_times = self.players.get(player)
+        if player_times is None:
+            player_times = self.players[player] = PlayerTimes(self.relative_accuracy)
+        return player_times
+
+    def merge(self, other: "TimeSummary", name_mapping: NameMapping = None) -> "TimeSummary":
+        """
+        Adds the times of `other` to this summary, merging players by their name under `name_mapping` if given.
+        """
+        if self.logs & other.logs:
+            raise ValueError(f"{len(self.logs & other.logs)} log(s) would be counted twice")
+        self.logs |= other.logs
+        self.hands += other.hands
+        self.seconds += other.seconds
+        self.durations.merge(other.durations)
+        self.hands_per_hour.merge(other.hands_per_hour)
+        for player, player_times in other.players.items():
+            if name_mapping is not None:
+                player = name_mapping.normalise_name(player)
+            self._player(player).merge(player_times)
+        return self
+
+    def print(self):
+        from termcolor import colored
+
+        print(colored(f"Time Stats ({len(self.logs)} logs, quantiles within {self.relative_accuracy * 100:g}%)",
+                      "white", attrs=["underline"]))
+        print(f"  {self.hands} hands in {self.seconds / 3600:.1f} hours, "
+              f"{safe_div(self.hands, self.seconds / 3600):.0f} hands per hour")
+        print(f"  Session length (minutes)  median {self.durations.median():6.0f}, "
+              f"10% {self.durations.quantile(0.1):6.0f}, 90% {self.durations.quantile(0.9):6.0f}")
+        print(f"  Hands per hour per session median {self.hands_per_hour.median():6.0f}, "
+              f"10% {self.hands_per_hour.quantile(0.1):6.0f}, 90% {self.hands_per_hour.quantile(0.9):6.0f}")
+        print(f"  {'player':<24} {'hands':>7} {'hours':>6} {'hands/h':>7} {'decisions':>9} "
+              f"{'mean s':>7} {'median s':>8} {'90% s':>7}")
+        for player, times in sorted(self.players.items(), key=lambda item: item[1].hands, reverse=True):
+            print(f"  {player:<24} {times.hands:>7} {times.seconds_at_table / 3600:>6.1f} "
+                  f"{times.hands_per_hour:>7.0f} {times.decisions.count:>9} {times.mean_decision:>7.1f} "
+                  f"{times.decisions.median():>8.1f} {times.decisions.quantile(0.9):>7.1f}")
+        qualified = [(times.decisions.median(), player) for player, times in self.players.items()
+                     if times.decisions.count >= MIN_DECISIONS]
+        if qualified:
+            quickest, slowest = min(qualified), max(qualified)
+            print(f"  Quickest: {quickest[1]} ({quickest[0]:.1f} s per decision), "
+                  f"slowest: {slowest[1]} ({slowest[0]:.1f} s per decision)")
+        print()
+
+
+def times_of_log(file_name, use_cache=True, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> TimeSummary:
+    from log_processor import Parser
+
+    evening = parse_with_cache(Parser(ignore_warnings=False), "", file_name, use_cache)
+    return TimeSummary.of_times(session_times(evening), file_hash(file_name), relative_accuracy)
+
+
+def archive_times(file_names, name_mapping: NameMapping = None, jobs=1, use_cache=True,
+                  relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> TimeSummary:
+    """
+    The merged time summary of all logs `file_names`, parsed by a pool of `jobs` processes if `jobs` > 1. The same
+    log given twice is only counted once.
+    """
+    worker = functools.partial(times_of_log, use_cache=use_cache, relative_accuracy=relative_accuracy)
+    merged = TimeSummary(relative_accuracy)
+    for summary in map_logs(worker, file_names, jobs):
+        if not summary.logs <= merged.logs:
+            merged.merge(summary, name_mapping or NameMapping({}))
+    return merged
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prints decision times, hands per hour and session lengths "
+                                                     "over many logs.")
+    arg_parser.add_argument("log_files", nargs="+", help="Paths to log files from pokernow.club")
+    arg_parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Always parses the logs, without reading or writing the cache of parsed logs.")
+    arg_parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing logs in parallel.")
+    arg_parser.add_argument("--accuracy", type=float, default=DEFAULT_RELATIVE_ACCURACY, help="Relative accuracy of quantiles.")
+    args = arg_parser.parse_args()
+
+    import colorama
+    colorama.init()
+
+    archive_times(args.log_files, jobs=args.jobs, use_cache=not args.no_cache,
+                  relative_accuracy=args.accuracy).print()
+
+
+if __name__ == "__main__":
+    main()
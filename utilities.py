@@ -1,7 +1,10 @@
 import csv
-import statistics
+import functools
+import os
 
 CARD_ORDER = "23456789TJQKA"
+# Starting hand classes from the strongest to the weakest, with the percentile of each
+HAND_ORDER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "hand_order.txt")
 
 
 def avg(vals):
@@ -14,11 +17,18 @@ def safe_div(numer, denom) -> int:
     return numer / denom
 
 
+@functools.lru_cache(maxsize=None)
 def hand_ranks():
-    return {row[1]: float(row[0]) for row in csv.reader(open("resources/hand_order.txt"))}
+    """
+    The percentile of each starting hand class in HAND_ORDER_FILE, strongest first, read once. Must not be modified.
+    """
+    with open(HAND_ORDER_FILE, newline="") as f:
+        return {row[1]: float(row[0]) for row in csv.reader(f)}
 
 
 def median(vals):
+    import statistics
+
     if len(vals) == 0:
         return 0
     return statistics.median(vals)
\ No newline at end of file
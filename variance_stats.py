@@ -1,14 +1,14 @@
 import statistics
 from collections import defaultdict
-from utilities import CARD_ORDER, hand_ranks
+from board_texture import BoardReport, board_rows, textures
+from preflop_classes import class_percentiles, classify_batch, known_hands
 
 
 def hand_variance(evening):
     player = evening.username
-    player_hands = [round.known_hands[player] for round in evening.rounds if player in round.known_hands]
+    player_hands = [round.hole_cards[player] for round in evening.rounds if player in round.hole_cards]
 
     val_counts = defaultdict(int)
-    hands = []
     for c1, c2 in player_hands:
         c1 = c1.replace("10", "T")
         c2 = c2.replace("10", "T")
@@ -17,18 +17,6 @@ def hand_variance(evening):
         val_counts[c2[0]] += 1
         val_counts[c2[-1]] += 1
 
-        if c1[0] != c2[0]:
-            if c1[-1] == c2[-1]:
-                suited = "s"
-            else:
-                suited = "o"
-            if CARD_ORDER.index(c1[0]) > CARD_ORDER.index(c2[0]):
-                hands.append(c1[0] + c2[0] + suited)
-            else:
-                hands.append(c2[0] + c1[0] + suited)
-        else:
-            hands.append(c1[0] + c2[0])
-
     card_count = len(player_hands) * 2
 
     val_counts = {k: v / card_count for k, v in val_counts.items()}
@@ -36,14 +24,14 @@ def hand_variance(evening):
     for k in sorted_keys:
         print(f"{k} : {val_counts[k] * 100:>3.2f}%")
 
-    ranks = [hand_ranks()[hand] for hand in hands]
+    classes = classify_batch(known_hands(evening).get(player, []))
+    ranks = class_percentiles(classes).tolist()
 
     print("Median: ", statistics.median(ranks))
 
 def flop_variance(evening):
-    flops =  [round.flop for round in evening.rounds if round.flop is not None]
-
-    same_suit_flops = [flop for flop in flops if flop[0][1] == flop[1][1] and flop[1][1] == flop[2][1]]
-    print(same_suit_flops)
+    report = BoardReport(board_rows(evening))
+    suits = textures("flop")[0]
+    monotone = report.rows("flop", suits)[suits.categories.index("monotone")]
 
-    print(f"Percentage of flops that were the same suit is {len(same_suit_flops)/len(flops)}")    
\ No newline at end of file
+    print(f"Percentage of flops that were the same suit is {monotone.share} (expected {monotone.expected:.4f})")